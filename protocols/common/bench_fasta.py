@@ -0,0 +1,69 @@
+#!/usr/bin/env python2
+'''
+Compare FASTA parsing and writing throughput of dregs.binf against fasta.py.
+
+Usage: bench_fasta.py <FASTA file> [<FASTA file> ...]
+
+Each file is parsed, then written to /dev/null, using both implementations.
+Timings are the best of three runs.
+'''
+
+import os
+import sys
+import time
+from dregs import binf
+
+import fasta
+
+def best_time(func, repeats=3):
+  times = []
+  for i in range(repeats):
+    start = time.time()
+    func()
+    times.append(time.time() - start)
+  return min(times)
+
+def parse_with_binf(fasta_fname):
+  with open(fasta_fname) as fasta_file:
+    return list(binf.parse_fasta(fasta_file))
+
+def parse_with_fasta(fasta_fname):
+  with open(fasta_fname) as fasta_file:
+    return list(fasta.parse_fasta(fasta_file))
+
+def write_with_binf(records):
+  with open(os.devnull, 'w') as out_file:
+    for header, seq in records:
+      binf.write_fasta_seq(out_file, header, seq)
+
+def write_with_fasta(records):
+  with open(os.devnull, 'w') as out_file:
+    with fasta.FastaWriter(out_file) as writer:
+      for header, seq in records:
+        writer.write(header, seq)
+
+def report(fasta_fname, operation, impl, elapsed, size, record_count):
+  print('%s\t%s\t%s\t%.3f s\t%.1f MB/s\t%.0f records/s' % (
+    os.path.basename(fasta_fname),
+    operation,
+    impl,
+    elapsed,
+    size / elapsed / 1e6,
+    record_count / elapsed,
+  ))
+
+def main():
+  for fasta_fname in sys.argv[1:]:
+    size = os.path.getsize(fasta_fname)
+    records = parse_with_fasta(fasta_fname)
+    assert records == parse_with_binf(fasta_fname), 'Parsers disagree for %s' % fasta_fname
+
+    for impl, parse, write in (
+      ('binf',  parse_with_binf,  write_with_binf),
+      ('fasta', parse_with_fasta, write_with_fasta),
+    ):
+      report(fasta_fname, 'parse', impl, best_time(lambda: parse(fasta_fname)), size, len(records))
+      report(fasta_fname, 'write', impl, best_time(lambda: write(records)), size, len(records))
+
+if __name__ == '__main__':
+  main()
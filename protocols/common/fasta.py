@@ -0,0 +1,251 @@
+'''
+Fast FASTA reading and writing, plus random access to indexed FASTA files.
+
+Records are parsed from large chunks of input rather than line by line: chunks
+are split into records in one operation, and each record's sequence is produced
+by removing newlines from its whole block of text, rather than by concatenating
+its lines one at a time. Likewise, each written record is formatted in full,
+and records are batched so that many are passed to the output file in a single
+call, rather than line by line.
+
+Indexes use the same format as samtools' .fai files, so an index built by
+either tool can be used by the other.
+'''
+
+import mmap
+import os
+
+try:
+  _COMPLEMENT = str.maketrans('ACGTRYKMBVDHNacgtrykmbvdhn', 'TGCAYRMKVBHDNtgcayrmkvbhdn')
+except AttributeError:
+  # Python 2's str lacks maketrans.
+  import string
+  _COMPLEMENT = string.maketrans('ACGTRYKMBVDHNacgtrykmbvdhn', 'TGCAYRMKVBHDNtgcayrmkvbhdn')
+
+def _to_str(raw):
+  # Under Python 2, bytes read from files are already of type str.
+  if isinstance(raw, str):
+    return raw
+  return raw.decode('ascii')
+
+def _split_record(record):
+  header, newline, seq = record.partition('\n')
+  seq = seq.replace('\n', '')
+  # Rarely needed, so checked for separately rather than always performing the
+  # slower removal of all whitespace.
+  if '\r' in seq or ' ' in seq:
+    seq = ''.join(seq.split())
+  return (header.strip(), seq)
+
+def parse_fasta(in_file, chunk_size=4*1024*1024):
+  '''
+  Yield (header, sequence) for each record in open file object `in_file`. The
+  header lacks its leading ">". Any text preceding the first record is
+  ignored.
+  '''
+  # Pieces of the record currently being read, which may span several chunks.
+  # Each lacks the record's leading ">".
+  pending = []
+  in_record = False
+  # Records are delimited by "\n>". Prefixing the input with a newline allows
+  # the first record to be found in the same way, while carrying any trailing
+  # newline over to the next chunk catches delimiters split between chunks.
+  carry = '\n'
+
+  while True:
+    chunk = in_file.read(chunk_size)
+    if not chunk:
+      break
+    chunk = carry + chunk
+    if chunk.endswith('\n'):
+      carry = '\n'
+      chunk = chunk[:-1]
+    else:
+      carry = ''
+
+    parts = chunk.split('\n>')
+    pending.append(parts[0])
+    for part in parts[1:]:
+      if in_record:
+        yield _split_record(''.join(pending))
+      in_record = True
+      pending = [part]
+
+  if in_record:
+    yield _split_record(''.join(pending))
+
+class FastaWriter(object):
+  '''
+  Write FASTA records, wrapping sequences at `line_width` characters. If
+  `line_width` is None, each sequence is written on a single line. Formatted
+  records are held until they total `buffer_size` characters, then written
+  together; call flush(), or use the writer as a context manager, to write
+  any still held.
+  '''
+  def __init__(self, out_file, line_width=80, buffer_size=1024*1024):
+    self._out_file = out_file
+    self._line_width = line_width
+    self._buffer_size = buffer_size
+    self._buffer = []
+    self._buffered = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.flush()
+
+  def write(self, header, seq):
+    if self._line_width:
+      lines = [seq[i:i + self._line_width] for i in range(0, len(seq), self._line_width)]
+    else:
+      lines = [seq]
+    record = '>%s\n%s\n' % (header, '\n'.join(lines))
+    self._buffer.append(record)
+    self._buffered += len(record)
+    if self._buffered >= self._buffer_size:
+      self._write_buffer()
+
+  def _write_buffer(self):
+    if self._buffer:
+      self._out_file.write(''.join(self._buffer))
+      self._buffer = []
+      self._buffered = 0
+
+  def flush(self):
+    self._write_buffer()
+    self._out_file.flush()
+
+def reverse_complement(seq):
+  '''
+  Return reverse complement of nucleotide sequence `seq`, which may include
+  IUPAC ambiguity codes.
+  '''
+  return seq.translate(_COMPLEMENT)[::-1]
+
+def write_fasta_seq(out_file, header, seq, line_width=80):
+  '''
+  Write single record. Use FastaWriter instead when writing many records.
+  '''
+  with FastaWriter(out_file, line_width) as writer:
+    writer.write(header, seq)
+
+class FastaIndexError(Exception):
+  '''
+  Raised when FASTA file cannot be indexed, such as when one of its records
+  has lines of varying length.
+  '''
+  pass
+
+def build_index(fasta_filename):
+  '''
+  Return list of (name, length, offset, line_bases, line_width) tuples, one per
+  record, as stored in .fai files. Offsets are in bytes, and name is the first
+  whitespace-delimited token of the header.
+  '''
+  entries = []
+  current = None
+  # Set once a line shorter than line_bases is seen, after which only the
+  # record's final line may follow.
+  short_line_seen = False
+  offset = 0
+
+  def finish(current):
+    if current is not None:
+      entries.append(tuple(current))
+
+  with open(fasta_filename, 'rb') as fasta_file:
+    for line in fasta_file:
+      line_len = len(line)
+      if line.startswith(b'>'):
+        finish(current)
+        name = _to_str(line[1:].split()[0])
+        current = [name, 0, offset + line_len, None, None]
+        short_line_seen = False
+      elif current is not None:
+        bases = len(line.rstrip(b'\r\n'))
+        if bases > 0:
+          if current[3] is None:
+            current[3], current[4] = bases, line_len
+          elif short_line_seen or bases > current[3] or line_len - bases != current[4] - current[3]:
+            raise FastaIndexError('Record %s has lines of differing length' % current[0])
+          if bases < current[3]:
+            short_line_seen = True
+          current[1] += bases
+      offset += line_len
+
+  finish(current)
+  # Empty records have no lines from which to determine line lengths.
+  return [(n, l, o, lb or 0, lw or 0) for n, l, o, lb, lw in entries]
+
+def write_index(entries, fai_filename):
+  with open(fai_filename, 'w') as fai_file:
+    for entry in entries:
+      fai_file.write('\t'.join([str(f) for f in entry]) + '\n')
+
+def read_index(fai_filename):
+  entries = []
+  with open(fai_filename) as fai_file:
+    for line in fai_file:
+      fields = line.rstrip('\n').split('\t')
+      entries.append((fields[0],) + tuple([int(f) for f in fields[1:5]]))
+  return entries
+
+class FastaIndex(object):
+  '''
+  Random access to sequences in an uncompressed FASTA file. The file is
+  memory-mapped, so fetching a region reads only the bytes spanning it, rather
+  than loading whole sequences into memory. If no index exists at
+  `fai_filename` (by default, the FASTA filename with ".fai" appended), one is
+  built and written there.
+  '''
+  def __init__(self, fasta_filename, fai_filename=None):
+    if fai_filename is None:
+      fai_filename = fasta_filename + '.fai'
+
+    if os.path.exists(fai_filename) and os.path.getmtime(fai_filename) >= os.path.getmtime(fasta_filename):
+      entries = read_index(fai_filename)
+    else:
+      entries = build_index(fasta_filename)
+      write_index(entries, fai_filename)
+    self._entries = dict([(e[0], e) for e in entries])
+    self._names = [e[0] for e in entries]
+
+    self._fasta_file = open(fasta_filename, 'rb')
+    self._mmap = mmap.mmap(self._fasta_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def names(self):
+    return list(self._names)
+
+  def length(self, name):
+    return self._entries[name][1]
+
+  def _byte_offset(self, entry, pos):
+    name, length, offset, line_bases, line_width = entry
+    return offset + (pos // line_bases) * line_width + pos % line_bases
+
+  def fetch(self, name, start=0, end=None):
+    '''
+    Return sequence `name` from `start` to `end`, as 0-based, half-open
+    coordinates. Coordinates beyond the sequence's bounds are clipped.
+    '''
+    entry = self._entries[name]
+    length = entry[1]
+    if end is None or end > length:
+      end = length
+    start = max(0, start)
+    if start >= end:
+      return ''
+
+    raw = self._mmap[self._byte_offset(entry, start):self._byte_offset(entry, end)]
+    return ''.join(_to_str(raw).split())
+
+  def close(self):
+    self._mmap.close()
+    self._fasta_file.close()
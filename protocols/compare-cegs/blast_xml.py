@@ -0,0 +1,225 @@
+'''
+Summarize BLAST XML output (-outfmt 5), writing one tab-delimited row per query
+listing its best hit, how much of the query is covered by the best hit and by
+all hits, and the tiling of the best hit's HSPs along the query.
+
+Usage: blast_xml.py <BLAST XML file> [<BLAST XML file> ...]
+
+The XML is parsed incrementally, with each HSP, hit and query discarded as soon
+as it has been reduced to the few values needed for the summary, so memory use
+does not grow with the size of the file. Throughput and peak memory use are
+reported on stderr.
+
+Columns:
+
+  * query: query definition line
+  * query_len: query length
+  * hits: number of hit sequences
+  * best_hit: definition line of hit with highest-scoring HSP
+  * bit_score, evalue: score and E-value of that HSP
+  * best_hit_cov: fraction of query covered by any of best hit's HSPs
+  * all_hits_cov: fraction of query covered by any HSP of any hit
+  * tiling: best hit's HSPs forming a collinear chain along the query, as
+    comma-separated "query_from-query_to:hit_from-hit_to" pairs in query order,
+    built greedily from the highest-scoring HSP
+  * tiling_cov: fraction of query covered by tiled HSPs
+
+Queries without hits have empty best-hit columns and zero coverage.
+'''
+
+import os
+import resource
+import sys
+import time
+
+try:
+  import xml.etree.cElementTree as ET
+except ImportError:
+  import xml.etree.ElementTree as ET
+
+COLUMNS = (
+  'query',
+  'query_len',
+  'hits',
+  'best_hit',
+  'bit_score',
+  'evalue',
+  'best_hit_cov',
+  'all_hits_cov',
+  'tiling',
+  'tiling_cov',
+)
+
+class Hsp(object):
+  __slots__ = ('bit_score', 'evalue', 'query_from', 'query_to', 'hit_from', 'hit_to')
+
+  def __init__(self, elem):
+    self.bit_score = float(elem.findtext('Hsp_bit-score'))
+    self.evalue = float(elem.findtext('Hsp_evalue'))
+    self.query_from = int(elem.findtext('Hsp_query-from'))
+    self.query_to = int(elem.findtext('Hsp_query-to'))
+    self.hit_from = int(elem.findtext('Hsp_hit-from'))
+    self.hit_to = int(elem.findtext('Hsp_hit-to'))
+
+  def is_forward(self):
+    # Query coordinates always ascend, while hit coordinates descend for hits
+    # on the reverse strand.
+    return self.hit_to >= self.hit_from
+
+  def hit_start(self):
+    return min(self.hit_from, self.hit_to)
+
+def iter_queries(xml_file):
+  '''
+  Yield (query_def, query_len, hits) for each query in BLAST XML read from open
+  file object `xml_file`, where hits is a list of (hit_def, hsps) tuples and
+  hsps a list of Hsp objects.
+  '''
+  # Each completed element is cleared once its values have been extracted,
+  # and each completed query is removed from its parent, so that the tree
+  # built by iterparse never holds more than the current query.
+  iterations = None
+  query_def, query_len = None, None
+  hits, hsps = [], []
+
+  for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+    if event == 'start':
+      if elem.tag == 'BlastOutput_iterations':
+        iterations = elem
+      continue
+
+    tag = elem.tag
+    if tag == 'Hsp':
+      hsps.append(Hsp(elem))
+      elem.clear()
+    elif tag == 'Hit':
+      hits.append((elem.findtext('Hit_def'), hsps))
+      hsps = []
+      elem.clear()
+    elif tag == 'Iteration_query-def':
+      query_def = elem.text
+    elif tag == 'Iteration_query-len':
+      query_len = int(elem.text)
+    elif tag == 'Iteration':
+      yield (query_def, query_len, hits)
+      query_def, query_len = None, None
+      hits = []
+      elem.clear()
+      if iterations is not None:
+        iterations.remove(elem)
+
+def covered_length(intervals):
+  '''
+  Return number of positions covered by any of the closed intervals given as
+  (start, end) tuples.
+  '''
+  covered = 0
+  current_start, current_end = None, None
+  for start, end in sorted(intervals):
+    if current_end is not None and start <= current_end + 1:
+      current_end = max(current_end, end)
+      continue
+    if current_end is not None:
+      covered += current_end - current_start + 1
+    current_start, current_end = start, end
+  if current_end is not None:
+    covered += current_end - current_start + 1
+  return covered
+
+def query_intervals(hsps):
+  return [(h.query_from, h.query_to) for h in hsps]
+
+def tile_hsps(hsps):
+  '''
+  Return HSPs forming a collinear chain, in query order. Starting from the
+  highest-scoring HSP, each other HSP is added in order of descending score if
+  it lies on the same strand, overlaps no HSP already added on the query, and
+  keeps the chain's order along the hit consistent with its order along the
+  query.
+  '''
+  chain = []
+  for hsp in sorted(hsps, key = lambda h: -h.bit_score):
+    if chain and hsp.is_forward() != chain[0].is_forward():
+      continue
+    if any([hsp.query_from <= c.query_to and c.query_from <= hsp.query_to for c in chain]):
+      continue
+
+    candidate = sorted(chain + [hsp], key = lambda h: h.query_from)
+    hit_starts = [h.hit_start() for h in candidate]
+    if not hsp.is_forward():
+      hit_starts.reverse()
+    if hit_starts != sorted(hit_starts):
+      continue
+    chain = candidate
+  return chain
+
+def summarize_query(query_def, query_len, hits):
+  summary = {
+    'query':        query_def,
+    'query_len':    query_len,
+    'hits':         len(hits),
+    'best_hit':     '',
+    'bit_score':    '',
+    'evalue':       '',
+    'best_hit_cov': 0.0,
+    'all_hits_cov': 0.0,
+    'tiling':       '',
+    'tiling_cov':   0.0,
+  }
+  hits = [(hit_def, hsps) for hit_def, hsps in hits if hsps]
+  if not hits:
+    return summary
+
+  best_def, best_hsps = max(hits, key = lambda h: max([hsp.bit_score for hsp in h[1]]))
+  best_hsp = max(best_hsps, key = lambda h: h.bit_score)
+  all_hsps = [hsp for hit_def, hsps in hits for hsp in hsps]
+  tiling = tile_hsps(best_hsps)
+
+  summary.update({
+    'best_hit':     best_def,
+    'bit_score':    best_hsp.bit_score,
+    'evalue':       best_hsp.evalue,
+    'best_hit_cov': covered_length(query_intervals(best_hsps)) / float(query_len),
+    'all_hits_cov': covered_length(query_intervals(all_hsps)) / float(query_len),
+    'tiling':       ','.join(['%s-%s:%s-%s' % (h.query_from, h.query_to, h.hit_from, h.hit_to) for h in tiling]),
+    'tiling_cov':   covered_length(query_intervals(tiling)) / float(query_len),
+  })
+  return summary
+
+def format_row(summary):
+  vals = []
+  for col in COLUMNS:
+    val = summary[col]
+    if isinstance(val, float) and col.endswith('_cov'):
+      val = '%.3f' % val
+    vals.append(str(val))
+  return '\t'.join(vals)
+
+def peak_memory_mb():
+  # ru_maxrss is in kilobytes on Linux.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def main():
+  sys.stdout.write('\t'.join(('file',) + COLUMNS) + '\n')
+  for xml_fname in sys.argv[1:]:
+    start_time = time.time()
+    query_count = 0
+    with open(xml_fname, 'rb') as xml_file:
+      for query_def, query_len, hits in iter_queries(xml_file):
+        sys.stdout.write('%s\t%s\n' % (os.path.basename(xml_fname), format_row(summarize_query(query_def, query_len, hits))))
+        query_count += 1
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    size_mb = os.path.getsize(xml_fname) / 1e6
+    sys.stderr.write('%s: %s queries, %.1f MB in %.2f s (%.1f MB/s, %.0f queries/s); peak memory %.1f MB\n' % (
+      xml_fname,
+      query_count,
+      size_mb,
+      elapsed,
+      size_mb / elapsed,
+      query_count / elapsed,
+      peak_memory_mb(),
+    ))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,97 @@
+'''
+Set algebra over CEGs. Each CEG in a universe is assigned an index, and each
+set of CEGs is held as a bitmask over those indices in a Python integer, so
+that an operation on a set handles all of its members at once.
+
+The regions of a Venn diagram of any number of sets are found by splitting the
+universe on each set in turn, keeping only non-empty regions. At most one
+region exists per CEG, so the work done grows with the number of sets, rather
+than with the 2^k regions of the full diagram.
+'''
+
+class CegUniverse(object):
+  '''
+  Indexed universe of CEG names, in order of first addition.
+  '''
+  def __init__(self, names=()):
+    self._names = []
+    self._indices = {}
+    for name in names:
+      self.add(name)
+
+  def add(self, name):
+    if name not in self._indices:
+      self._indices[name] = len(self._names)
+      self._names.append(name)
+    return self._indices[name]
+
+  def __len__(self):
+    return len(self._names)
+
+  def mask(self, names):
+    '''
+    Return bitmask of `names`, adding any not already in the universe.
+    '''
+    mask = 0
+    for name in names:
+      mask |= 1 << self.add(name)
+    return mask
+
+  def full_mask(self):
+    return (1 << len(self._names)) - 1
+
+  def members(self, mask):
+    '''
+    Return names in `mask`, in universe order.
+    '''
+    names = []
+    while mask:
+      lowest = mask & -mask
+      names.append(self._names[lowest.bit_length() - 1])
+      mask ^= lowest
+    return names
+
+def read_universe(all_cegs_fname):
+  with open(all_cegs_fname) as all_cegs_file:
+    return CegUniverse([l.strip() for l in all_cegs_file if l.strip()])
+
+def count(mask):
+  return bin(mask).count('1')
+
+def split_regions(masks, within=None):
+  '''
+  Return dictionary mapping each non-empty region of the Venn diagram of
+  `masks` to the bitmask of its members. Regions are keyed by tuples holding
+  one boolean per mask, indicating whether the region lies inside it. Only
+  members of `within` are considered, which by default is the union of all
+  masks.
+  '''
+  if within is None:
+    within = 0
+    for mask in masks:
+      within |= mask
+
+  regions = {(): within}
+  for mask in masks:
+    split = {}
+    for key, region in regions.items():
+      inside, outside = region & mask, region & ~mask
+      if inside:
+        split[key + (True,)] = inside
+      if outside:
+        split[key + (False,)] = outside
+    regions = split
+  return regions
+
+def select(regions, predicate):
+  '''
+  Return bitmask of union of regions whose keys satisfy `predicate`.
+  '''
+  selected = 0
+  for key, region in regions.items():
+    if predicate(key):
+      selected |= region
+  return selected
+
+def count_regions(regions):
+  return dict([(key, count(region)) for key, region in regions.items()])
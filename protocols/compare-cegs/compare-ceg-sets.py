@@ -1,51 +1,102 @@
+import itertools
 import json
 import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import ceg_sets
+
+HIT_TYPES = ('complete', 'partial')
+
 def write_set(happy_set, fname):
   with open(fname, 'w') as fout:
     fout.write('\n'.join(happy_set) + '\n')
 
-def write_subtraction(hits, name_a, name_b):
-  missing = hits[name_a]['complete'].union(hits[name_a]['partial']) - hits[name_b]['complete'].union(hits[name_b]['partial'])
-  write_set(missing, '%s_minus_%s.set' % (name_a, name_b))
+def load_hits(hits_fname):
+  with open(hits_fname) as hits_file:
+    return json.load(hits_file)
+
+class Comparison(object):
+  '''
+  Regions of the Venn diagram of every genome's complete and partial hits,
+  plus the list of all CEGs, from which every set written for a pair of
+  genomes is selected.
+  '''
+  def __init__(self, hits, genomes, all_cegs_fname):
+    self.universe = ceg_sets.read_universe(all_cegs_fname)
+    listed = self.universe.full_mask()
+
+    self._labels = [(genome, hit_type) for genome in genomes for hit_type in HIT_TYPES]
+    masks = [self.universe.mask(hits[genome][hit_type]) for genome, hit_type in self._labels]
+    # Hits for CEGs absent from the list extend the universe, but are excluded
+    # from the sets of CEGs missing from genomes.
+    self._labels.append('listed')
+    masks.append(listed)
+    self._regions = ceg_sets.split_regions(masks, self.universe.full_mask())
 
-def write_complete_vs_partial(hits, name_a, name_b):
-  intersection = hits[name_a]['complete'].intersection(hits[name_b]['partial'])
-  write_set(intersection, '%s_complete_intersection_%s_partial.set' % (name_a, name_b))
+  def select(self, predicate):
+    '''
+    Return CEGs in regions for which `predicate`, passed each Region, is true.
+    '''
+    selected = ceg_sets.select(self._regions, lambda key: predicate(Region(dict(zip(self._labels, key)))))
+    return self.universe.members(selected)
 
-def write_cegs_missing_from_both(hits, name_a, name_b, all_cegs_fname, include_partial):
-  all_cegs = open(all_cegs_fname).readlines()
-  all_cegs = set([l.strip() for l in all_cegs])
+class Region(object):
+  def __init__(self, inside):
+    self._inside = inside
+    self.listed = inside['listed']
 
-  a_hits = hits[name_a]['complete']
-  b_hits = hits[name_b]['complete']
-  if include_partial:
-    a_hits = a_hits.union(hits[name_a]['partial'])
-    b_hits = b_hits.union(hits[name_b]['partial'])
+  def has(self, genome, hit_type=None):
+    '''
+    Return whether region lies inside genome's hits of `hit_type`, or of either
+    type if `hit_type` is None.
+    '''
+    if hit_type is None:
+      return any([self._inside[(genome, t)] for t in HIT_TYPES])
+    return self._inside[(genome, hit_type)]
 
-  missing_from_a = all_cegs - a_hits
-  missing_from_b = all_cegs - b_hits
-  missing_from_both = missing_from_a.intersection(missing_from_b)
+def write_pair(comparison, name_a, name_b, out_dir='.'):
+  for a, b in ((name_a, name_b), (name_b, name_a)):
+    write_set(
+      comparison.select(lambda r: r.has(a) and not r.has(b)),
+      os.path.join(out_dir, '%s_minus_%s.set' % (a, b)),
+    )
+    write_set(
+      comparison.select(lambda r: r.has(a, 'complete') and r.has(b, 'partial')),
+      os.path.join(out_dir, '%s_complete_intersection_%s_partial.set' % (a, b)),
+    )
 
-  hit_type = include_partial and 'comp+part' or 'complete'
-  write_set(missing_from_a, 'missing_%s_from_%s.set' % (hit_type, name_a))
-  write_set(missing_from_b, 'missing_%s_from_%s.set' % (hit_type, name_b))
-  write_set(missing_from_both, 'missing_%s_from_%s_and_%s.set' % (hit_type, name_a, name_b))
+  for include_partial in (False, True):
+    hit_type = include_partial and 'comp+part' or 'complete'
+    def missing(region, genome):
+      return region.listed and not region.has(genome, None if include_partial else 'complete')
+
+    write_set(
+      comparison.select(lambda r: missing(r, name_a)),
+      os.path.join(out_dir, 'missing_%s_from_%s.set' % (hit_type, name_a)),
+    )
+    write_set(
+      comparison.select(lambda r: missing(r, name_b)),
+      os.path.join(out_dir, 'missing_%s_from_%s.set' % (hit_type, name_b)),
+    )
+    write_set(
+      comparison.select(lambda r: missing(r, name_a) and missing(r, name_b)),
+      os.path.join(out_dir, 'missing_%s_from_%s_and_%s.set' % (hit_type, name_a, name_b)),
+    )
+
+def write_comparisons(hits, genomes, all_cegs_fname, out_dir='.'):
+  '''
+  Write sets comparing each pair of `genomes`, all selected from a single
+  split of the CEG universe into regions.
+  '''
+  comparison = Comparison(hits, genomes, all_cegs_fname)
+  for name_a, name_b in itertools.combinations(genomes, 2):
+    write_pair(comparison, name_a, name_b, out_dir)
 
 def main():
-  with open(sys.argv[1]) as hits_file:
-    hits = json.load(hits_file)
-  for i in hits.keys():
-    for j in hits[i].keys():
-      hits[i][j] = set(hits[i][j])
-
-  source_sets = ('PRJEB506', 'PRJNA205202')
-  write_subtraction(hits, *source_sets)
-  write_subtraction(hits, *reversed(source_sets))
-  write_complete_vs_partial(hits, *source_sets)
-  write_complete_vs_partial(hits, *reversed(source_sets))
-  write_cegs_missing_from_both(hits, source_sets[0], source_sets[1], sys.argv[2], False)
-  write_cegs_missing_from_both(hits, source_sets[0], source_sets[1], sys.argv[2], True)
-
-main()
+  hits = load_hits(sys.argv[1])
+  genomes = ('PRJEB506', 'PRJNA205202')
+  write_comparisons(hits, genomes, sys.argv[2])
+
+if __name__ == '__main__':
+  main()
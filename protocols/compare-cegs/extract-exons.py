@@ -1,28 +1,115 @@
+# Sequences are fetched from the genome via an index of its FASTA file, so that
+# only the bytes spanning each exon are read, rather than the whole genome.
+# CEGMA writes each KOG's exons on consecutive lines, so each KOG is written as
+# soon as its run of lines ends, and only one KOG's exons are held at a time.
+# Exons of a KOG appearing after its run has ended are held until the end of
+# the file and written then.
 from __future__ import print_function
-import HTSeq
-from collections import defaultdict
+import collections
+import os
 import sys
-from dregs import binf
 
-def extract_exons(fasta_fname, gff_fname):
-  sequences = HTSeq.FastaReader(fasta_fname)
-  # end_included=True as (exon.end - exon.start) % 3 = 2.
-  gff = HTSeq.GFF_Reader(gff_fname, end_included=True)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import fasta
 
-  features = defaultdict(lambda: defaultdict(list))
-  for feat in gff:
-    features[feat.name][feat.type].append(feat)
+def parse_exons(gff_lines):
+  '''
+  Yield (kog, seqid, start, end, strand) for each exon in the GFF lines, with
+  coordinates converted to 0-based, half-open form.
+  '''
+  for line in gff_lines:
+    line = line.strip()
+    if line == '' or line.startswith('#'):
+      continue
+    fields = line.split('\t')
+    if fields[2] != 'Exon':
+      continue
+    # KOG is the value of the first attribute, as written by
+    # fix-cegma-gff-attr-column.py.
+    kog = fields[8].split(';')[0].split('=', 1)[-1]
+    # GFF coordinates include the end position, as
+    # (exon.end - exon.start) % 3 = 2.
+    yield (kog, fields[0], int(fields[3]) - 1, int(fields[4]), fields[6])
 
-  for kog, feats in features.items():
-    exons = feats['Exon']
-    exons = sorted(exons, key=lambda e: e.iv.start)
-    seq = ''.join([str(sequences[exon.iv]) for exon in exons])
-    binf.write_fasta_seq(sys.stdout, kog, seq)
+def split_parts(kog, exons, written):
+  '''
+  Yield (header, exons) for each sequence and strand bearing `exons` of
+  `kog`. The header is the KOG, unless the exons are split or the KOG has
+  already been written, when it is "<kog>|<seqid>|<strand>", so that no two
+  records share a header. Headers are added to set `written`.
+  '''
+  parts = collections.OrderedDict()
+  for exon in exons:
+    parts.setdefault((exon[1], exon[4]), []).append(exon)
+  if len(parts) > 1:
+    print('Exons for %s lie on %s sequences or strands; writing each separately' % (kog, len(parts)), file=sys.stderr)
+  for (seqid, strand), part in parts.items():
+    header = kog
+    if len(parts) > 1 or header in written:
+      header = '%s|%s|%s' % (kog, seqid, strand)
+    base, copy = header, 1
+    while header in written:
+      copy += 1
+      header = '%s|%s' % (base, copy)
+    written.add(header)
+    yield (header, part)
+
+def iter_kogs(exons):
+  '''
+  Yield (header, exons) for each KOG as soon as its run of consecutive exons
+  ends. Exons of a KOG whose run has already ended are held and yielded after
+  all others. Exons on more than one sequence or strand are yielded separately,
+  as split_parts() does.
+  '''
+  written = set()
+  seen = set()
+  later = collections.OrderedDict()
+  kog, kog_exons = None, []
+  for exon in exons:
+    if exon[0] == kog:
+      kog_exons.append(exon)
+      continue
+    if kog is not None:
+      for part in split_parts(kog, kog_exons, written):
+        yield part
+    kog, kog_exons = None, []
+    if exon[0] in seen:
+      later.setdefault(exon[0], []).append(exon)
+    else:
+      seen.add(exon[0])
+      kog, kog_exons = exon[0], [exon]
+  if kog is not None:
+    for part in split_parts(kog, kog_exons, written):
+      yield part
+
+  for kog, kog_exons in later.items():
+    print('Exons for %s are not on consecutive lines; writing those after its first run separately' % kog, file=sys.stderr)
+    for part in split_parts(kog, kog_exons, written):
+      yield part
+
+def splice(genome, exons):
+  '''
+  Return concatenated sequence of exons, which must lie on a single strand, in
+  transcript order. Exons on the reverse strand are reverse-complemented.
+  '''
+  exons = sorted(exons, key=lambda e: (e[1], e[2]))
+  seq = ''.join([genome.fetch(seqid, start, end) for kog, seqid, start, end, strand in exons])
+  if exons[0][4] == '-':
+    seq = fasta.reverse_complement(seq)
+  return seq
+
+def extract_exons(fasta_fname, gff_lines, out_file):
+  with fasta.FastaIndex(fasta_fname) as genome:
+    with fasta.FastaWriter(out_file) as writer:
+      for header, exons in iter_kogs(parse_exons(gff_lines)):
+        writer.write(header, splice(genome, exons))
 
 def main():
   if len(sys.argv[1:]) != 2:
     print('Usage: %s [FASTA file] [GFF file]' % sys.argv[0], file=sys.stderr)
     sys.exit(1)
-  extract_exons(sys.argv[1], sys.argv[2])
+  with open(sys.argv[2]) as gff_file:
+    extract_exons(sys.argv[1], gff_file, sys.stdout)
 
-main()
+if __name__ == '__main__':
+  main()
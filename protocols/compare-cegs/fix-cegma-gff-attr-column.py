@@ -2,10 +2,14 @@
 # key=value format. This script fixes that by prefixing the column with "kog=".
 import sys
 
+def fix_line(line):
+  fields = line.strip().split()
+  fields[-1] = 'kog=' + fields[-1]
+  return '\t'.join(fields)
+
 def main():
   for line in sys.stdin:
-    fields = line.strip().split()
-    fields[-1] = 'kog=' + fields[-1]
-    print('\t'.join(fields))
+    print(fix_line(line))
 
-main()
+if __name__ == '__main__':
+  main()
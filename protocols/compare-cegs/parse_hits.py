@@ -1,60 +1,140 @@
+'''
+Determine complete and partial CEGMA hits for each genome, writing the KOG
+names in each class as JSON.
+
+Usage: parse_hits.py [-p <processes>] <genome>=<hits file> [<genome>=<hits file> ...]
+
+Each hits file is the output of CEGMA's completeness script, as patched by
+cegma_2.4-show_completeness_of_each_highly_conserved_ceg.patch. Files are
+parsed concurrently. A genome may be given more than once, in which case the
+hits from all of its files are merged. KOGs with a complete hit are excluded
+from the genome's partial hits.
+'''
+
+import argparse
 import json
+import multiprocessing
 import sys
-from collections import defaultdict
-from pprint import pprint
+import time
 
-def parse_hits(hits_filename):
-  hits = defaultdict(lambda: defaultdict(list))
+# Fields written by the patched completeness script for each hit, with the type
+# of each.
+SCHEMA = (
+  ('type',         str),
+  ('kog',          str),
+  ('align_length', int),
+  ('prot_length',  int),
+  ('match',        float),
+)
+FIELD_TYPES = dict(SCHEMA)
+
+def parse_hits(hits_filename, fields=None):
+  '''
+  Return (hits, line_count), where hits maps each hit type to a dictionary
+  mapping each KOG to a list of its hits. Each hit is a dictionary holding the
+  fields named in `fields`, or all fields other than type and KOG if `fields`
+  is None. Fields not requested are not converted.
+  '''
+  if fields is None:
+    fields = [f for f, t in SCHEMA if f not in ('type', 'kog')]
+  projected = set(fields)
+  for field in projected:
+    if field not in FIELD_TYPES:
+      raise Exception('Unknown field %s' % field)
+
+  hits = {}
+  line_count = 0
 
   with open(hits_filename) as hits_file:
     for line in hits_file:
-      tokens = line.strip().split()
-      fields = dict([t.split('=', 1) for t in tokens])
-
-      hit_type = fields['type'].lower()
-      kog      = fields['kog']
-      del fields['type'], fields['kog']
+      line_count += 1
+      tokens = line.split()
+      if not tokens:
+        continue
 
-      for k, v in fields.items():
-        try:
-          fields[k] = int(v)
-        except ValueError:
-          try:
-            fields[k] = float(v)
-          except ValueError:
-            pass
+      hit_type, kog = None, None
+      hit = {}
+      for token in tokens:
+        key, _, value = token.partition('=')
+        if key == 'type':
+          hit_type = value.lower()
+        elif key == 'kog':
+          kog = value
+        elif key in projected:
+          hit[key] = FIELD_TYPES[key](value)
+        elif key not in FIELD_TYPES:
+          raise Exception('Unknown field %s on line %s of %s' % (key, line_count, hits_filename))
 
-      hits[hit_type][kog].append(fields)
+      kog_hits = hits.setdefault(hit_type, {}).setdefault(kog, [])
+      if projected:
+        kog_hits.append(hit)
 
-  return hits
+  return (hits, line_count)
 
 def extract_kog_names(hits):
   names = {}
   for hit_type in hits.keys():
     names[hit_type] = set(hits[hit_type].keys())
-    # Convert to list to permit JSON serialization
-    names[hit_type] = list(names[hit_type])
   return names
 
-def remove_full_hits_from_partials(hits):
-  hit_types = set(hits.keys())
+def remove_full_hits_from_partials(names):
+  hit_types = set(names.keys())
   if set(('complete', 'partial')) != hit_types:
     raise Exception('Unexpected hit types: %s' % hit_types)
+  names['partial'] -= names['complete']
 
-  for kog in hits['complete'].keys():
-    if kog in hits['partial'].keys():
-      del hits['partial'][kog]
+def parse_kog_names(hit_source):
+  '''
+  Return (genome, KOG names for each hit type, line count) for hits file given
+  as "<genome>=<hits file>". Only KOG names are retained, so that workers
+  return little data for merging.
+  '''
+  hit_name, hit_filename = hit_source.split('=', 1)
+  hits, line_count = parse_hits(hit_filename, fields=())
+  return (hit_name, extract_kog_names(hits), line_count)
+
+def parse_all(hit_sources, processes):
+  '''
+  Parse hit files concurrently, then merge their KOG names by genome.
+  '''
+  start_time = time.time()
+  pool = multiprocessing.Pool(processes)
+  results = pool.map(parse_kog_names, hit_sources, chunksize=1)
+  pool.close()
+  pool.join()
+
+  all_names = {}
+  total_lines = 0
+  for hit_name, names, line_count in results:
+    total_lines += line_count
+    genome_names = all_names.setdefault(hit_name, {})
+    for hit_type, kogs in names.items():
+      genome_names.setdefault(hit_type, set()).update(kogs)
 
-def main():
   all_hits = {}
+  for hit_name, names in all_names.items():
+    remove_full_hits_from_partials(names)
+    # Convert to sorted lists to permit JSON serialization.
+    all_hits[hit_name] = dict([(hit_type, sorted(kogs)) for hit_type, kogs in names.items()])
 
-  for hit_source in sys.argv[1:]:
-    hit_name, hit_filename = hit_source.split('=', 1)
+  elapsed = max(time.time() - start_time, 1e-6)
+  sys.stderr.write('Parsed %s lines from %s files in %.2f s (%.0f lines/s)\n' % (
+    total_lines,
+    len(hit_sources),
+    elapsed,
+    total_lines / elapsed,
+  ))
+  return all_hits
+
+def main():
+  parser = argparse.ArgumentParser(description='Determine complete and partial CEGMA hits for each genome.')
+  parser.add_argument('hit_sources', nargs='+', metavar='genome=hits_file',
+    help='Genome name and CEGMA completeness output for it')
+  parser.add_argument('-p', '--processes', dest='processes', type=int, default=multiprocessing.cpu_count(),
+    help='Number of files to parse concurrently')
+  args = parser.parse_args()
 
-    hits_for_file = parse_hits(hit_filename)
-    remove_full_hits_from_partials(hits_for_file)
-    hit_names = extract_kog_names(hits_for_file)
-    all_hits[hit_name] = hit_names
-  print(json.dumps(all_hits))
+  print(json.dumps(parse_all(args.hit_sources, args.processes), sort_keys=True))
 
-main()
+if __name__ == '__main__':
+  main()
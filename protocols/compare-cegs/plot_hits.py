@@ -1,8 +1,9 @@
 import json
 import sys
 from pprint import pprint
-from collections import Counter
-from functools import reduce
+from itertools import product
+
+import ceg_sets
 
 def parse_hits(hits_filename):
   with open('hits.json') as hits_file:
@@ -11,20 +12,18 @@ def parse_hits(hits_filename):
   return hits
 
 def calc_counts(sets):
-  if len(sets) != 4:
-    raise Exception('Need four sets')
-  sets = [set(s) for s in sets]
-  union = reduce(lambda x, y: x.union(y), sets)
+  '''
+  Return count of members in each region of the Venn diagram of `sets`, keyed
+  by strings such as "0110" indicating whether the region lies in each set.
+  Every region is included, even if empty.
+  '''
+  universe = ceg_sets.CegUniverse()
+  regions = ceg_sets.split_regions([universe.mask(s) for s in sets])
+  counts = ceg_sets.count_regions(regions)
 
-  indicators = [4*'%d' % (a in sets[0], a in sets[1], a in sets[2], a in sets[3]) for a in union]
-  counts = Counter(indicators)
   all_counts = {}
-  for a in (0, 1):
-    for b in (0, 1):
-      for c in (0, 1):
-        for d in (0, 1):
-          key = 4*'%s' % (a, b, c, d)
-          all_counts[key] = counts[key]
+  for key in product((False, True), repeat=len(sets)):
+    all_counts[''.join(['%d' % inside for inside in key])] = counts.get(key, 0)
   return all_counts
 
 def plot(labels, counts):
@@ -0,0 +1,275 @@
+'''
+Run every step of "Compare CEG sequences across genomes" from the README for
+all genomes at once, in place of the README's shell loops.
+
+Usage: run_pipeline.py [options] <hits JSON> <all CEGs list> <run dir> \
+         <genome>=<genome FASTA> <genome>=<genome FASTA> [...]
+
+<hits JSON> is the output of parse_hits.py, and <run dir> the directory holding
+each genome's CEGMA output in <run dir>/<genome>/pants.cegma.gff. Stages are
+run in turn, with the tasks making up each stage (one per genome or per pair of
+genomes) run concurrently in a process pool:
+
+  * blastdb: make BLAST database for each genome in <run dir>/blastdbs
+  * exons: write each genome's CEG exons to <run dir>/<genome>/pants.ceg_exons.fa,
+    passing CEGMA's GFF through fix-cegma-gff-attr-column.py and into
+    extract-exons.py in memory, rather than through an intermediate file
+  * sets: write sets of CEGs differing between each pair of genomes to
+    <run dir>/ceg-comparisons, as compare-ceg-sets.py does
+  * seqs: extract exons of the CEGs in each set of CEGs missing from or
+    incomplete in a genome
+  * blast: search each set's exons against the opposing genome
+  * summary: summarize all BLAST results with blast_xml.py
+
+A task is skipped if its outputs are newer than all of its inputs, including
+the scripts it runs, so an interrupted run resumes where it stopped. Timings
+for each stage are written to stderr.
+'''
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+PROTDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PROTDIR, '..', 'common'))
+import fasta
+
+def load_script(module_name, script_name):
+  '''
+  Import script whose filename is not a valid module name.
+  '''
+  path = os.path.join(PROTDIR, script_name)
+  try:
+    import importlib.util
+  except ImportError:
+    import imp
+    return imp.load_source(module_name, path)
+  spec = importlib.util.spec_from_file_location(module_name, path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+fix_gff = load_script('fix_gff', 'fix-cegma-gff-attr-column.py')
+extract_exons = load_script('extract_exons', 'extract-exons.py')
+compare_ceg_sets = load_script('compare_ceg_sets', 'compare-ceg-sets.py')
+import blast_xml
+
+def script_path(script_name):
+  return os.path.join(PROTDIR, script_name)
+
+class Task(object):
+  '''
+  Call of `func` with `args`, producing files `outputs` from files `inputs`.
+  '''
+  def __init__(self, name, func, args, inputs, outputs):
+    self.name = name
+    self.func = func
+    self.args = args
+    self.inputs = inputs
+    self.outputs = outputs
+
+  def is_current(self):
+    if not all([os.path.exists(f) for f in self.outputs]):
+      return False
+    newest_input = max([os.path.getmtime(f) for f in self.inputs])
+    oldest_output = min([os.path.getmtime(f) for f in self.outputs])
+    return oldest_output >= newest_input
+
+def run_task(task):
+  start_time = time.time()
+  task.func(*task.args)
+  return time.time() - start_time
+
+def run_stage(pool, name, tasks, force):
+  start_time = time.time()
+  pending = [t for t in tasks if force or not t.is_current()]
+  durations = pool.map(run_task, pending, chunksize=1)
+  sys.stderr.write('%-8s %s tasks run, %s up to date, %.2f s wall, %.2f s in tasks\n' % (
+    name,
+    len(pending),
+    len(tasks) - len(pending),
+    time.time() - start_time,
+    sum(durations),
+  ))
+  for task, duration in zip(pending, durations):
+    sys.stderr.write('           %s: %.2f s\n' % (task.name, duration))
+
+def replace_atomically(tmp_fname, fname):
+  # Outputs are written under temporary names and renamed only once complete,
+  # so that a task interrupted part way never leaves outputs that appear up to
+  # date.
+  os.rename(tmp_fname, fname)
+
+def make_blastdb(genome_fname, db_name, stamp_fname):
+  subprocess.check_call(['makeblastdb', '-in', genome_fname, '-dbtype', 'nucl', '-title', os.path.basename(db_name), '-out', db_name])
+  open(stamp_fname, 'w').close()
+
+def write_exons(genome_fname, gff_fname, exons_fname):
+  with open(gff_fname) as gff_file:
+    with open(exons_fname + '.tmp', 'w') as exons_file:
+      fixed_lines = (fix_gff.fix_line(line) for line in gff_file)
+      extract_exons.extract_exons(genome_fname, fixed_lines, exons_file)
+  replace_atomically(exons_fname + '.tmp', exons_fname)
+
+def write_sets(hits_fname, all_cegs_fname, genomes, out_dir):
+  hits = compare_ceg_sets.load_hits(hits_fname)
+  compare_ceg_sets.write_comparisons(hits, genomes, all_cegs_fname, out_dir)
+
+def write_seqs(exons_fname, set_fname, seqs_fname):
+  with open(set_fname) as set_file:
+    cegs = set([l.strip() for l in set_file])
+  with open(exons_fname) as exons_file:
+    with open(seqs_fname + '.tmp', 'w') as seqs_file:
+      with fasta.FastaWriter(seqs_file) as writer:
+        for header, seq in fasta.parse_fasta(exons_file):
+          # Parts of a KOG split across sequences are named "<kog>|...".
+          if header.split()[0].split('|')[0] in cegs:
+            writer.write(header, seq)
+  replace_atomically(seqs_fname + '.tmp', seqs_fname)
+
+def run_blast(query_fname, db_name, xml_fname, threads):
+  subprocess.check_call([
+    'blastn',
+    '-query', query_fname,
+    '-db', db_name,
+    '-evalue', '0.001',
+    '-outfmt', '5',
+    '-out', xml_fname + '.tmp',
+    '-num_threads', str(threads),
+  ])
+  replace_atomically(xml_fname + '.tmp', xml_fname)
+
+def write_blast_summary(xml_fnames, summary_fname):
+  with open(summary_fname + '.tmp', 'w') as summary_file:
+    summary_file.write('\t'.join(('file',) + blast_xml.COLUMNS) + '\n')
+    for xml_fname in xml_fnames:
+      with open(xml_fname, 'rb') as xml_file:
+        for query_def, query_len, hits in blast_xml.iter_queries(xml_file):
+          summary = blast_xml.summarize_query(query_def, query_len, hits)
+          summary_file.write('%s\t%s\n' % (os.path.basename(xml_fname), blast_xml.format_row(summary)))
+  replace_atomically(summary_fname + '.tmp', summary_fname)
+
+def has_records(fasta_fname):
+  with open(fasta_fname) as fasta_file:
+    for line in fasta_file:
+      if line.startswith('>'):
+        return True
+  return False
+
+def run_pipeline(args):
+  genomes = [g for g, f in args.genomes]
+  genome_fnames = dict(args.genomes)
+  genome_pairs = list(itertools.combinations(genomes, 2))
+  # Both orderings of each pair, as each genome's sets are searched against the
+  # other.
+  directed_pairs = genome_pairs + [(b, a) for a, b in genome_pairs]
+
+  db_dir = os.path.join(args.run_dir, 'blastdbs')
+  comparisons_dir = os.path.join(args.run_dir, 'ceg-comparisons')
+  for dirname in (db_dir, comparisons_dir):
+    if not os.path.exists(dirname):
+      os.makedirs(dirname)
+
+  def db_name(genome):
+    return os.path.join(db_dir, '%s_genomic' % genome)
+  def exons_fname(genome):
+    return os.path.join(args.run_dir, genome, 'pants.ceg_exons.fa')
+  def comparison_fnames(genome_a, genome_b):
+    return [os.path.join(comparisons_dir, base % (genome_a, genome_b)) for base in (
+      '%s_complete_intersection_%s_partial',
+      '%s_minus_%s',
+    )]
+
+  pool = multiprocessing.Pool(args.processes)
+  pipeline_start = time.time()
+
+  run_stage(pool, 'blastdb', [Task(
+    genome,
+    make_blastdb,
+    (genome_fnames[genome], db_name(genome), db_name(genome) + '.stamp'),
+    [genome_fnames[genome]],
+    [db_name(genome) + '.stamp'],
+  ) for genome in genomes], args.force)
+
+  run_stage(pool, 'exons', [Task(
+    genome,
+    write_exons,
+    (genome_fnames[genome], os.path.join(args.run_dir, genome, 'pants.cegma.gff'), exons_fname(genome)),
+    [
+      genome_fnames[genome],
+      os.path.join(args.run_dir, genome, 'pants.cegma.gff'),
+      script_path('fix-cegma-gff-attr-column.py'),
+      script_path('extract-exons.py'),
+    ],
+    [exons_fname(genome)],
+  ) for genome in genomes], args.force)
+
+  run_stage(pool, 'sets', [Task(
+    'all pairs',
+    write_sets,
+    (args.hits, args.all_cegs, genomes, comparisons_dir),
+    [args.hits, args.all_cegs, script_path('compare-ceg-sets.py'), script_path('ceg_sets.py')],
+    [base + '.set' for a, b in directed_pairs for base in comparison_fnames(a, b)],
+  )], args.force)
+
+  run_stage(pool, 'seqs', [Task(
+    os.path.basename(base),
+    write_seqs,
+    (exons_fname(a), base + '.set', base + '.fa'),
+    [exons_fname(a), base + '.set'],
+    [base + '.fa'],
+  ) for a, b in directed_pairs for base in comparison_fnames(a, b)], args.force)
+
+  # Searches of empty sets are skipped, as blastn fails given no queries.
+  blast_tasks = [Task(
+    os.path.basename(base),
+    run_blast,
+    (base + '.fa', db_name(b), base + '.blast.xml', args.blast_threads),
+    [base + '.fa', db_name(b) + '.stamp'],
+    [base + '.blast.xml'],
+  ) for a, b in directed_pairs for base in comparison_fnames(a, b) if has_records(base + '.fa')]
+  run_stage(pool, 'blast', blast_tasks, args.force)
+
+  xml_fnames = [t.outputs[0] for t in blast_tasks]
+  run_stage(pool, 'summary', [Task(
+    'all searches',
+    write_blast_summary,
+    (xml_fnames, os.path.join(comparisons_dir, 'blast-summary.tsv')),
+    # Output of a run with no searches depends only on the script.
+    xml_fnames + [script_path('blast_xml.py')],
+    [os.path.join(comparisons_dir, 'blast-summary.tsv')],
+  )], args.force)
+
+  pool.close()
+  pool.join()
+  sys.stderr.write('Pipeline finished in %.2f s\n' % (time.time() - pipeline_start))
+
+def parse_genome(arg):
+  genome, fname = arg.split('=', 1)
+  return (genome, os.path.abspath(fname))
+
+def main():
+  parser = argparse.ArgumentParser(description='Compare CEG sequences across genomes.')
+  parser.add_argument('hits', help='CEGMA hits for all genomes, as written by parse_hits.py')
+  parser.add_argument('all_cegs', help='List of all CEGs')
+  parser.add_argument('run_dir', help='Directory holding CEGMA output for each genome, in which results are written')
+  parser.add_argument('genomes', nargs='+', type=parse_genome, metavar='genome=FASTA',
+    help='Genome name and FASTA file of its sequence')
+  parser.add_argument('-p', '--processes', dest='processes', type=int, default=multiprocessing.cpu_count(),
+    help='Number of tasks to run concurrently')
+  parser.add_argument('-t', '--blast-threads', dest='blast_threads', type=int, default=1,
+    help='Number of threads used by each BLAST search')
+  parser.add_argument('-f', '--force', dest='force', action='store_true',
+    help='Run all tasks, even if their outputs are up to date')
+  args = parser.parse_args()
+
+  if len(args.genomes) < 2:
+    parser.error('At least two genomes are needed')
+  run_pipeline(args)
+
+if __name__ == '__main__':
+  main()
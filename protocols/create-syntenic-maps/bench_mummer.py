@@ -0,0 +1,108 @@
+#!/usr/bin/env python2
+'''
+Measure memory use and region query latency of mummer.py on a synthetic
+whole-genome .delta file.
+
+Usage: bench_mummer.py [options] <delta file>
+
+A delta file is written to the given path with --alignments alignments
+between two genomes of --scaffolds scaffolds each, then read with
+mummer.read_delta(). Reported are the time taken to read the file, the bytes
+held by the table's arrays, the peak resident memory of the process, and the
+latency of random region queries of --region-length bases.
+'''
+
+import argparse
+import random
+import resource
+import time
+
+import numpy as np
+
+import mummer
+
+def write_delta(delta_fname, scaffold_count, alignment_count, seed=1):
+  '''
+  Write delta file of alignments spread over scaffolds of random length, each
+  with a handful of indels, as nucmer would for closely related genomes.
+  '''
+  rng = random.Random(seed)
+  lengths = [rng.randint(100000, 5000000) for i in range(scaffold_count)]
+  per_scaffold = [alignment_count // scaffold_count] * scaffold_count
+  per_scaffold[0] += alignment_count - sum(per_scaffold)
+
+  with open(delta_fname, 'w') as delta_file:
+    delta_file.write('/synthetic/ref.fa /synthetic/qry.fa\nNUCMER\n')
+    for i, (length, count) in enumerate(zip(lengths, per_scaffold)):
+      qry_length = length + rng.randint(-1000, 1000)
+      delta_file.write('>ref%s qry%s %s %s\n' % (i, i, length, qry_length))
+      for j in range(count):
+        align_len = rng.randint(200, 20000)
+        start = rng.randint(1, length - align_len)
+        qry_start = min(max(start + rng.randint(-500, 500), 1), qry_length - align_len)
+        if rng.random() < 0.2:
+          qry_start, qry_end = qry_start + align_len - 1, qry_start
+        else:
+          qry_end = qry_start + align_len - 1
+        indels = [rng.choice((-1, 1)) * rng.randint(1, 50) for k in range(rng.randint(0, 4))]
+        delta_file.write('%s %s %s %s %s %s 0\n' % (start, start + align_len - 1, qry_start, qry_end, rng.randint(0, 100), len(indels)))
+        delta_file.write(''.join(['%s\n' % d for d in indels]) + '0\n')
+  return lengths
+
+def peak_rss_mb():
+  # ru_maxrss is in kilobytes on Linux.
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark reading and querying MUMmer alignments.')
+  parser.add_argument('delta', help='Path at which to write synthetic delta file')
+  parser.add_argument('--alignments', dest='alignments', type=int, default=1000000,
+    help='Number of alignments to write')
+  parser.add_argument('--scaffolds', dest='scaffolds', type=int, default=500,
+    help='Number of scaffolds in each genome')
+  parser.add_argument('--queries', dest='queries', type=int, default=10000,
+    help='Number of region queries to time')
+  parser.add_argument('--region-length', dest='region_length', type=int, default=50000,
+    help='Length of each region queried')
+  args = parser.parse_args()
+
+  lengths = write_delta(args.delta, args.scaffolds, args.alignments)
+  rss_before = peak_rss_mb()
+
+  start = time.time()
+  with open(args.delta) as delta_file:
+    table = mummer.read_delta(delta_file)
+  read_time = time.time() - start
+  print('Read %s alignments in %.2f s (%.0f alignments/s)' % (len(table), read_time, len(table) / read_time))
+  print('Table arrays: %.1f MB (%.0f bytes per alignment); peak RSS %.1f MB, %.1f MB before reading' % (
+    table.nbytes() / 1e6,
+    float(table.nbytes()) / len(table),
+    peak_rss_mb(),
+    rss_before,
+  ))
+
+  rng = random.Random(2)
+  regions = []
+  for i in range(args.queries):
+    scaffold = rng.randrange(args.scaffolds)
+    start = rng.randint(1, max(lengths[scaffold] - args.region_length, 1))
+    regions.append(('ref%s' % scaffold, start, start + args.region_length - 1))
+
+  latencies = []
+  found = 0
+  for seqid, start, end in regions:
+    query_start = time.time()
+    found += len(table.overlapping(seqid, start, end))
+    latencies.append(time.time() - query_start)
+  latencies = np.array(latencies) * 1e6
+  print('%s queries of %s bases: %.1f alignments per query, latency mean %.1f us, median %.1f us, 99th percentile %.1f us' % (
+    args.queries,
+    args.region_length,
+    float(found) / args.queries,
+    latencies.mean(),
+    np.median(latencies),
+    np.percentile(latencies, 99),
+  ))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python2
+'''
+Draw a whole-genome dot plot of alignments or ortholog anchors between two
+genomes, in the manner of results/syntenic-map/mummer_large.png.
+
+Usage: dot_plot.py [options] <format> <input file> <output PNG>
+
+<format> is one of:
+
+  * delta: alignments written by nucmer or promer
+  * coords: alignments written by MUMmer's `show-coords -T`, optionally with -l
+    to give scaffold lengths, but without -H, as columns are found from the
+    header
+  * anchors: ortholog anchors written to synteny-anchors by
+    find-annotation-orthologs/synteny.py
+
+The first genome (the reference, or A) runs along the X axis and the second
+(the query, or B) up the Y axis. Each genome's scaffolds are laid end to end,
+longest first, so that each scaffold starts at the cumulative length of those
+before it. Scaffold lengths are taken from FASTA indices given with
+--lengths-a and --lengths-b, from the delta file or show-coords -l output, or
+failing both from the furthest coordinate reached on each scaffold.
+
+Rather than drawing each alignment as a marker, every alignment is rasterized
+into a fixed grid of pixels, counting the alignments crossing each pixel, so
+that drawing time grows only with the number of alignments and output size
+depends only on the size of the image. Anchors are read and drawn in chunks,
+so that their memory use also depends only on the size of the image;
+alignments in delta or coords format are first read whole into the arrays of
+mummer.py, so that memory use grows with their number, though by only a few
+dozen bytes per alignment. Forward alignments are drawn in blue and reverse
+ones in red, shaded by the log of the count in each pixel, with grey lines
+marking scaffold boundaries. The image is written directly as a PNG, without
+axis labels; --layout writes the pixel range of each scaffold.
+'''
+
+import argparse
+import struct
+import sys
+import time
+import zlib
+
+import numpy as np
+
+import mummer
+
+FORWARD_COLOUR = (0x08, 0x5D, 0x82)
+REVERSE_COLOUR = (0xC0, 0x39, 0x2B)
+BOUNDARY_COLOUR = (0xD0, 0xD0, 0xD0)
+BACKGROUND_COLOUR = (0xFF, 0xFF, 0xFF)
+# Shade of pixels crossed by a single alignment, as a fraction of full colour,
+# so that isolated alignments remain visible.
+MIN_SHADE = 0.4
+# Fewest pixels between scaffold boundaries drawn, so that the many short
+# scaffolds of a fragmented assembly do not fill the image with grey.
+MIN_BOUNDARY_SPACING = 4
+
+CHUNK_SIZE = 100000
+
+class Axis(object):
+  '''
+  Scaffolds of one genome laid end to end, longest first.
+  '''
+  def __init__(self, lengths):
+    self.seqids = sorted(lengths.keys(), key = lambda s: (-lengths[s], s))
+    self.lengths = np.array([lengths[s] for s in self.seqids], dtype=np.int64)
+    self.offsets = np.concatenate(([0], np.cumsum(self.lengths)[:-1])).astype(np.int64)
+    self.total = int(self.lengths.sum())
+    self.index = dict([(s, i) for i, s in enumerate(self.seqids)])
+
+  def locate(self, seqids, positions):
+    '''
+    Return positions along the axis of `positions` on `seqids`.
+    '''
+    idx = np.array([self.index[s] for s in seqids], dtype=np.int64)
+    return self.offsets[idx] + np.asarray(positions, dtype=np.int64)
+
+def read_lengths(fname):
+  '''
+  Return dictionary mapping each sequence to its length, as listed in the first
+  two columns of a FASTA index (.fai) file.
+  '''
+  lengths = {}
+  with open(fname) as f:
+    for line in f:
+      fields = line.rstrip('\n').split('\t')
+      if len(fields) >= 2:
+        lengths[fields[0]] = int(fields[1])
+  return lengths
+
+def iter_anchors(anchors_file):
+  '''
+  Yield (seqid_a, start_a, end_a, len_a, seqid_b, start_b, end_b, len_b) for
+  each anchor written by synteny.py, with lengths of None. Start exceeds end
+  in B for anchors in reverse blocks, so that they are drawn as reverse
+  alignments.
+  '''
+  columns = None
+  for line in anchors_file:
+    fields = line.rstrip('\n').split('\t')
+    if columns is None:
+      columns = dict([(c, i) for i, c in enumerate(fields)])
+      continue
+    start_b, end_b = int(fields[columns['start_b']]), int(fields[columns['end_b']])
+    if fields[columns['orientation']] == '-':
+      start_b, end_b = end_b, start_b
+    yield (
+      fields[columns['seqid_a']], int(fields[columns['start_a']]), int(fields[columns['end_a']]), None,
+      fields[columns['seqid_b']], start_b, end_b, None,
+    )
+
+TABLE_READERS = {
+  'coords': mummer.read_coords,
+  'delta':  mummer.read_delta,
+}
+
+def find_lengths(alignments, lengths_a, lengths_b):
+  '''
+  Add length of every scaffold named in `alignments` and missing from
+  `lengths_a` or `lengths_b`, using lengths given with alignments where
+  present, and the furthest coordinate reached otherwise.
+  '''
+  for seqid_a, start_a, end_a, len_a, seqid_b, start_b, end_b, len_b in alignments:
+    for lengths, seqid, length in (
+      (lengths_a, seqid_a, len_a or max(start_a, end_a)),
+      (lengths_b, seqid_b, len_b or max(start_b, end_b)),
+    ):
+      if lengths.get(seqid, 0) < length:
+        lengths[seqid] = length
+
+def rasterize(x0, y0, x1, y1, width, height):
+  '''
+  Return flat indices of the pixels crossed by each segment from (x0, y0) to
+  (x1, y1), in pixel units, sampling each segment once per pixel along its
+  longer side.
+  '''
+  dx = x1 - x0
+  dy = y1 - y0
+  steps = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+  seg = np.repeat(np.arange(len(steps)), steps)
+  first = np.cumsum(steps) - steps
+  t = (np.arange(seg.size) - first[seg]) / np.maximum(steps - 1, 1)[seg].astype(np.float64)
+  px = np.clip((x0[seg] + t * dx[seg]).astype(np.int64), 0, width - 1)
+  py = np.clip((y0[seg] + t * dy[seg]).astype(np.int64), 0, height - 1)
+  return py * width + px
+
+def boundary_pixels(axis, size):
+  '''
+  Return pixels at which scaffold boundaries along `axis` are drawn, skipping
+  those closer than MIN_BOUNDARY_SPACING to the last drawn.
+  '''
+  pixels = []
+  last = 0
+  for pixel in axis.offsets[1:] * size // axis.total:
+    if pixel - last >= MIN_BOUNDARY_SPACING:
+      pixels.append(pixel)
+      last = pixel
+  return pixels
+
+class DotPlot(object):
+  '''
+  Counts of forward and reverse alignments crossing each pixel.
+  '''
+  def __init__(self, axis_a, axis_b, width, height):
+    self.axis_a = axis_a
+    self.axis_b = axis_b
+    self.width = width
+    self.height = height
+    self.forward = np.zeros(width * height, dtype=np.int64)
+    self.reverse = np.zeros(width * height, dtype=np.int64)
+    self.alignment_count = 0
+
+  def add(self, alignments):
+    '''
+    Add chunk of alignments, as yielded by iter_anchors().
+    '''
+    if not alignments:
+      return
+    seqid_a, start_a, end_a, len_a, seqid_b, start_b, end_b, len_b = zip(*alignments)
+    self.add_positions(
+      self.axis_a.locate(seqid_a, start_a),
+      self.axis_a.locate(seqid_a, end_a),
+      self.axis_b.locate(seqid_b, start_b),
+      self.axis_b.locate(seqid_b, end_b),
+    )
+
+  def add_table(self, table):
+    '''
+    Add all alignments of mummer.AlignmentTable `table`.
+    '''
+    # Axis position of each scaffold, indexed by the table's scaffold numbers.
+    ref_offsets = self.axis_a.offsets[[self.axis_a.index[n] for n in table.ref_names]]
+    qry_offsets = self.axis_b.offsets[[self.axis_b.index[n] for n in table.qry_names]]
+    for lo in range(0, len(table), CHUNK_SIZE):
+      rows = slice(lo, lo + CHUNK_SIZE)
+      x_offsets = ref_offsets[table.ref[rows]]
+      y_offsets = qry_offsets[table.qry[rows]]
+      self.add_positions(
+        x_offsets + table.ref_start[rows],
+        x_offsets + table.ref_end[rows],
+        y_offsets + table.qry_start[rows],
+        y_offsets + table.qry_end[rows],
+      )
+
+  def add_positions(self, start_a, end_a, start_b, end_b):
+    '''
+    Add alignments from (start_a, start_b) to (end_a, end_b), given as arrays
+    of positions along each axis.
+    '''
+    scale_x = float(self.width) / self.axis_a.total
+    scale_y = float(self.height) / self.axis_b.total
+    x0, x1 = start_a * scale_x, end_a * scale_x
+    y0, y1 = start_b * scale_y, end_b * scale_y
+
+    is_reverse = (end_b < start_b) != (end_a < start_a)
+    for counts, chosen in ((self.forward, ~is_reverse), (self.reverse, is_reverse)):
+      if chosen.any():
+        pixels = rasterize(x0[chosen], y0[chosen], x1[chosen], y1[chosen], self.width, self.height)
+        counts += np.bincount(pixels, minlength=counts.size)
+    self.alignment_count += len(start_a)
+
+  def render(self):
+    '''
+    Return image as array of RGB rows, top row first.
+    '''
+    image = np.empty((self.height, self.width, 3), dtype=np.float64)
+    image[:, :] = BACKGROUND_COLOUR
+
+    for x in boundary_pixels(self.axis_a, self.width):
+      image[:, x] = BOUNDARY_COLOUR
+    for y in boundary_pixels(self.axis_b, self.height):
+      image[y, :] = BOUNDARY_COLOUR
+
+    peak = np.log1p(max(self.forward.max(), self.reverse.max(), 1))
+    # Where pixels hold both forward and reverse alignments, the more numerous
+    # is drawn.
+    for counts, colour in (
+      (np.where(self.reverse > self.forward, 0, self.forward), FORWARD_COLOUR),
+      (np.where(self.reverse > self.forward, self.reverse, 0), REVERSE_COLOUR),
+    ):
+      counts = counts.reshape(self.height, self.width)
+      drawn = counts > 0
+      shade = MIN_SHADE + (1 - MIN_SHADE) * np.log1p(counts[drawn]) / peak
+      image[drawn] = image[drawn] * (1 - shade[:, None]) + np.array(colour) * shade[:, None]
+
+    # B increases up the Y axis, while image rows run down from the top.
+    return np.round(image[::-1]).astype(np.uint8)
+
+def write_png(image, out_file):
+  '''
+  Write array of RGB rows as an 8-bit truecolour PNG.
+  '''
+  height, width = image.shape[:2]
+  def chunk(kind, data):
+    out_file.write(struct.pack('>I', len(data)) + kind + data)
+    out_file.write(struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+  # Each row is prefixed by filter type 0, leaving it unfiltered.
+  raw = np.concatenate((np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)), axis=1)
+  out_file.write(b'\x89PNG\r\n\x1a\n')
+  chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+  chunk(b'IDAT', zlib.compress(raw.tobytes(), 6))
+  chunk(b'IEND', b'')
+
+def write_layout(plot, out_file):
+  out_file.write('\t'.join(('axis', 'seqid', 'length', 'offset', 'first_pixel', 'last_pixel')) + '\n')
+  for name, axis, size in (('x', plot.axis_a, plot.width), ('y', plot.axis_b, plot.height)):
+    for seqid, length, offset in zip(axis.seqids, axis.lengths, axis.offsets):
+      out_file.write('\t'.join([str(v) for v in (
+        name, seqid, length, offset,
+        offset * size // axis.total,
+        max(offset, offset + length - 1) * size // axis.total,
+      )]) + '\n')
+
+def iter_chunks(alignments, chunk_size):
+  chunk = []
+  for alignment in alignments:
+    chunk.append(alignment)
+    if len(chunk) == chunk_size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+def draw(fmt, input_fname, width, height, lengths_a=None, lengths_b=None):
+  '''
+  Return DotPlot of alignments read from `input_fname` in format `fmt`.
+  '''
+  lengths_a = dict(lengths_a or {})
+  lengths_b = dict(lengths_b or {})
+  # Scaffolds must all be placed before any alignment is drawn, so anchors are
+  # read twice: once to find lengths, and once to draw them.
+  if fmt == 'anchors':
+    with open(input_fname) as input_file:
+      find_lengths(iter_anchors(input_file), lengths_a, lengths_b)
+  else:
+    with open(input_fname) as input_file:
+      table = TABLE_READERS[fmt](input_file)
+    for lengths, names, table_lengths in (
+      (lengths_a, table.ref_names, table.ref_lengths),
+      (lengths_b, table.qry_names, table.qry_lengths),
+    ):
+      for name, length in zip(names, table_lengths):
+        lengths[name] = max(lengths.get(name, 0), int(length))
+  if not lengths_a or not lengths_b:
+    raise Exception('No alignments in %s' % input_fname)
+
+  plot = DotPlot(Axis(lengths_a), Axis(lengths_b), width, height)
+  if fmt == 'anchors':
+    with open(input_fname) as input_file:
+      for chunk in iter_chunks(iter_anchors(input_file), CHUNK_SIZE):
+        plot.add(chunk)
+  else:
+    plot.add_table(table)
+  return plot
+
+def main():
+  parser = argparse.ArgumentParser(description='Draw whole-genome dot plot of alignments.')
+  parser.add_argument('format', choices=('anchors',) + tuple(sorted(TABLE_READERS.keys())), help='Format of input file')
+  parser.add_argument('input', help='Alignments or anchors to draw')
+  parser.add_argument('output', help='PNG file to write')
+  parser.add_argument('--width', dest='width', type=int, default=1400,
+    help='Width of image in pixels')
+  parser.add_argument('--height', dest='height', type=int, default=1400,
+    help='Height of image in pixels')
+  parser.add_argument('--lengths-a', dest='lengths_a',
+    help='FASTA index (.fai) giving scaffold lengths of first genome')
+  parser.add_argument('--lengths-b', dest='lengths_b',
+    help='FASTA index (.fai) giving scaffold lengths of second genome')
+  parser.add_argument('--layout', dest='layout',
+    help='File to which the pixel range of each scaffold is written')
+  args = parser.parse_args()
+
+  start_time = time.time()
+  plot = draw(
+    args.format,
+    args.input,
+    args.width,
+    args.height,
+    args.lengths_a and read_lengths(args.lengths_a),
+    args.lengths_b and read_lengths(args.lengths_b),
+  )
+  draw_time = time.time()
+  with open(args.output, 'wb') as out_file:
+    write_png(plot.render(), out_file)
+  if args.layout:
+    with open(args.layout, 'w') as out_file:
+      write_layout(plot, out_file)
+
+  sys.stderr.write('Binned %s alignments on %s x %s scaffolds in %.2f s, rendered %s x %s image in %.2f s\n' % (
+    plot.alignment_count,
+    len(plot.axis_a.seqids),
+    len(plot.axis_b.seqids),
+    draw_time - start_time,
+    args.width,
+    args.height,
+    time.time() - draw_time,
+  ))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python2
+'''
+Read MUMmer alignments into a compact table indexed by position on each
+reference scaffold, and query it by region.
+
+Usage: mummer.py [options] <alignments file> [<seqid>:<start>-<end> ...]
+
+The alignments file is either a .delta file written by nucmer or promer, or
+output of `show-coords -T`, with or without -l, but without -H. Alignments
+overlapping each region of the reference given are written to stdout, in the
+columns of show-coords -T. With --blocks, each block written by
+find-annotation-orthologs/synteny.py is instead reported with the number of
+alignments, and the number of reference bases they cover, between its two
+scaffolds within its span in the first genome, so that blocks of orthologs can
+be checked against whole-genome alignment.
+
+Files are read line by line, with only the header of each alignment in a delta
+file retained. Columns are accumulated in arrays of machine integers, rather
+than as a Python object per alignment, then sorted by reference scaffold and
+start, so that overlap queries are answered by binary search.
+'''
+
+import argparse
+import array
+import sys
+
+import numpy as np
+
+COLUMNS = ('ref_start', 'ref_end', 'qry_start', 'qry_end', 'identity')
+
+class AlignmentTable(object):
+  '''
+  Alignments held as one array per column, sorted by reference scaffold and
+  start. Scaffold names are held once each, in `ref_names` and `qry_names`,
+  with the `ref` and `qry` columns indexing them. Reference coordinates always
+  ascend, while query coordinates descend for alignments to the reverse strand
+  of the query, as in show-coords output.
+  '''
+  def __init__(self, ref_names, qry_names, ref_lengths, qry_lengths, columns):
+    self.ref_names = ref_names
+    self.qry_names = qry_names
+    self.ref_lengths = np.asarray(ref_lengths, dtype=np.int64)
+    self.qry_lengths = np.asarray(qry_lengths, dtype=np.int64)
+    self.ref_index = dict([(n, i) for i, n in enumerate(ref_names)])
+    self.qry_index = dict([(n, i) for i, n in enumerate(qry_names)])
+
+    order = np.lexsort((columns['ref_start'], columns['ref']))
+    for name in ('ref', 'qry') + COLUMNS:
+      setattr(self, name, columns[name][order])
+
+    # Rows of each reference scaffold run from bounds[i] to bounds[i + 1].
+    self.bounds = np.searchsorted(self.ref, np.arange(len(ref_names) + 1))
+    # Furthest end of any alignment up to each row on its scaffold. As rows
+    # are sorted by scaffold, encoding the scaffold in the high bits lets a
+    # single running maximum serve every scaffold.
+    reach = np.maximum.accumulate((self.ref.astype(np.int64) << 32) | self.ref_end)
+    self.reach = (reach & 0xFFFFFFFF).astype(self.ref_end.dtype)
+
+  def __len__(self):
+    return len(self.ref)
+
+  def nbytes(self):
+    return sum([getattr(self, name).nbytes for name in ('ref', 'qry', 'reach') + COLUMNS])
+
+  def overlapping(self, seqid, start, end):
+    '''
+    Return indices of rows overlapping `start` to `end` on reference scaffold
+    `seqid`, in order of start.
+    '''
+    if seqid not in self.ref_index:
+      return np.zeros(0, dtype=np.int64)
+    rid = self.ref_index[seqid]
+    lo, hi = self.bounds[rid], self.bounds[rid + 1]
+    # Rows before `first` end before `start`, as does every row before them;
+    # rows from `last` start after `end`.
+    first = lo + np.searchsorted(self.reach[lo:hi], start)
+    last = lo + np.searchsorted(self.ref_start[lo:hi], end, side='right')
+    candidates = np.arange(first, last)
+    return candidates[self.ref_end[first:last] >= start]
+
+  def row(self, i):
+    '''
+    Return (ref name, qry name, ref start, ref end, qry start, qry end,
+    identity) for row `i`.
+    '''
+    return (
+      self.ref_names[self.ref[i]],
+      self.qry_names[self.qry[i]],
+      int(self.ref_start[i]),
+      int(self.ref_end[i]),
+      int(self.qry_start[i]),
+      int(self.qry_end[i]),
+      float(self.identity[i]),
+    )
+
+class TableBuilder(object):
+  '''
+  Accumulate alignments while streaming through a file, interning scaffold
+  names.
+  '''
+  def __init__(self):
+    self.names = {'ref': [], 'qry': []}
+    self.ids = {'ref': {}, 'qry': {}}
+    self.lengths = {'ref': [], 'qry': []}
+    self.columns = dict([(c, array.array('i')) for c in ('ref', 'qry', 'ref_start', 'ref_end', 'qry_start', 'qry_end')])
+    self.columns['identity'] = array.array('f')
+
+  def intern(self, kind, name, length):
+    if name not in self.ids[kind]:
+      self.ids[kind][name] = len(self.names[kind])
+      self.names[kind].append(name)
+      self.lengths[kind].append(0)
+    sid = self.ids[kind][name]
+    self.lengths[kind][sid] = max(self.lengths[kind][sid], length)
+    return sid
+
+  def add(self, ref, qry, ref_start, ref_end, qry_start, qry_end, identity):
+    # Promer may report alignments to the reverse strand of the reference,
+    # which are flipped to keep reference coordinates ascending.
+    if ref_start > ref_end:
+      ref_start, ref_end, qry_start, qry_end = ref_end, ref_start, qry_end, qry_start
+    columns = self.columns
+    columns['ref'].append(ref)
+    columns['qry'].append(qry)
+    columns['ref_start'].append(ref_start)
+    columns['ref_end'].append(ref_end)
+    columns['qry_start'].append(qry_start)
+    columns['qry_end'].append(qry_end)
+    columns['identity'].append(identity)
+
+  def build(self):
+    columns = dict([(name, np.frombuffer(values, dtype=values.typecode == 'f' and np.float32 or np.int32))
+      for name, values in self.columns.items()])
+    return AlignmentTable(
+      self.names['ref'],
+      self.names['qry'],
+      self.lengths['ref'],
+      self.lengths['qry'],
+      columns,
+    )
+
+def read_delta(delta_file):
+  '''
+  Return AlignmentTable of alignments in .delta file. Percent identity is
+  computed from the error count over alignment columns, counting each negative
+  delta as a column absent from the reference, as show-coords does.
+  '''
+  builder = TableBuilder()
+  header = None
+  in_alignment = False
+
+  delta_file.readline()
+  delta_file.readline()
+  for line in delta_file:
+    if line.startswith('>'):
+      ref_name, qry_name, ref_len, qry_len = line[1:].split()
+      ref = builder.intern('ref', ref_name, int(ref_len))
+      qry = builder.intern('qry', qry_name, int(qry_len))
+      continue
+    if not in_alignment:
+      header = [int(v) for v in line.split()]
+      if len(header) != 7:
+        continue
+      in_alignment = True
+      ref_gaps = 0
+      continue
+
+    delta = int(line)
+    if delta < 0:
+      ref_gaps += 1
+    elif delta == 0:
+      in_alignment = False
+      ref_start, ref_end, qry_start, qry_end, errors = header[:5]
+      columns = abs(ref_end - ref_start) + 1 + ref_gaps
+      builder.add(ref, qry, ref_start, ref_end, qry_start, qry_end, 100.0 * (columns - errors) / columns)
+
+  return builder.build()
+
+def read_coords(coords_file):
+  '''
+  Return AlignmentTable of alignments written by `show-coords -T`. Scaffold
+  lengths are those given by -l, or the furthest coordinate reached if absent.
+  '''
+  builder = TableBuilder()
+  columns = None
+  for line in coords_file:
+    fields = line.rstrip('\n').split('\t')
+    if columns is None:
+      if fields[0] == '[S1]':
+        columns = dict([(c, i) for i, c in enumerate(fields)])
+      continue
+    if len(fields) < 4:
+      continue
+
+    ref_start, ref_end, qry_start, qry_end = [int(v) for v in fields[:4]]
+    if '[LEN R]' in columns:
+      ref_len, qry_len = int(fields[columns['[LEN R]']]), int(fields[columns['[LEN Q]']])
+    else:
+      ref_len, qry_len = max(ref_start, ref_end), max(qry_start, qry_end)
+    builder.add(
+      builder.intern('ref', fields[-2], ref_len),
+      builder.intern('qry', fields[-1], qry_len),
+      ref_start, ref_end, qry_start, qry_end,
+      float(fields[columns['[% IDY]']]),
+    )
+
+  return builder.build()
+
+def read_alignments(fname):
+  '''
+  Return AlignmentTable of alignments in .delta or show-coords file `fname`,
+  distinguished by whether the first scaffold header follows the program name.
+  '''
+  with open(fname) as f:
+    f.readline()
+    f.readline()
+    is_delta = f.readline().startswith('>')
+  with open(fname) as f:
+    if is_delta:
+      return read_delta(f)
+    return read_coords(f)
+
+def parse_region(region):
+  seqid, _, span = region.rpartition(':')
+  start, end = span.split('-')
+  return (seqid, int(start), int(end))
+
+def write_rows(table, indices, out_file):
+  for i in indices:
+    ref_name, qry_name, ref_start, ref_end, qry_start, qry_end, identity = table.row(i)
+    out_file.write('%s\t%s\t%s\t%s\t%s\t%s\t%.2f\t%s\t%s\n' % (
+      ref_start, ref_end, qry_start, qry_end,
+      ref_end - ref_start + 1, abs(qry_end - qry_start) + 1,
+      identity, ref_name, qry_name,
+    ))
+
+def write_block_support(table, blocks_file, out_file):
+  '''
+  Write each block from synteny-blocks with the alignments supporting it.
+  '''
+  columns = None
+  for line in blocks_file:
+    fields = line.rstrip('\n').split('\t')
+    if columns is None:
+      columns = dict([(c, i) for i, c in enumerate(fields)])
+      out_file.write('\t'.join(fields + ['alignments', 'aligned_bases_a']) + '\n')
+      continue
+    start_a, end_a = int(fields[columns['start_a']]), int(fields[columns['end_a']])
+    hits = table.overlapping(fields[columns['seqid_a']], start_a, end_a)
+    hits = hits[table.qry[hits] == table.qry_index.get(fields[columns['seqid_b']], -1)]
+
+    # Bases of A covered by the alignments, clipped to the block. Rows are
+    # sorted by start, so overlapping alignments are merged in one pass.
+    covered = 0
+    reach = start_a - 1
+    for s, e in zip(np.maximum(table.ref_start[hits], start_a), np.minimum(table.ref_end[hits], end_a)):
+      if e > reach:
+        covered += e - max(s, reach + 1) + 1
+        reach = e
+    out_file.write('\t'.join(fields + [str(len(hits)), str(covered)]) + '\n')
+
+def main():
+  parser = argparse.ArgumentParser(description='Query MUMmer alignments by region.')
+  parser.add_argument('alignments', help='.delta or show-coords -T file')
+  parser.add_argument('regions', nargs='*', type=parse_region, metavar='seqid:start-end',
+    help='Region of reference in which to find alignments')
+  parser.add_argument('--blocks', dest='blocks',
+    help='synteny-blocks file from synteny.py whose blocks are checked against alignments')
+  args = parser.parse_args()
+
+  table = read_alignments(args.alignments)
+  if args.blocks:
+    with open(args.blocks) as blocks_file:
+      write_block_support(table, blocks_file, sys.stdout)
+  for seqid, start, end in args.regions:
+    write_rows(table, table.overlapping(seqid, start, end), sys.stdout)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python2
+'''
+Run every analysis of orthologous groups spanning several genomes, reading the
+groups once from a store built by group_store.py. This is the counterpart of
+analyze_groups.py for merged groups, replacing a separate analysis of each
+pairwise comparison.
+
+Usage: analyze_group_store.py [options] <store> \
+         --genome <ID> <label> <name map> <annotation> [--genome ...]
+
+--genome must be given once for each genome in the store. Writes the following
+files to the output directory:
+
+  * orthologue-summary: as from summarize_groups.py --store
+  * ortho_groups_joint.png: as from plot_group_summary.py --store
+  * transcript-groups: as from examine_transcript_groups.py, but for groups
+    spanning all genomes
+  * tandem-clusters, tandem-groups: as from find_tandem_arrays.py, but for
+    groups spanning all genomes
+'''
+
+import argparse
+import os
+import sys
+import time
+
+import analyze_groups
+import examine_transcript_groups
+import find_tandem_arrays
+import group_store
+import plot_group_summary
+import summarize_groups
+
+def summarize(groups, args):
+  summary = summarize_groups.summarize_groups(groups, args.genome_ids)
+  with open(os.path.join(args.output_dir, 'orthologue-summary'), 'w') as out_file:
+    summarize_groups.write_summary(summary, out_file)
+
+def plot(groups, args):
+  plot_group_summary.plot_joint_histograms(
+    plot_group_summary.calc_member_counts(groups, args.genome_ids),
+    os.path.join(args.output_dir, 'ortho_groups_joint.png'),
+    [args.genome_info[g]['label'] for g in args.genome_ids],
+  )
+
+def examine(groups, args):
+  orig_stdout = sys.stdout
+  with open(os.path.join(args.output_dir, 'transcript-groups'), 'w') as out_file:
+    sys.stdout = out_file
+    try:
+      examine_transcript_groups.examine_contiguity(
+        groups,
+        dict([(g, args.genome_info[g]['name_map'])   for g in args.genome_ids]),
+        dict([(g, args.genome_info[g]['annotation']) for g in args.genome_ids]),
+        cache_dir = args.cache_dir,
+        genomes = args.genome_ids,
+      )
+    finally:
+      sys.stdout = orig_stdout
+
+def find_tandem(groups, args):
+  find_tandem_arrays.run(
+    groups,
+    dict([(g, args.genome_info[g]['name_map'])   for g in args.genome_ids]),
+    dict([(g, args.genome_info[g]['annotation']) for g in args.genome_ids]),
+    args.output_dir,
+    cache_dir = args.cache_dir,
+    genomes = args.genome_ids,
+  )
+
+ANALYSES = (
+  ('summarize', summarize),
+  ('plot',      plot),
+  ('examine',   examine),
+  ('tandem',    find_tandem),
+)
+
+def main():
+  parser = argparse.ArgumentParser(description='Run all analyses of orthologous groups in a group store.')
+  parser.add_argument('store', help='Group store built by group_store.py')
+  parser.add_argument('--genome', dest='genomes', action='append', nargs=4, required=True,
+    metavar=('ID', 'LABEL', 'NAME_MAP', 'ANNOTATION'),
+    help='Genome ID, plot label, name mapping JSON file and annotation GFF3 file for one genome')
+  parser.add_argument('-d', '--output-dir', dest='output_dir', action='store', default='.',
+    help='Directory in which to write results')
+  parser.add_argument('-p', '--parallel', dest='parallel', action='store_true',
+    help='Run analyses concurrently')
+  parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+    help='Directory in which to cache transcripts parsed from annotation files')
+  args = parser.parse_args()
+
+  args.genome_info = dict([
+    (genome_id, {'label': label, 'name_map': name_map, 'annotation': annotation})
+    for genome_id, label, name_map, annotation in args.genomes
+  ])
+
+  start_time = time.time()
+  store = group_store.GroupStore(args.store)
+  args.genome_ids = store.genomes()
+  missing = [g for g in args.genome_ids if g not in args.genome_info]
+  if missing:
+    parser.error('--genome not given for %s' % ', '.join(missing))
+  groups = list(store.iter_groups())
+  store.close()
+  sys.stderr.write('Read %s groups spanning %s genomes in %.2f s\n' % (len(groups), len(args.genome_ids), time.time() - start_time))
+
+  analyze_groups.run_analyses(groups, args, ANALYSES)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python2
+'''
+Parse InParanoid's human-readable output once, then run every analysis of the
+resulting orthologous groups within a single process. This replaces running
+parse_inparanoid.py, summarize_groups.py, plot_group_summary.py,
+examine_transcript_groups.py and find_tandem_arrays.py as separate programs,
+each of which must start an interpreter and decode the parsed groups anew.
+
+Writes the following files to the output directory:
+
+  * inparanoid_results.ndjson: parsed groups, as from parse_inparanoid.py --ndjson
+  * orthologue-summary: as from summarize_groups.py
+  * ortho_groups_linear.png, ortho_groups_log.png: as from plot_group_summary.py
+  * transcript-groups: as from examine_transcript_groups.py
+  * tandem-clusters, tandem-groups: as from find_tandem_arrays.py
+
+If --parallel is specified, the analyses run concurrently in forked child
+processes, each of which inherits the parsed groups without copying them.
+'''
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import examine_transcript_groups
+import find_tandem_arrays
+import parse_inparanoid
+import plot_group_summary
+import summarize_groups
+
+def parse_groups(inparanoid_output_fname, parsed_fname):
+  '''
+  Parse InParanoid output, writing each group to `parsed_fname` as it is read.
+  '''
+  with open(inparanoid_output_fname) as inparanoid_output:
+    with open(parsed_fname, 'w') as parsed_file:
+      groups = []
+      for group in parse_inparanoid.StateMachine(inparanoid_output).iter_groups():
+        parse_inparanoid.write_ndjson([group], parsed_file)
+        groups.append(group)
+  return groups
+
+def summarize(groups, args):
+  summary = summarize_groups.summarize_groups(groups)
+  with open(os.path.join(args.output_dir, 'orthologue-summary'), 'w') as out_file:
+    summarize_groups.write_summary(summary, out_file)
+
+def plot(groups, args):
+  vals = plot_group_summary.calc_log_ratios(groups)
+  for filename, make_y_scale_log in (
+    ('ortho_groups_linear.png', False),
+    ('ortho_groups_log.png',    True),
+  ):
+    plot_group_summary.plot_log_ratios(
+      vals,
+      os.path.join(args.output_dir, filename),
+      make_y_scale_log,
+      args.friendly_name_a,
+      args.friendly_name_b,
+    )
+
+def examine(groups, args):
+  # examine_transcript_groups writes its report via print(), so redirect
+  # stdout for its duration.
+  orig_stdout = sys.stdout
+  with open(os.path.join(args.output_dir, 'transcript-groups'), 'w') as out_file:
+    sys.stdout = out_file
+    try:
+      examine_transcript_groups.examine_contiguity(
+        groups,
+        {'a': args.name_map_a,   'b': args.name_map_b},
+        {'a': args.annotation_a, 'b': args.annotation_b},
+        cache_dir = args.cache_dir,
+      )
+    finally:
+      sys.stdout = orig_stdout
+
+def find_tandem(groups, args):
+  find_tandem_arrays.run(
+    groups,
+    {'a': args.name_map_a,   'b': args.name_map_b},
+    {'a': args.annotation_a, 'b': args.annotation_b},
+    args.output_dir,
+    cache_dir = args.cache_dir,
+  )
+
+ANALYSES = (
+  ('summarize', summarize),
+  ('plot',      plot),
+  ('examine',   examine),
+  ('tandem',    find_tandem),
+)
+
+def run_timed(name, analysis, groups, args):
+  start_time = time.time()
+  analysis(groups, args)
+  sys.stderr.write('%s finished in %.2f s\n' % (name, time.time() - start_time))
+
+def run_analyses(groups, args, analyses=ANALYSES):
+  if not args.parallel:
+    for name, analysis in analyses:
+      run_timed(name, analysis, groups, args)
+    return
+
+  processes = []
+  for name, analysis in analyses:
+    p = multiprocessing.Process(target=run_timed, args=(name, analysis, groups, args))
+    p.start()
+    processes.append((name, p))
+
+  failed = []
+  for name, p in processes:
+    p.join()
+    if p.exitcode != 0:
+      failed.append(name)
+  if failed:
+    raise Exception('Analyses failed: %s' % ', '.join(failed))
+
+def main():
+  parser = argparse.ArgumentParser(description='Parse InParanoid results and run all group analyses.')
+  parser.add_argument('inparanoid_output', help='InParanoid human-readable Output file')
+  parser.add_argument('friendly_name_a',   help='Label for first genome in plots')
+  parser.add_argument('friendly_name_b',   help='Label for second genome in plots')
+  parser.add_argument('name_map_a',        help='Name mapping JSON file for first genome')
+  parser.add_argument('name_map_b',        help='Name mapping JSON file for second genome')
+  parser.add_argument('annotation_a',      help='Annotation GFF3 file for first genome')
+  parser.add_argument('annotation_b',      help='Annotation GFF3 file for second genome')
+  parser.add_argument('-d', '--output-dir', dest='output_dir', action='store', default='.',
+    help='Directory in which to write results')
+  parser.add_argument('-p', '--parallel', dest='parallel', action='store_true',
+    help='Run analyses concurrently')
+  parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+    help='Directory in which to cache transcripts parsed from annotation files')
+  args = parser.parse_args()
+
+  start_time = time.time()
+  groups = parse_groups(args.inparanoid_output, os.path.join(args.output_dir, 'inparanoid_results.ndjson'))
+  sys.stderr.write('Parsed %s groups in %.2f s\n' % (len(groups), time.time() - start_time))
+
+  run_analyses(groups, args)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python2
+'''
+Cluster orthologous groups from the BLAST hit tables written by InParanoid,
+without rerunning BLAST or inparanoid.pl. Groups are built in the manner of
+InParanoid:
+
+  1. Hits scoring below the score cutoff, or whose alignment covers too little
+     of the longer sequence, are discarded.
+  2. Pairs of sequences from genomes A and B that are each other's best hit
+     become seed orthologs, processed in order of descending score.
+  3. Each seed gains as in-paralogs those sequences from its own genome that
+     score higher against it than the seed orthologs score against each other.
+     In-paralogs are given confidence values from 0 to 1 according to how much
+     closer they are to their seed than the seeds are to each other, and those
+     whose confidence falls below a cutoff are discarded.
+  4. If an outgroup is given, in-paralogs scoring higher against any outgroup
+     sequence than against the other genome's seed are discarded.
+
+Sequences already assigned to a group are not considered for later groups.
+Unlike InParanoid, overlapping groups are not merged, and bootstrap support
+is not calculated.
+
+Usage: cluster_orthologs.py [options] <genome A FASTA> <genome B FASTA>
+
+Hit tables are read from the files InParanoid names "<query>-<db>", where
+<query> and <db> are the FASTA names given as arguments, in the directory given
+by --hits-dir. Output takes the form of parse_inparanoid.py's, with each
+member's confidence value in place of InParanoid's.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import parse_inparanoid
+
+# Defaults match those of inparanoid.pl.
+DEFAULT_PARAMS = {
+  'score_cutoff':     40,
+  'coverage_cutoff':  0.5,
+  'segment_coverage': 0.25,
+  'grey_zone':        0,
+  'conf_cutoff':      0.05,
+}
+# Parameters determining which hits are retained. Changing any of these
+# requires the hit tables to be filtered anew.
+FILTER_PARAMS = ('score_cutoff', 'coverage_cutoff', 'segment_coverage')
+
+class NameTable(object):
+  '''
+  Assign consecutive integer IDs to sequence names.
+  '''
+  def __init__(self):
+    self._ids = {}
+    self._names = []
+
+  def __len__(self):
+    return len(self._names)
+
+  def id(self, name):
+    if name not in self._ids:
+      self._ids[name] = len(self._names)
+      self._names.append(name)
+    return self._ids[name]
+
+  def name(self, seq_id):
+    return self._names[seq_id]
+
+class HitTable(object):
+  '''
+  Hits of query sequences from one genome against database sequences from
+  another (or the same) genome, held as parallel NumPy arrays. Hits are sorted
+  by query, then by descending score, so that each query's hits occupy a
+  contiguous slice.
+  '''
+  # Columns of blast_parser.pl's output following the query and hit names.
+  # The match area runs from the start of the first aligned segment to the end
+  # of the last, while the segment length is the sum of all aligned segments.
+  COLUMNS = (
+    'score',
+    'query_len',
+    'hit_len',
+    'query_match_area',
+    'hit_match_area',
+    'query_segment_len',
+    'hit_segment_len',
+  )
+
+  def __init__(self, query, hit, columns, query_count, hit_count):
+    order = np.lexsort((-columns[:, 0], query))
+    self.query = query[order]
+    self.hit = hit[order]
+    self.columns = columns[order]
+    self.score = self.columns[:, 0]
+    self.query_count = query_count
+    self.hit_count = hit_count
+    self._offsets = np.searchsorted(self.query, np.arange(query_count + 1))
+    self._lookup = None
+
+  @classmethod
+  def parse(cls, hits_fname, query_names, hit_names):
+    query, hit, numeric = [], [], []
+    column_count = len(cls.COLUMNS)
+    with open(hits_fname) as hits_file:
+      for line in hits_file:
+        fields = line.split('\t', column_count + 2)
+        query.append(query_names.id(fields[0]))
+        hit.append(hit_names.id(fields[1]))
+        numeric.append('\t'.join(fields[2:column_count + 2]))
+    # Converting all numeric fields in a single call is much faster than
+    # converting them individually.
+    columns = np.fromstring('\t'.join(numeric), dtype=np.float64, sep='\t') if numeric else np.zeros(0)
+    return cls(
+      np.array(query, dtype=np.int32),
+      np.array(hit, dtype=np.int32),
+      columns.reshape(-1, column_count),
+      len(query_names),
+      len(hit_names),
+    )
+
+  def filter(self, params, query_count, hit_count):
+    '''
+    Return table retaining only hits meeting the score cutoff whose alignment
+    covers enough of the longer of the two sequences. `query_count` and
+    `hit_count` give the number of names in each genome, which may have grown
+    since this table was parsed as other tables were read.
+    '''
+    cols = dict(zip(self.COLUMNS, self.columns.T))
+    query_is_longer = cols['query_len'] >= cols['hit_len']
+    longer_len = np.where(query_is_longer, cols['query_len'], cols['hit_len'])
+    longer_area = np.where(query_is_longer, cols['query_match_area'], cols['hit_match_area'])
+    longer_segments = np.where(query_is_longer, cols['query_segment_len'], cols['hit_segment_len'])
+
+    # As in inparanoid.pl's overlap_test, the match area is held to the
+    # coverage cutoff, and the summed segments to the segment coverage.
+    mask = (
+      (cols['score'] >= params['score_cutoff']) &
+      (longer_area >= params['coverage_cutoff'] * longer_len) &
+      (longer_segments >= params['segment_coverage'] * longer_len)
+    )
+    return HitTable(self.query[mask], self.hit[mask], self.columns[mask], query_count, hit_count)
+
+  def hits_for(self, query_id):
+    '''
+    Return (hit IDs, scores) for query, in order of descending score.
+    '''
+    start, end = self._offsets[query_id], self._offsets[query_id + 1]
+    return (self.hit[start:end], self.score[start:end])
+
+  def best_scores(self):
+    '''
+    Return array holding each query's highest score, or 0 if it has no hits.
+    '''
+    best = np.zeros(self.query_count)
+    np.maximum.at(best, self.query, self.score)
+    return best
+
+  def best_hit_keys(self, grey_zone, key_of):
+    '''
+    Return sorted array of keys, computed by `key_of(query, hit)`, for each
+    query's best hits. Hits scoring within `grey_zone` of a query's highest
+    score are also considered best hits.
+    '''
+    is_best = self.score >= self.best_scores()[self.query] - grey_zone
+    return np.unique(key_of(self.query[is_best], self.hit[is_best]))
+
+  def lookup(self, query_id, hit_id):
+    '''
+    Return score of hit, or 0 if absent.
+    '''
+    if self._lookup is None:
+      keys = self.query.astype(np.int64) * self.hit_count + self.hit
+      # Hits are sorted by descending score, so zipping in reverse leaves each
+      # key holding its highest score should any pair appear more than once.
+      self._lookup = dict(zip(keys[::-1].tolist(), self.score[::-1].tolist()))
+    return self._lookup.get(query_id * self.hit_count + hit_id, 0)
+
+class HitTables(object):
+  '''
+  All hit tables for one comparison, parsed once so that they may be
+  clustered repeatedly with different parameters. The filtered tables and
+  seeds computed for the most recently used parameters are retained, so that
+  clustering repeatedly while varying only later parameters reuses them.
+  '''
+  def __init__(self, hits_dir, fasta_a, fasta_b, fasta_outgroup=None):
+    self.names = {'a': NameTable(), 'b': NameTable(), 'c': NameTable()}
+    fastas = {'a': fasta_a, 'b': fasta_b, 'c': fasta_outgroup}
+
+    pairs = ['aa', 'ab', 'ba', 'bb']
+    if fasta_outgroup:
+      pairs += ['ac', 'bc']
+    self.raw = {}
+    for pair in pairs:
+      query_genome, db_genome = pair
+      hits_fname = os.path.join(hits_dir, '%s-%s' % (fastas[query_genome], fastas[db_genome]))
+      self.raw[pair] = HitTable.parse(hits_fname, self.names[query_genome], self.names[db_genome])
+
+    self._filtered = (None, None)
+    self._seeds = (None, None)
+
+  def filtered(self, params):
+    '''
+    Return dictionary mapping each pair of genomes to its filtered hit table.
+    '''
+    filter_key = tuple([params[p] for p in FILTER_PARAMS])
+    if self._filtered[0] != filter_key:
+      counts = dict([(g, len(n)) for g, n in self.names.items()])
+      self._filtered = (filter_key, dict([
+        (pair, table.filter(params, counts[pair[0]], counts[pair[1]]))
+        for pair, table in self.raw.items()
+      ]))
+    return self._filtered[1]
+
+  def seeds(self, params):
+    seeds_key = tuple([params[p] for p in FILTER_PARAMS] + [params['grey_zone']])
+    if self._seeds[0] != seeds_key:
+      self._seeds = (seeds_key, find_seeds(self.filtered(params), params))
+    return self._seeds[1]
+
+def find_seeds(tables, params):
+  '''
+  Return list of (score, a, b) for reciprocal best hits between A and B, in
+  order of descending score. A pair's score is the mean of its scores in both
+  directions.
+  '''
+  b_count = tables['ab'].hit_count
+  ab_keys = tables['ab'].best_hit_keys(params['grey_zone'], lambda q, h: q.astype(np.int64) * b_count + h)
+  ba_keys = tables['ba'].best_hit_keys(params['grey_zone'], lambda q, h: h.astype(np.int64) * b_count + q)
+  reciprocal = np.intersect1d(ab_keys, ba_keys)
+
+  seeds = []
+  for key in reciprocal.tolist():
+    a, b = divmod(key, b_count)
+    score = (tables['ab'].lookup(a, b) + tables['ba'].lookup(b, a)) / 2.0
+    seeds.append((score, a, b))
+  # Break ties by ID so that output is deterministic.
+  seeds.sort(key = lambda s: (-s[0], s[1], s[2]))
+  return seeds
+
+def find_inparalogs(seed, seed_score, other_seed, self_table, cross_table, outgroup_best, assigned, params):
+  '''
+  Return list of (confidence, ID) for seed and its in-paralogs, in order of
+  descending confidence.
+  '''
+  hit_ids, scores = self_table.hits_for(seed)
+  self_score = max(self_table.lookup(seed, seed), scores[0] if len(scores) else 0)
+
+  members = [(1.0, seed)]
+  for hit_id, score in zip(hit_ids.tolist(), scores.tolist()):
+    if score <= seed_score:
+      # Remaining hits score lower still.
+      break
+    if hit_id == seed or hit_id in assigned:
+      continue
+    if self_score > seed_score:
+      confidence = min(1.0, (score - seed_score) / (self_score - seed_score))
+    else:
+      confidence = 1.0
+    if confidence < params['conf_cutoff']:
+      continue
+    if outgroup_best is not None and outgroup_best[hit_id] > cross_table.lookup(hit_id, other_seed):
+      continue
+    members.append((confidence, hit_id))
+
+  members.sort(key = lambda m: (-m[0], m[1]))
+  return members
+
+def cluster(hit_tables, params=None):
+  '''
+  Return list of orthologous groups, each of which maps "a" and "b" to a list
+  of [name, confidence] for its members from each genome.
+  '''
+  merged_params = dict(DEFAULT_PARAMS)
+  merged_params.update(params or {})
+  params = merged_params
+
+  tables = hit_tables.filtered(params)
+  outgroup_best = {'a': None, 'b': None}
+  if 'ac' in tables:
+    outgroup_best = {'a': tables['ac'].best_scores(), 'b': tables['bc'].best_scores()}
+
+  assigned = {'a': set(), 'b': set()}
+  groups = []
+  for seed_score, a, b in hit_tables.seeds(params):
+    if a in assigned['a'] or b in assigned['b']:
+      continue
+    members = {
+      'a': find_inparalogs(a, seed_score, b, tables['aa'], tables['ab'], outgroup_best['a'], assigned['a'], params),
+      'b': find_inparalogs(b, seed_score, a, tables['bb'], tables['ba'], outgroup_best['b'], assigned['b'], params),
+    }
+
+    group = {}
+    for genome in ('a', 'b'):
+      assigned[genome].update([seq_id for confidence, seq_id in members[genome]])
+      group[genome] = [[hit_tables.names[genome].name(seq_id), confidence] for confidence, seq_id in members[genome]]
+    groups.append(group)
+
+  return groups
+
+def add_param_args(parser):
+  parser.add_argument('--score-cutoff', dest='score_cutoff', type=float, default=DEFAULT_PARAMS['score_cutoff'],
+    help='Minimum bit score for hits')
+  parser.add_argument('--coverage-cutoff', dest='coverage_cutoff', type=float, default=DEFAULT_PARAMS['coverage_cutoff'],
+    help='Minimum fraction of longer sequence spanned by the match area, from the start of the first aligned segment to the end of the last')
+  parser.add_argument('--segment-coverage', dest='segment_coverage', type=float, default=DEFAULT_PARAMS['segment_coverage'],
+    help='Minimum fraction of longer sequence covered by the aligned segments together')
+  parser.add_argument('--grey-zone', dest='grey_zone', type=float, default=DEFAULT_PARAMS['grey_zone'],
+    help='Hits scoring within this many bits of the best hit are also considered best hits')
+  parser.add_argument('--conf-cutoff', dest='conf_cutoff', type=float, default=DEFAULT_PARAMS['conf_cutoff'],
+    help='Minimum confidence for in-paralogs')
+
+def main():
+  parser = argparse.ArgumentParser(description='Cluster orthologous groups from InParanoid BLAST hit tables.')
+  parser.add_argument('fasta_a', help='Name of FASTA file for genome A, as used in hit table filenames')
+  parser.add_argument('fasta_b', help='Name of FASTA file for genome B, as used in hit table filenames')
+  parser.add_argument('-o', '--outgroup', dest='fasta_outgroup', action='store',
+    help='Name of FASTA file for outgroup, as used in hit table filenames')
+  parser.add_argument('-d', '--hits-dir', dest='hits_dir', action='store', default='.',
+    help='Directory containing hit tables')
+  parser.add_argument('--ndjson', dest='ndjson', action='store_true',
+    help='Write each group as a separate JSON document on its own line')
+  add_param_args(parser)
+  args = parser.parse_args()
+
+  start_time = time.time()
+  hit_tables = HitTables(args.hits_dir, args.fasta_a, args.fasta_b, args.fasta_outgroup)
+  parsed_time = time.time()
+  groups = cluster(hit_tables, dict([(p, getattr(args, p)) for p in DEFAULT_PARAMS]))
+  sys.stderr.write('Parsed hit tables in %.2f s, then clustered %s groups in %.2f s\n' % (
+    parsed_time - start_time,
+    len(groups),
+    time.time() - parsed_time,
+  ))
+
+  if args.ndjson:
+    parse_inparanoid.write_ndjson(groups, sys.stdout)
+  else:
+    json.dump({'groups': groups}, sys.stdout)
+
+if __name__ == '__main__':
+  main()
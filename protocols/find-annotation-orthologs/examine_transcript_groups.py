@@ -1,15 +1,75 @@
 #!/usr/bin/env python2
 
+import argparse
+import bisect
+import hashlib
 import json
+import os
 import re
 import sqlite3
 import sys
+import time
+
+import inparanoid_groups
+
+class IntervalIndex(object):
+  '''
+  Transcripts lying on a single strand of a single scaffold, sorted by start
+  coordinate. As no transcript is longer than the longest one indexed, any
+  transcript overlapping a query interval must start within that distance of
+  the interval, which permits overlap queries to be answered by bisection
+  rather than by scanning the whole scaffold.
+  '''
+  def __init__(self, transcripts):
+    '''
+    Argument `transcripts` is a list of (tstart, tend, name) tuples.
+    '''
+    transcripts = sorted(transcripts)
+    self._starts = [t[0] for t in transcripts]
+    self._ends   = [t[1] for t in transcripts]
+    self._names  = [t[2] for t in transcripts]
+    self._max_len = max([tend - tstart for tstart, tend, name in transcripts])
+
+  def count_overlapping(self, start, end, excluded_names):
+    '''
+    Count transcripts overlapping [start, end] whose names are not in
+    `excluded_names`. Overlap is defined exactly as in the SQL query used by
+    TranscriptManager._determine_intervening_genes.
+    '''
+    lo = bisect.bisect_right(self._starts, start - self._max_len)
+    hi = bisect.bisect_left(self._starts, end)
+
+    count = 0
+    for i in range(lo, hi):
+      tstart, tend = self._starts[i], self._ends[i]
+      if min(tend, end) > max(tstart, start) and self._names[i] not in excluded_names:
+        count += 1
+    return count
+
+  def transcripts(self):
+    '''
+    Return (tstart, tend, name) for each transcript, sorted by start.
+    '''
+    return list(zip(self._starts, self._ends, self._names))
 
 class TranscriptManager(object):
-  def __init__(self):
+  def __init__(self, use_sql_overlaps=False, cache_dir=None):
+    '''
+    If `use_sql_overlaps` is True, count intervening genes with one SQL query
+    per scaffold rather than via the interval index. Both methods produce
+    identical results; the SQL path is retained for cross-checking.
+
+    If `cache_dir` is set, transcripts parsed from each GFF file are stored
+    there in an SQLite file, which later runs attach rather than re-parsing the
+    GFF.
+    '''
     self._conn = sqlite3.connect(':memory:')
     # Give dictionary-based access to results.
     self._conn.row_factory = sqlite3.Row
+    self._use_sql_overlaps = use_sql_overlaps
+    self._cache_dir = cache_dir
+    # Maps (group_name, seqid, strand) to IntervalIndex.
+    self._intervals = {}
     self._create_db()
 
   def _create_db(self):
@@ -28,19 +88,15 @@ class TranscriptManager(object):
     self._commit()
 
   def _insert_transcripts(self, transcripts, group_name):
+    '''
+    Insert all transcripts yielded by the iterable `transcripts` in a single
+    transaction.
+    '''
     cursor = self._cursor()
-
-    for tid, transcript in transcripts.items():
-      cursor.execute(
-        'INSERT INTO transcripts (group_name, name, seqid, tstart, tend, strand) VALUES (?, ?, ?, ?, ?, ?)', (
-        group_name,
-        tid,
-        transcript['seqid'],
-        transcript['tstart'],
-        transcript['tend'],
-        transcript['strand'],
-      ))
-
+    cursor.executemany(
+      'INSERT INTO transcripts (group_name, name, seqid, tstart, tend, strand) VALUES (?, ?, ?, ?, ?, ?)',
+      ((group_name,) + transcript for transcript in transcripts)
+    )
     self._commit()
 
   def _retrieve_transcript_names(self, mapping):
@@ -51,16 +107,30 @@ class TranscriptManager(object):
     (Note that, in the current implementation, this FASTA file will list only
     the longest isoform for each gene.)
     '''
-    gene_names = mapping.values()
-    gene_names = [n.split()[0] for n in gene_names]
-    return gene_names
+    return set([n.split()[0] for n in mapping.values()])
+
+  def _extract_id(self, attributes):
+    # Only the ID attribute is needed, so avoid building a dictionary of every
+    # attribute on the line.
+    for attrib in attributes.split(';'):
+      if attrib.startswith('ID='):
+        return attrib[3:]
+    raise KeyError('ID')
 
   def _parse_gff(self, gff_filename, mapping):
-    transcripts = {}
+    '''
+    Yield (name, seqid, tstart, tend, strand) for each mRNA in the GFF file
+    whose transcript is listed in `mapping`. Parsing statistics are written to
+    stderr once the file is exhausted.
+    '''
+    seen_tids = set()
     mapped_transcript_names = self._retrieve_transcript_names(mapping)
+    line_count = 0
+    start_time = time.time()
 
     with open(gff_filename) as gff_file:
       for line in gff_file:
+        line_count += 1
         line = line.strip()
         if line == '' or line.startswith('#'):
           continue
@@ -69,24 +139,25 @@ class TranscriptManager(object):
         if not fields[2] == 'mRNA':
           continue
 
-        attribs = dict([f.split('=', 1) for f in fields[8].split(';')])
-        tid = attribs['ID']
+        tid = self._extract_id(fields[8])
         if tid.startswith('transcript:'):
           tid = tid.split(':', 1)[1]
 
-        if tid in transcripts:
-          raise Exception('Duplicate seqid %s' % seqid)
         if tid not in mapped_transcript_names:
           continue
+        if tid in seen_tids:
+          raise Exception('Duplicate seqid %s' % tid)
+        seen_tids.add(tid)
 
-        transcripts[tid] = {
-          'seqid':  fields[0],
-          'tstart':  int(fields[3]),
-          'tend':    int(fields[4]),
-          'strand': fields[6],
-        }
+        yield (tid, fields[0], int(fields[3]), int(fields[4]), fields[6])
 
-    return transcripts
+    elapsed = time.time() - start_time
+    sys.stderr.write('Parsed %s lines from %s in %.2f s (%.0f lines/s)\n' % (
+      line_count,
+      gff_filename,
+      elapsed,
+      line_count / max(elapsed, 1e-9),
+    ))
 
   def _cursor(self):
     return self._conn.cursor()
@@ -94,9 +165,110 @@ class TranscriptManager(object):
   def _commit(self):
     self._conn.commit()
 
+  def _index_transcripts(self, group_name):
+    cursor = self._cursor()
+    cursor.execute('''
+      SELECT seqid, strand, tstart, tend, name
+      FROM transcripts
+      WHERE group_name = ?
+    ''', (group_name,))
+
+    by_scaffold = {}
+    for row in cursor:
+      key = (group_name, row['seqid'], row['strand'])
+      by_scaffold.setdefault(key, []).append((row['tstart'], row['tend'], row['name']))
+
+    for key, transcripts in by_scaffold.items():
+      self._intervals[key] = IntervalIndex(transcripts)
+
+  def _cache_filename(self, gff_filename, mapping):
+    '''
+    Determine name of cache file for given GFF file and mapping. The key
+    changes whenever the GFF file is modified or a different set of transcripts
+    is mapped.
+    '''
+    gff_stat = os.stat(gff_filename)
+    names_hash = hashlib.sha1()
+    for name in sorted(self._retrieve_transcript_names(mapping)):
+      names_hash.update(name.encode('utf-8') + b'\n')
+
+    key = hashlib.sha1()
+    for component in (
+      os.path.abspath(gff_filename),
+      gff_stat.st_size,
+      gff_stat.st_mtime,
+      names_hash.hexdigest(),
+    ):
+      key.update(repr(component).encode('utf-8') + b'\n')
+
+    return os.path.join(self._cache_dir, 'transcripts.%s.sqlite' % key.hexdigest())
+
+  def _load_cache(self, cache_filename, group_name):
+    cursor = self._cursor()
+    cursor.execute('ATTACH DATABASE ? AS cache', (cache_filename,))
+    cursor.execute('''
+      INSERT INTO transcripts (group_name, name, seqid, tstart, tend, strand)
+      SELECT ?, name, seqid, tstart, tend, strand FROM cache.transcripts
+    ''', (group_name,))
+    self._commit()
+    cursor.execute('DETACH DATABASE cache')
+
+  def _write_cache(self, cache_filename, group_name):
+    if not os.path.isdir(self._cache_dir):
+      try:
+        os.makedirs(self._cache_dir)
+      except OSError:
+        # Another process may have created the directory concurrently.
+        if not os.path.isdir(self._cache_dir):
+          raise
+
+    # Write to temporary file, then rename, so that concurrent runs never
+    # attach a partially written cache.
+    temp_filename = '%s.%s.tmp' % (cache_filename, os.getpid())
+    cursor = self._cursor()
+    cursor.execute('ATTACH DATABASE ? AS cache', (temp_filename,))
+    cursor.execute('''CREATE TABLE cache.transcripts AS
+      SELECT name, seqid, tstart, tend, strand
+      FROM transcripts
+      WHERE group_name = ?
+    ''', (group_name,))
+    self._commit()
+    cursor.execute('DETACH DATABASE cache')
+    os.rename(temp_filename, cache_filename)
+
   def parse(self, gff_filename, mapping, group_name):
-    transcripts = self._parse_gff(gff_filename, mapping)
-    self._insert_transcripts(transcripts, group_name)
+    start_time = time.time()
+
+    if self._cache_dir is None:
+      cache_state = 'uncached'
+      self._insert_transcripts(self._parse_gff(gff_filename, mapping), group_name)
+    else:
+      cache_filename = self._cache_filename(gff_filename, mapping)
+      if os.path.exists(cache_filename):
+        cache_state = 'warm'
+        self._load_cache(cache_filename, group_name)
+      else:
+        cache_state = 'cold'
+        self._insert_transcripts(self._parse_gff(gff_filename, mapping), group_name)
+        self._write_cache(cache_filename, group_name)
+
+    self._index_transcripts(group_name)
+    sys.stderr.write('Loaded transcripts for %s from %s in %.2f s (%s)\n' % (
+      group_name,
+      gff_filename,
+      time.time() - start_time,
+      cache_state,
+    ))
+
+  def iter_strands(self, group_name):
+    '''
+    Yield (seqid, strand, transcripts) for each strand of each scaffold
+    holding transcripts from `group_name`, where transcripts is as returned by
+    IntervalIndex.transcripts().
+    '''
+    for key in sorted(self._intervals.keys()):
+      if key[0] == group_name:
+        yield (key[1], key[2], self._intervals[key].transcripts())
 
   def close(self):
     self._conn.close()
@@ -130,6 +302,14 @@ class TranscriptManager(object):
     result = cursor.fetchone()
     row['intervening_genes'] = result['intervening_genes']
 
+  def _count_intervening_genes(self, row, excluded_names):
+    intervals = self._intervals[(row['group_name'], row['seqid'], row['strand'])]
+    row['intervening_genes'] = intervals.count_overlapping(
+      row['group_start'],
+      row['group_end'],
+      excluded_names
+    )
+
   def find_scaffolds(self, transcript_names):
     cursor = self._cursor()
     placeholders     = ', '.join(['?' for t in transcript_names])
@@ -157,9 +337,17 @@ class TranscriptManager(object):
     )
     rows = cursor.fetchall()
     rows = [dict(r) for r in rows]
+    excluded_names = set(transcript_names)
     for row in rows:
-      self._determine_intervening_genes(row, placeholders, transcript_names)
+      if self._use_sql_overlaps:
+        self._determine_intervening_genes(row, placeholders, transcript_names)
+      else:
+        self._count_intervening_genes(row, excluded_names)
+
+    self._check_scaffold_rows(rows, transcript_names)
+    return rows
 
+  def _check_scaffold_rows(self, rows, transcript_names):
     # As any transcripts not in DB for "WHERE t1.name IN (...)" will silently
     # be omitted from SQL result set, we must ensure that the sizes of the
     # query and results sets match.
@@ -167,7 +355,64 @@ class TranscriptManager(object):
     assert transcripts_on_scaffolds_sum == len(transcript_names), \
       'Some transcripts lack associated scaffolds (%s, %s)' % (transcripts_on_scaffolds_sum, len(transcript_names))
 
-    return rows
+  def find_all_scaffolds(self, transcript_name_sets):
+    '''
+    Bulk equivalent of find_scaffolds(). Argument `transcript_name_sets` is a
+    list of transcript name lists; returned is a list of the same length, each
+    element of which holds the rows that find_scaffolds() would return for the
+    corresponding name list.
+
+    Rather than issuing one query per name list, all lists are loaded into a
+    temporary table so that every scaffold count is computed by a single
+    grouped join.
+    '''
+    cursor = self._cursor()
+    # The primary key drops names repeated within a list, which "IN (...)"
+    # would match only once.
+    cursor.execute('CREATE TEMP TABLE members (member_set INTEGER, name TEXT, PRIMARY KEY (member_set, name))')
+    cursor.executemany('INSERT OR IGNORE INTO members (member_set, name) VALUES (?, ?)', (
+      (i, name) for i, names in enumerate(transcript_name_sets) for name in names
+    ))
+    cursor.execute('''CREATE TEMP TABLE scaffold_totals AS
+      SELECT seqid, strand, COUNT(*) AS total
+      FROM transcripts
+      GROUP BY seqid, strand
+    ''')
+    cursor.execute('''
+      SELECT
+        m.member_set,
+        t1.group_name,
+        t1.seqid,
+        t1.strand,
+        COUNT(t1.seqid) AS orthologues_on_scaffold_count,
+        s.total         AS transcripts_on_scaffold_count,
+        MIN(t1.tstart)  AS group_start,
+        MAX(t1.tend)    AS group_end
+      FROM members m
+      JOIN transcripts t1     ON t1.name = m.name
+      JOIN scaffold_totals s  ON s.seqid = t1.seqid AND s.strand = t1.strand
+      GROUP BY m.member_set, t1.seqid, t1.strand, t1.group_name
+      ORDER BY m.member_set, t1.group_name, t1.seqid, t1.strand
+    ''')
+
+    results = [[] for names in transcript_name_sets]
+    for r in cursor.fetchall():
+      row = dict(r)
+      results[row.pop('member_set')].append(row)
+    cursor.execute('DROP TABLE temp.members')
+    cursor.execute('DROP TABLE temp.scaffold_totals')
+
+    for names, rows in zip(transcript_name_sets, results):
+      placeholders   = ', '.join(['?' for t in names])
+      excluded_names = set(names)
+      for row in rows:
+        if self._use_sql_overlaps:
+          self._determine_intervening_genes(row, placeholders, names)
+        else:
+          self._count_intervening_genes(row, excluded_names)
+      self._check_scaffold_rows(rows, names)
+
+    return results
 
 
 # Natural sorting technique taken from http://stackoverflow.com/a/2669120/1691611.
@@ -176,61 +421,106 @@ class TranscriptManager(object):
   #alphanum_key = lambda key:  [convert(c) for c in re.split('([0-9]+)', key)]
   #scaffold_counts.sort(key=lambda c: alphanum_key(c[1]))
 
-def process_ortho_group(ogroup, mappings, transcript_manager):
-  for gname in ogroup.keys():
-    transcripts = []
-    for seqname, score in ogroup[gname]:
-      orig_full_name = mappings[gname][seqname]
-      orig_name      = orig_full_name.split()[0]
-      transcripts.append(orig_name)
-
-    for row in transcript_manager.find_scaffolds(transcripts):
-      print('%s %-20s %-4s %2s %2s %-5s %s' % (
-        row['group_name'],
-        row['seqid'],
-        row['strand'],
-        row['orthologues_on_scaffold_count'],
-        row['transcripts_on_scaffold_count'],
-        # Boolean indicating whether orthologues tandemly arrayed.
-        row['intervening_genes'] == 0,
-        row['intervening_genes'],
-      ))
-
-def process_ortho_groups(ortho_groups, mappings, transcript_manager):
-  already_printed_first = False
+def map_transcript_names(ogroup, gname, mappings):
+  transcripts = []
+  for seqname, score in ogroup[gname]:
+    orig_full_name = mappings[gname][seqname]
+    orig_name      = orig_full_name.split()[0]
+    transcripts.append(orig_name)
+  return transcripts
+
+def print_scaffold_rows(rows):
+  for row in rows:
+    print('%s %-20s %-4s %2s %2s %-5s %s' % (
+      row['group_name'],
+      row['seqid'],
+      row['strand'],
+      row['orthologues_on_scaffold_count'],
+      row['transcripts_on_scaffold_count'],
+      # Boolean indicating whether orthologues tandemly arrayed.
+      row['intervening_genes'] == 0,
+      row['intervening_genes'],
+    ))
+
+def present_genomes(ogroup, genomes):
+  # Groups spanning several genomes lack keys for genomes with no members.
+  return [gname for gname in genomes if gname in ogroup]
+
+def process_ortho_group(ogroup, mappings, transcript_manager, genomes=('a', 'b')):
+  for gname in present_genomes(ogroup, genomes):
+    transcripts = map_transcript_names(ogroup, gname, mappings)
+    print_scaffold_rows(transcript_manager.find_scaffolds(transcripts))
+
+def find_multi_member_groups(ortho_groups, genomes=('a', 'b')):
+  # We aren't interested in 1:1 relationships between orthologues, as we
+  # already know each orthologue lies on a single scaffold.
+  return [g for g in ortho_groups if any([len(g.get(gname, [])) > 1 for gname in genomes])]
+
+def process_ortho_groups(ortho_groups, mappings, transcript_manager, bulk=True, genomes=('a', 'b')):
+  '''
+  Print scaffold contiguity of each group that is not 1:1. If `bulk` is True,
+  scaffolds for all groups are found in a single pass before any output is
+  written; otherwise, groups are queried one at a time. Output is identical in
+  either case.
+  '''
+  ortho_groups = find_multi_member_groups(ortho_groups, genomes)
+
+  if bulk:
+    name_sets = []
+    for ogroup in ortho_groups:
+      for gname in present_genomes(ogroup, genomes):
+        name_sets.append(map_transcript_names(ogroup, gname, mappings))
+    scaffold_rows = iter(transcript_manager.find_all_scaffolds(name_sets))
 
   for i, ogroup in enumerate(ortho_groups):
-    a_len, b_len = len(ogroup['a']), len(ogroup['b'])
-    # We aren't interested in 1:1 relationships between orthologues, as we
-    # already know each orthologue lies on a single scaffold.
-    if a_len == b_len == 1:
-      continue
-
-    if already_printed_first:
+    if i > 0:
       print('')
+    print('Group (%s = %s)' % (
+      ':'.join(genomes),
+      ':'.join([str(len(ogroup.get(gname, []))) for gname in genomes]),
+    ))
+
+    if bulk:
+      for gname in present_genomes(ogroup, genomes):
+        print_scaffold_rows(next(scaffold_rows))
     else:
-      already_printed_first = True
-
-    print('Group (a:b = %s:%s)' % (a_len, b_len))
-    process_ortho_group(ogroup, mappings, transcript_manager)
-
-def examine_contiguity(ortho_groups, transcript_mapping_fnames, transcript_fnames):
-  tm       = TranscriptManager()
+      process_ortho_group(ogroup, mappings, transcript_manager, genomes)
+
+def examine_contiguity(ortho_groups, transcript_mapping_fnames, transcript_fnames, use_sql_overlaps=False, bulk=True, cache_dir=None, genomes=('a', 'b')):
+  '''
+  Print scaffold contiguity of orthologous groups spanning `genomes`, each of
+  which is a key into `transcript_mapping_fnames` and `transcript_fnames`.
+  '''
+  tm       = TranscriptManager(use_sql_overlaps, cache_dir)
   mappings = {}
 
-  for gname in ('a', 'b'):
+  for gname in genomes:
     with open(transcript_mapping_fnames[gname]) as f:
       mappings[gname] = json.load(f)
     tm.parse(transcript_fnames[gname], mappings[gname], gname)
 
-  process_ortho_groups(ortho_groups, mappings, tm)
+  process_ortho_groups(ortho_groups, mappings, tm, bulk, genomes)
 
 def main():
-  transcript_mapping_fnames = {'a': sys.argv[1], 'b': sys.argv[2]}
-  transcript_fnames         = {'a': sys.argv[3], 'b': sys.argv[4]}
-
-  ortho_groups = json.load(sys.stdin)['groups']
-  examine_contiguity(ortho_groups, transcript_mapping_fnames, transcript_fnames)
+  parser = argparse.ArgumentParser(description='Examine contiguity of transcripts in orthologous groups.')
+  parser.add_argument('name_map_a',   help='Name mapping JSON file for first genome')
+  parser.add_argument('name_map_b',   help='Name mapping JSON file for second genome')
+  parser.add_argument('annotation_a', help='Annotation GFF3 file for first genome')
+  parser.add_argument('annotation_b', help='Annotation GFF3 file for second genome')
+  parser.add_argument('--sql-overlaps', dest='use_sql_overlaps', action='store_true',
+    help='Count intervening genes via SQLite rather than the interval index (for cross-checking)')
+  parser.add_argument('--per-group', dest='bulk', action='store_false',
+    help='Query scaffolds one group at a time rather than for all groups at once')
+  parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+    help='Directory in which to cache transcripts parsed from annotation files')
+  args = parser.parse_args()
+
+  transcript_mapping_fnames = {'a': args.name_map_a,   'b': args.name_map_b}
+  transcript_fnames         = {'a': args.annotation_a, 'b': args.annotation_b}
+
+  # Groups are consumed lazily, so only those that aren't 1:1 are retained.
+  ortho_groups = inparanoid_groups.iter_groups(sys.stdin)
+  examine_contiguity(ortho_groups, transcript_mapping_fnames, transcript_fnames, args.use_sql_overlaps, args.bulk, args.cache_dir)
 
 if __name__ == '__main__':
   #import cProfile
@@ -2,18 +2,31 @@
 '''
 Filter isoforms, retaining only the longest amino acid sequence for each gene.
 
-Usage: filter_isoforms.py <input FASTA file> <delimiter>
+Usage: filter_isoforms.py [--spill-dir <dir>] <input FASTA file> <delimiter>
 
 For each FASTA header, the script will split on whitespace, then take the first
 field as the sequence ID. It will set the gene ID to be everything preceding
 the *last* occurrence of <delimiter> in the sequence ID. For each distinct gene
 ID, it will then output the longest corresponding sequence from amongst the set
-sharing the same gene ID.
+sharing the same gene ID. Where several isoforms share the maximum length, the
+first is output. Genes are output in the order in which their chosen isoforms
+appear in the input.
+
+The input is read only once, so <input FASTA file> may be "-" to read from
+stdin. Gzip-compressed input is detected automatically. By default, the longest
+isoform seen thus far for each gene is held in memory; if --spill-dir is given,
+these sequences are instead written to a temporary file in that directory, so
+that only their offsets are held in memory.
 '''
 
+import argparse
+import gzip
+import os
 import sys
-from collections import defaultdict
-from dregs import binf
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import fasta
 
 def determine_gene_and_isoform_ids(seq_id, delimiter):
   gene_id, isoform_id = seq_id.rsplit(delimiter, 1)
@@ -25,46 +38,102 @@ def extract_ids(header, delimiter):
   gene_id, isoform_id = determine_gene_and_isoform_ids(seq_id, delimiter)
   return (seq_id, gene_id, isoform_id)
 
-def calculate_sequence_lengths(in_file, delimiter):
-  seq_lengths = defaultdict(lambda: defaultdict(int))
-
-  for header, seq in binf.parse_fasta(in_file):
-    seq_id, gene_id, isoform_id = extract_ids(header, delimiter)
-    seq_lengths[gene_id][isoform_id] = len(seq)
-
-  return seq_lengths
-
-def find_max_isoform_length_for_gene(gene_id, seq_lengths):
-  return max(seq_lengths[gene_id].values())
-
-def print_longest_isoforms_for_each_gene(in_file, delimiter, seq_lengths):
-  for header, seq in binf.parse_fasta(in_file):
+def open_input(input_fasta_filename):
+  if input_fasta_filename == '-':
+    return sys.stdin
+
+  with open(input_fasta_filename, 'rb') as in_file:
+    is_gzipped = in_file.read(2) == b'\x1f\x8b'
+  if not is_gzipped:
+    return open(input_fasta_filename)
+  if sys.version_info[0] >= 3:
+    return gzip.open(input_fasta_filename, 'rt')
+  return gzip.open(input_fasta_filename)
+
+class InMemoryStore(object):
+  '''
+  Hold candidate sequences in memory.
+  '''
+  def put(self, header, seq):
+    return (header, seq)
+
+  def get(self, record):
+    return record
+
+  def close(self):
+    pass
+
+class SpillStore(object):
+  '''
+  Write candidate sequences to a temporary file, returning only their offsets
+  for retention in memory. Sequences that are later superseded by a longer
+  isoform remain in the file, but are never read back.
+  '''
+  def __init__(self, spill_dir):
+    self._spill_file = tempfile.TemporaryFile(mode='w+b', dir=spill_dir)
+
+  def put(self, header, seq):
+    record = ('%s\n%s' % (header, seq)).encode('utf-8')
+    self._spill_file.seek(0, 2)
+    offset = self._spill_file.tell()
+    self._spill_file.write(record)
+    return (offset, len(record))
+
+  def get(self, record):
+    offset, length = record
+    self._spill_file.seek(offset)
+    header, seq = self._spill_file.read(length).decode('utf-8').split('\n', 1)
+    return (header, seq)
+
+  def close(self):
+    self._spill_file.close()
+
+def find_longest_isoforms(in_file, delimiter, store):
+  '''
+  Return list of stored records for the longest isoform of each gene, ordered
+  by position of the isoform in the input.
+  '''
+  # Maps gene ID to (record index, sequence length, stored record).
+  longest = {}
+
+  for idx, (header, seq) in enumerate(fasta.parse_fasta(in_file)):
     seq_id, gene_id, isoform_id = extract_ids(header, delimiter)
-    if gene_id not in seq_lengths:
-      continue
+    # Strict comparison means that the first of several equally long isoforms
+    # is retained.
+    if gene_id not in longest or len(seq) > longest[gene_id][1]:
+      longest[gene_id] = (idx, len(seq), store.put(header, seq))
 
-    max_isoform_len = find_max_isoform_length_for_gene(gene_id, seq_lengths)
+  return [record for idx, seq_len, record in sorted(longest.values())]
 
-    if len(seq) == max_isoform_len:
-      binf.write_fasta_seq(sys.stdout, header, seq)
-      # To mark a given gene as already having had its longest isoform printed,
-      # remove the gene from seq_lengths.
-      del seq_lengths[gene_id]
+def print_longest_isoforms_for_each_gene(in_file, delimiter, store):
+  with fasta.FastaWriter(sys.stdout) as writer:
+    for record in find_longest_isoforms(in_file, delimiter, store):
+      header, seq = store.get(record)
+      writer.write(header, seq)
 
 def main():
-  # Can't use stdin, as must read *twice* -- first to calculate length of each
-  # sequence, and then to output longest sequence for each.
-  input_fasta_filename = sys.argv[1]
-
+  parser = argparse.ArgumentParser(description='Retain only longest isoform for each gene.')
+  parser.add_argument('input_fasta_filename', help='Input FASTA file, or "-" for stdin')
   # Delimiter: character after whose final occurrence the isoform-specific
   # identifier occurs. Sequences sharing the same pre-delimiter sequence are
   # considered isoforms of one another.
-  delimiter = sys.argv[2]
-
-  with open(input_fasta_filename) as in_file:
-    seq_lengths = calculate_sequence_lengths(in_file, delimiter)
-    in_file.seek(0)
-    print_longest_isoforms_for_each_gene(in_file, delimiter, seq_lengths)
+  parser.add_argument('delimiter', help='Delimiter preceding isoform-specific identifier')
+  parser.add_argument('--spill-dir', dest='spill_dir', action='store',
+    help='Hold candidate sequences in a temporary file in this directory rather than in memory')
+  args = parser.parse_args()
+
+  if args.spill_dir:
+    store = SpillStore(args.spill_dir)
+  else:
+    store = InMemoryStore()
+
+  in_file = open_input(args.input_fasta_filename)
+  try:
+    print_longest_isoforms_for_each_gene(in_file, args.delimiter, store)
+  finally:
+    store.close()
+    if in_file is not sys.stdin:
+      in_file.close()
 
 if __name__ == '__main__':
   main()
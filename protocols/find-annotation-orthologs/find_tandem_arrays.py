@@ -0,0 +1,245 @@
+#!/usr/bin/env python2
+'''
+Find tandem arrays of orthologous group members across every scaffold of both
+genomes in a single pass, rather than group by group as
+examine_transcript_groups.py does.
+
+Usage: find_tandem_arrays.py [options] <name map A> <name map B> \
+         <annotation A> <annotation B> < <groups file>
+
+Groups are read from stdin, in either format written by parse_inparanoid.py.
+Transcripts on each strand of each scaffold are swept once in order of start
+coordinate, splitting them into runs of consecutive transcripts belonging to
+the same group. A run is isolated if no transcript outside it overlaps the
+span from its first start to its last end, in the sense used by
+examine_transcript_groups.py to count intervening genes; a tandem cluster is
+an isolated run of two or more members.
+
+Each scaffold strand holding two or more members of a group is classed as:
+
+  * alone: the members are the only transcripts on the strand
+  * tandem: the members form a single isolated run, alongside other transcripts
+  * interrupted: other transcripts lie among or overlap the members
+
+These are the classes shown in figures/orthologous-groups/ortho_tandem.svg,
+whose totals for each genome are written to stderr. Writes the following files
+to the output directory:
+
+  * tandem-clusters: one row per tandem cluster
+  * tandem-groups: one row per group and genome, counting the classes of the
+    group's scaffold strands and its clusters. Groups are numbered from 1 in
+    input order.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import examine_transcript_groups
+import inparanoid_groups
+
+CLASSES = ('alone', 'tandem', 'interrupted')
+
+def sweep_strand(transcripts, member_groups):
+  '''
+  Return (group, first, last, isolated) for each run of consecutive
+  transcripts belonging to the same group, where `transcripts` is a list of
+  (tstart, tend, name) tuples sorted by start, `member_groups` maps transcript
+  names to groups, and first and last are indices into `transcripts`.
+  Transcripts belonging to no group form no runs.
+  '''
+  runs = []
+  # Furthest end of any transcript preceding the current run.
+  reach = None
+  count = len(transcripts)
+  i = 0
+
+  while i < count:
+    group = member_groups.get(transcripts[i][2])
+    j = i
+    run_end = transcripts[i][1]
+    if group is not None:
+      while j + 1 < count and member_groups.get(transcripts[j + 1][2]) == group:
+        j += 1
+        run_end = max(run_end, transcripts[j][1])
+      run_start = transcripts[i][0]
+      isolated = (reach is None or reach <= run_start) and (j + 1 == count or transcripts[j + 1][0] >= run_end)
+      runs.append((group, i, j, isolated))
+
+    reach = run_end if reach is None else max(reach, run_end)
+    i = j + 1
+
+  return runs
+
+def classify_strand(runs, transcript_count):
+  '''
+  Return dictionary mapping each group with two or more members among `runs`
+  on a single strand to its class.
+  '''
+  by_group = {}
+  for run in runs:
+    by_group.setdefault(run[0], []).append(run)
+
+  classes = {}
+  for group, group_runs in by_group.items():
+    member_count = sum([last - first + 1 for g, first, last, isolated in group_runs])
+    if member_count < 2:
+      continue
+    if member_count == transcript_count:
+      classes[group] = 'alone'
+    elif len(group_runs) == 1 and group_runs[0][3]:
+      classes[group] = 'tandem'
+    else:
+      classes[group] = 'interrupted'
+  return classes
+
+def map_members(ortho_groups, mappings, genome):
+  '''
+  Return dictionary mapping each transcript from `genome` to the number of its
+  group, counting from 1.
+  '''
+  member_groups = {}
+  for group_id, ogroup in enumerate(ortho_groups, 1):
+    if genome not in ogroup:
+      continue
+    for name in examine_transcript_groups.map_transcript_names(ogroup, genome, mappings):
+      member_groups[name] = group_id
+  return member_groups
+
+def find_tandem_arrays(ortho_groups, mappings, transcript_manager, genomes=('a', 'b')):
+  '''
+  Return (clusters, group_stats). clusters lists dictionaries describing each
+  tandem cluster, while group_stats maps (group, genome) to a dictionary of
+  counts for each group with members from genome.
+  '''
+  clusters = []
+  group_stats = {}
+
+  for genome in genomes:
+    member_groups = map_members(ortho_groups, mappings, genome)
+    for group_id in set(member_groups.values()):
+      group_stats[(group_id, genome)] = dict(
+        [(k, 0) for k in ('members', 'strands', 'clusters', 'clustered_members') + CLASSES]
+      )
+
+    found = 0
+    for seqid, strand, transcripts in transcript_manager.iter_strands(genome):
+      runs = sweep_strand(transcripts, member_groups)
+      for group_id in set([r[0] for r in runs]):
+        group_stats[(group_id, genome)]['strands'] += 1
+
+      for group_id, first, last, isolated in runs:
+        stats = group_stats[(group_id, genome)]
+        stats['members'] += last - first + 1
+        found += last - first + 1
+        if isolated and last > first:
+          stats['clusters'] += 1
+          stats['clustered_members'] += last - first + 1
+          clusters.append({
+            'group':   group_id,
+            'genome':  genome,
+            'seqid':   seqid,
+            'strand':  strand,
+            'start':   transcripts[first][0],
+            'end':     max([t[1] for t in transcripts[first:last + 1]]),
+            'members': [t[2] for t in transcripts[first:last + 1]],
+          })
+
+      for group_id, strand_class in classify_strand(runs, len(transcripts)).items():
+        group_stats[(group_id, genome)][strand_class] += 1
+
+    assert found == len(member_groups), \
+      'Some transcripts lack associated scaffolds (%s, %s)' % (found, len(member_groups))
+
+  clusters.sort(key = lambda c: (c['group'], genomes.index(c['genome']), c['seqid'], c['strand'], c['start']))
+  return (clusters, group_stats)
+
+def write_clusters(clusters, out_file):
+  out_file.write('\t'.join(('group', 'genome', 'seqid', 'strand', 'start', 'end', 'member_count', 'members')) + '\n')
+  for c in clusters:
+    out_file.write('\t'.join([str(v) for v in (
+      c['group'],
+      c['genome'],
+      c['seqid'],
+      c['strand'],
+      c['start'],
+      c['end'],
+      len(c['members']),
+      ','.join(c['members']),
+    )]) + '\n')
+
+def write_group_stats(group_stats, out_file, genomes=('a', 'b')):
+  columns = ('members', 'strands') + CLASSES + ('clusters', 'clustered_members')
+  out_file.write('\t'.join(('group', 'genome') + columns + ('has_cluster', 'all_tandem')) + '\n')
+  for group_id, genome in sorted(group_stats.keys(), key = lambda k: (k[0], genomes.index(k[1]))):
+    stats = group_stats[(group_id, genome)]
+    # Whether every strand holding several members has them in one run, as
+    # reported per scaffold by examine_transcript_groups.py.
+    all_tandem = stats['interrupted'] == 0 and stats['alone'] + stats['tandem'] > 0
+    out_file.write('\t'.join(
+      [str(group_id), genome] +
+      [str(stats[c]) for c in columns] +
+      [str(stats['clusters'] > 0), str(all_tandem)]
+    ) + '\n')
+
+def write_class_totals(group_stats, genomes=('a', 'b')):
+  for genome in genomes:
+    totals = dict([(c, 0) for c in CLASSES])
+    for (group_id, g), stats in group_stats.items():
+      if g == genome:
+        for c in CLASSES:
+          totals[c] += stats[c]
+    sys.stderr.write('%s: scaffold strands with several members of a group: %s\n' % (
+      genome,
+      ', '.join(['%s %s' % (totals[c], c) for c in CLASSES]),
+    ))
+
+def run(ortho_groups, transcript_mapping_fnames, transcript_fnames, output_dir, cache_dir=None, genomes=('a', 'b')):
+  '''
+  Find tandem arrays of orthologous groups spanning `genomes`, each of which is
+  a key into `transcript_mapping_fnames` and `transcript_fnames`, writing
+  results to `output_dir`.
+  '''
+  tm       = examine_transcript_groups.TranscriptManager(cache_dir=cache_dir)
+  mappings = {}
+  for gname in genomes:
+    with open(transcript_mapping_fnames[gname]) as f:
+      mappings[gname] = json.load(f)
+    tm.parse(transcript_fnames[gname], mappings[gname], gname)
+
+  start_time = time.time()
+  ortho_groups = list(ortho_groups)
+  clusters, group_stats = find_tandem_arrays(ortho_groups, mappings, tm, genomes)
+  tm.close()
+  sys.stderr.write('Found %s tandem clusters among %s groups in %.2f s\n' % (len(clusters), len(ortho_groups), time.time() - start_time))
+  write_class_totals(group_stats, genomes)
+
+  with open(os.path.join(output_dir, 'tandem-clusters'), 'w') as out_file:
+    write_clusters(clusters, out_file)
+  with open(os.path.join(output_dir, 'tandem-groups'), 'w') as out_file:
+    write_group_stats(group_stats, out_file, genomes)
+
+def main():
+  parser = argparse.ArgumentParser(description='Find tandem arrays of orthologous group members.')
+  parser.add_argument('name_map_a',   help='Name mapping JSON file for first genome')
+  parser.add_argument('name_map_b',   help='Name mapping JSON file for second genome')
+  parser.add_argument('annotation_a', help='Annotation GFF3 file for first genome')
+  parser.add_argument('annotation_b', help='Annotation GFF3 file for second genome')
+  parser.add_argument('-d', '--output-dir', dest='output_dir', action='store', default='.',
+    help='Directory in which to write results')
+  parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+    help='Directory in which to cache transcripts parsed from annotation files')
+  args = parser.parse_args()
+
+  run(
+    inparanoid_groups.iter_groups(sys.stdin),
+    {'a': args.name_map_a,   'b': args.name_map_b},
+    {'a': args.annotation_a, 'b': args.annotation_b},
+    args.output_dir,
+    args.cache_dir,
+  )
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python2
+'''
+Merge pairwise orthologous groups from several InParanoid runs into groups
+spanning any number of genomes, then write them to an indexed SQLite store.
+
+Usage: group_store.py <store> <genome A> <genome B> <groups file> \
+         [<genome A> <genome B> <groups file> ...]
+
+Each <groups file> holds the output of parse_inparanoid.py (in either format)
+for a comparison of <genome A> against <genome B>. Sequences placed in the same
+group by any comparison are placed in the same merged group, so that groups
+linked through shared members across comparisons are merged transitively.
+Each member's score is the highest it received in any comparison.
+
+Merged groups take the same form as pairwise ones, save that they are keyed
+by genome ID rather than by "a" and "b", and lack keys for genomes with no
+members in the group. Read them with GroupStore.
+'''
+
+import sqlite3
+import sys
+
+import inparanoid_groups
+
+class UnionFind(object):
+  '''
+  Disjoint sets of hashable items, with path compression.
+  '''
+  def __init__(self):
+    self._parents = {}
+
+  def add(self, item):
+    if item not in self._parents:
+      self._parents[item] = item
+
+  def find(self, item):
+    root = item
+    while self._parents[root] != root:
+      root = self._parents[root]
+    while self._parents[item] != root:
+      self._parents[item], item = root, self._parents[item]
+    return root
+
+  def union(self, item_a, item_b):
+    root_a, root_b = self.find(item_a), self.find(item_b)
+    if root_a != root_b:
+      self._parents[root_b] = root_a
+
+def merge_pairwise(sources):
+  '''
+  Merge pairwise groups. `sources` is an iterable of (genome A, genome B,
+  groups) tuples. Return (genomes, groups), where genomes lists genome IDs in
+  order of first appearance, and groups lists merged groups in order of their
+  first member's appearance.
+  '''
+  genomes = []
+  components = UnionFind()
+  # Maps (genome, name) to the highest score seen for the sequence.
+  scores = {}
+  # Members in order of first appearance, so that output is deterministic.
+  members = []
+
+  for genome_a, genome_b, groups in sources:
+    for genome in (genome_a, genome_b):
+      if genome not in genomes:
+        genomes.append(genome)
+
+    for group in groups:
+      keys = []
+      for label, genome in (('a', genome_a), ('b', genome_b)):
+        # Members are keyed by genome ID if parse_inparanoid.py was run with
+        # --genomes, and otherwise by "a" and "b".
+        genome_members = group[genome] if genome in group else group[label]
+        for name, score in genome_members:
+          key = (genome, name)
+          if key not in scores:
+            components.add(key)
+            members.append(key)
+            scores[key] = score
+          else:
+            scores[key] = max(scores[key], score)
+          keys.append(key)
+      for key in keys[1:]:
+        components.union(keys[0], key)
+
+  # Maps component root to merged group.
+  merged = {}
+  ordered = []
+  for key in members:
+    root = components.find(key)
+    if root not in merged:
+      merged[root] = {}
+      ordered.append(merged[root])
+    genome, name = key
+    merged[root].setdefault(genome, []).append([name, scores[key]])
+
+  for group in ordered:
+    for genome_members in group.values():
+      genome_members.sort(key = lambda m: (-m[1], m[0]))
+  return (genomes, ordered)
+
+class GroupStore(object):
+  '''
+  Orthologous groups spanning several genomes, held in an SQLite database
+  indexed by both group and member, so that groups may be streamed in order
+  or looked up by any member without reading the whole store.
+  '''
+  def __init__(self, db_fname):
+    self._conn = sqlite3.connect(db_fname)
+    self._conn.row_factory = sqlite3.Row
+
+  def create(self, genomes, groups):
+    cursor = self._conn.cursor()
+    cursor.executescript('''
+      DROP TABLE IF EXISTS genomes;
+      DROP TABLE IF EXISTS members;
+      CREATE TABLE genomes (
+        idx    INTEGER PRIMARY KEY,
+        genome TEXT
+      );
+      CREATE TABLE members (
+        group_id INTEGER,
+        genome   TEXT,
+        name     TEXT,
+        score    REAL,
+        rank     INTEGER
+      );
+    ''')
+    cursor.executemany('INSERT INTO genomes (idx, genome) VALUES (?, ?)', enumerate(genomes))
+
+    def member_rows():
+      for group_id, group in enumerate(groups):
+        for genome in genomes:
+          for rank, (name, score) in enumerate(group.get(genome, [])):
+            yield (group_id, genome, name, score, rank)
+    cursor.executemany('INSERT INTO members (group_id, genome, name, score, rank) VALUES (?, ?, ?, ?, ?)', member_rows())
+
+    # Create indices only after all rows are inserted, which is faster than
+    # maintaining them during insertion.
+    cursor.executescript('''
+      CREATE INDEX members_group ON members (group_id);
+      CREATE INDEX members_name ON members (genome, name);
+    ''')
+    self._conn.commit()
+
+  def genomes(self):
+    return [row['genome'] for row in self._conn.execute('SELECT genome FROM genomes ORDER BY idx')]
+
+  def group_count(self):
+    return self._conn.execute('SELECT COUNT(DISTINCT group_id) FROM members').fetchone()[0]
+
+  def _build_groups(self, rows):
+    '''
+    Yield groups from rows ordered by group ID.
+    '''
+    group_id, group = None, None
+    for row in rows:
+      if row['group_id'] != group_id:
+        if group is not None:
+          yield group
+        group_id, group = row['group_id'], {}
+      group.setdefault(row['genome'], []).append([row['name'], row['score']])
+    if group is not None:
+      yield group
+
+  def iter_groups(self):
+    '''
+    Yield each group in order, reading one row at a time from the store.
+    '''
+    rows = self._conn.execute('''
+      SELECT m.group_id, m.genome, m.name, m.score
+      FROM members m
+      INNER JOIN genomes g ON g.genome = m.genome
+      ORDER BY m.group_id, g.idx, m.rank
+    ''')
+    return self._build_groups(rows)
+
+  def find_group(self, genome, name):
+    '''
+    Return group containing sequence `name` from `genome`, or None if it is in
+    no group.
+    '''
+    rows = self._conn.execute('''
+      SELECT m.group_id, m.genome, m.name, m.score
+      FROM members m
+      INNER JOIN genomes g ON g.genome = m.genome
+      WHERE m.group_id = (SELECT group_id FROM members WHERE genome = ? AND name = ?)
+      ORDER BY g.idx, m.rank
+    ''', (genome, name))
+    for group in self._build_groups(rows):
+      return group
+    return None
+
+  def close(self):
+    self._conn.close()
+
+def iter_sources(args):
+  for i in range(0, len(args), 3):
+    genome_a, genome_b, groups_fname = args[i:i + 3]
+    with open(groups_fname) as groups_file:
+      yield (genome_a, genome_b, inparanoid_groups.iter_groups(groups_file))
+
+def main():
+  store_fname = sys.argv[1]
+  source_args = sys.argv[2:]
+  if len(source_args) == 0 or len(source_args) % 3 != 0:
+    sys.exit('Usage: %s <store> <genome A> <genome B> <groups file> [...]' % sys.argv[0])
+
+  genomes, groups = merge_pairwise(iter_sources(source_args))
+  store = GroupStore(store_fname)
+  store.create(genomes, groups)
+  sys.stderr.write('Stored %s groups spanning %s genomes\n' % (store.group_count(), len(genomes)))
+  store.close()
+
+if __name__ == '__main__':
+  main()
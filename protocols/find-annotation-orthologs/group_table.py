@@ -0,0 +1,329 @@
+#!/usr/bin/env python2
+'''
+Hold orthologous groups from any number of InParanoid runs as columns of
+fixed-width arrays, saved as a directory of .npy files that are memory-mapped
+when loaded, rather than as nested dictionaries of (name, score) lists.
+
+Usage: group_table.py [options] <table dir> <genome A> <genome B> <groups file> \
+         [<genome A> <genome B> <groups file> ...]
+       group_table.py --summary <table dir>
+
+Each <groups file> holds the output of parse_inparanoid.py (in either format)
+for a comparison of <genome A> against <genome B>, and forms one source of
+groups. With --merge, groups are first merged across comparisons as by
+group_store.py, forming a single source spanning all genomes. With --summary,
+an existing table is read, and the cardinality of each source's groups is
+written in the format of summarize_groups.py.
+
+Each row of the table is one member of one group, held as int32 group_id,
+genome and member_id columns and a float32 score column, with rows sorted by
+group, then genome, then in their order in the group. Groups are numbered
+consecutively across sources, with group_source giving the source of each.
+member_id indexes a single table of names, sorted so that names are found by
+binary search, and stored as one block of bytes with the offset of each name.
+Groups are read back keyed as in their source: by "a" and "b" for pairwise
+comparisons, as the existing analyses expect, and by genome ID once merged.
+'''
+
+import argparse
+import array
+import bisect
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import group_store
+import summarize_groups
+
+COLUMNS = (
+  ('group_id',  np.int32),
+  ('genome',    np.int32),
+  ('member_id', np.int32),
+  ('score',     np.float32),
+)
+# Arrays derived from the columns, saved so that loading requires no sorting.
+INDICES = ('group_start', 'group_source', 'member_order', 'name_start', 'name_data')
+
+class NameTable(object):
+  '''
+  Sorted names held as a block of UTF-8 bytes, with `starts[i]` giving the
+  offset of name i and `starts[-1]` the length of the block.
+  '''
+  def __init__(self, data, starts):
+    self.data = data
+    self.starts = starts
+
+  def __len__(self):
+    return len(self.starts) - 1
+
+  def __getitem__(self, i):
+    return self.data[self.starts[i]:self.starts[i + 1]].tobytes().decode('utf-8')
+
+  def find(self, name):
+    '''
+    Return index of `name`, or None if absent.
+    '''
+    i = bisect.bisect_left(self, name)
+    if i < len(self) and self[i] == name:
+      return i
+    return None
+
+def build_name_table(names):
+  '''
+  Return (NameTable, new_ids), where new_ids maps the index of each name in
+  `names` to its index in the sorted table.
+  '''
+  order = sorted(range(len(names)), key = lambda i: names[i])
+  new_ids = np.empty(len(names), dtype=np.int32)
+  new_ids[order] = np.arange(len(names), dtype=np.int32)
+  encoded = [names[i].encode('utf-8') for i in order]
+  starts = np.zeros(len(encoded) + 1, dtype=np.int64)
+  starts[1:] = np.cumsum([len(e) for e in encoded])
+  data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+  return (NameTable(data, starts), new_ids)
+
+class GroupTable(object):
+  '''
+  Columnar orthologous groups, as described above. Views return arrays
+  computed from the columns, creating no Python object per member.
+  '''
+  def __init__(self, genomes, sources, arrays, labels=None):
+    self.genomes = genomes
+    self.sources = sources
+    self.labels = labels or [list(s) for s in sources]
+    # Key under which each genome's members are placed in groups of each source.
+    self._source_keys = [
+      dict(zip([genomes.index(g) for g in source], source_labels))
+      for source, source_labels in zip(self.sources, self.labels)
+    ]
+    for name, dtype in COLUMNS:
+      setattr(self, name, arrays[name])
+    self.group_start = arrays['group_start']
+    self.group_source = arrays['group_source']
+    self.member_order = arrays['member_order']
+    self.names = NameTable(arrays['name_data'], arrays['name_start'])
+
+  def __len__(self):
+    return len(self.member_id)
+
+  def group_count(self):
+    return len(self.group_start) - 1
+
+  def nbytes(self):
+    return sum([a.nbytes for a in self._arrays().values()])
+
+  def _arrays(self):
+    arrays = dict([(name, getattr(self, name)) for name, dtype in COLUMNS])
+    arrays.update({
+      'group_start':  self.group_start,
+      'group_source': self.group_source,
+      'member_order': self.member_order,
+      'name_start':   self.names.starts,
+      'name_data':    self.names.data,
+    })
+    return arrays
+
+  def save(self, table_dir):
+    if not os.path.exists(table_dir):
+      os.makedirs(table_dir)
+    for name, values in self._arrays().items():
+      np.save(os.path.join(table_dir, name + '.npy'), values)
+    with open(os.path.join(table_dir, 'meta.json'), 'w') as meta_file:
+      json.dump({'genomes': self.genomes, 'sources': self.sources, 'labels': self.labels}, meta_file)
+
+  def sizes(self, genome=None):
+    '''
+    Return number of members of each group, counting only those from `genome`
+    if given.
+    '''
+    if genome is None:
+      return np.diff(self.group_start)
+    chosen = self.group_id[self.genome == self.genomes.index(genome)]
+    return np.bincount(chosen, minlength=self.group_count())
+
+  def size_matrix(self, groups=None):
+    '''
+    Return array with a row for each group, or for each of `groups` if given,
+    counting its members from each genome.
+    '''
+    genome_count = len(self.genomes)
+    counts = np.bincount(
+      self.group_id.astype(np.int64) * genome_count + self.genome,
+      minlength=self.group_count() * genome_count,
+    ).reshape(self.group_count(), genome_count)
+    if groups is not None:
+      counts = counts[groups]
+    return counts
+
+  def source_groups(self, source):
+    '''
+    Return IDs of groups from source `source`, an index into `sources`.
+    '''
+    return np.nonzero(self.group_source == source)[0]
+
+  def member_rows(self, group):
+    '''
+    Return slice of rows holding members of `group`.
+    '''
+    return slice(self.group_start[group], self.group_start[group + 1])
+
+  def groups_containing(self, member_ids):
+    '''
+    Return sorted IDs of groups containing any of `member_ids`.
+    '''
+    sorted_members = self.member_id[self.member_order]
+    member_ids = np.asarray(member_ids)
+    lo = np.searchsorted(sorted_members, member_ids, side='left')
+    hi = np.searchsorted(sorted_members, member_ids, side='right')
+    rows = np.concatenate([self.member_order[l:h] for l, h in zip(lo, hi)] or [np.zeros(0, dtype=np.int32)])
+    return np.unique(self.group_id[rows])
+
+  def find_member(self, name):
+    return self.names.find(name)
+
+  def group(self, group):
+    '''
+    Return `group` as a dictionary mapping each genome with members in it to a
+    list of [name, score] pairs, keyed as in its source, so that pairwise
+    groups take the form read by inparanoid_groups.iter_groups() and merged
+    groups that held by GroupStore.
+    '''
+    result = {}
+    keys = self._source_keys[self.group_source[group]]
+    rows = self.member_rows(group)
+    for genome, member_id, score in zip(self.genome[rows], self.member_id[rows], self.score[rows]):
+      result.setdefault(keys[genome], []).append([self.names[member_id], float(score)])
+    return result
+
+  def iter_groups(self, source=None):
+    '''
+    Yield each group, or each from source `source` if given, as group() does.
+    '''
+    groups = range(self.group_count()) if source is None else self.source_groups(source)
+    for group in groups:
+      yield self.group(group)
+
+def load(table_dir, mmap_mode='r'):
+  '''
+  Return GroupTable saved in `table_dir`, with arrays memory-mapped unless
+  `mmap_mode` is None.
+  '''
+  with open(os.path.join(table_dir, 'meta.json')) as meta_file:
+    meta = json.load(meta_file)
+  arrays = {}
+  for name in [c[0] for c in COLUMNS] + list(INDICES):
+    arrays[name] = np.load(os.path.join(table_dir, name + '.npy'), mmap_mode=mmap_mode)
+  return GroupTable(meta['genomes'], meta['sources'], arrays, meta.get('labels'))
+
+class TableBuilder(object):
+  '''
+  Accumulate groups source by source, interning names as they are read.
+  '''
+  def __init__(self):
+    self.genomes = []
+    self.sources = []
+    self.labels = []
+    self.name_ids = {}
+    self.names = []
+    self.columns = dict([(name, array.array(dtype == np.float32 and 'f' or 'i')) for name, dtype in COLUMNS])
+    self.group_source = array.array('i')
+
+  def add_source(self, genomes, groups, labels=None):
+    '''
+    Add groups spanning `genomes`, with the members of each genome keyed by
+    the corresponding entry of `labels`, as the "a" and "b" keys of pairwise
+    groups are, or by genome ID if absent. Groups are read back keyed by
+    `labels`, or by genome ID if `labels` is not given.
+    '''
+    for genome in genomes:
+      if genome not in self.genomes:
+        self.genomes.append(genome)
+    source = len(self.sources)
+    self.sources.append(list(genomes))
+    genome_idxs = [self.genomes.index(g) for g in genomes]
+    labels = labels or genomes
+    self.labels.append(list(labels))
+    columns = self.columns
+
+    for group in groups:
+      group_id = len(self.group_source)
+      self.group_source.append(source)
+      for genome, genome_idx, label in zip(genomes, genome_idxs, labels):
+        for name, score in group.get(label, group.get(genome, [])):
+          if name not in self.name_ids:
+            self.name_ids[name] = len(self.names)
+            self.names.append(name)
+          columns['group_id'].append(group_id)
+          columns['genome'].append(genome_idx)
+          columns['member_id'].append(self.name_ids[name])
+          columns['score'].append(score)
+
+  def build(self):
+    arrays = dict([(name, np.frombuffer(self.columns[name], dtype=dtype)) for name, dtype in COLUMNS])
+    names, new_ids = build_name_table(self.names)
+    arrays['member_id'] = new_ids[arrays['member_id']]
+    group_count = len(self.group_source)
+    arrays['group_start'] = np.searchsorted(arrays['group_id'], np.arange(group_count + 1)).astype(np.int64)
+    arrays['group_source'] = np.frombuffer(self.group_source, dtype=np.int32)
+    arrays['member_order'] = np.argsort(arrays['member_id'], kind='mergesort').astype(np.int32)
+    arrays['name_start'] = names.starts
+    arrays['name_data'] = names.data
+    return GroupTable(self.genomes, self.sources, arrays, self.labels)
+
+def summarize_source(table, source):
+  '''
+  Return dictionary counting groups from `source` in each cardinality class,
+  as summarize_groups.summarize_groups() does.
+  '''
+  genome_idxs = [table.genomes.index(g) for g in table.sources[source]]
+  counts = np.minimum(table.size_matrix(table.source_groups(source))[:, genome_idxs], 2)
+  classes, class_counts = np.unique(counts, axis=0, return_counts=True)
+  return dict([
+    ('_to_'.join([c < 2 and str(c) or 'n' for c in cls]), int(n))
+    for cls, n in zip(classes, class_counts)
+  ])
+
+def main():
+  parser = argparse.ArgumentParser(description='Store orthologous groups as columnar arrays.')
+  parser.add_argument('table_dir', help='Directory holding the table')
+  parser.add_argument('sources', nargs='*', metavar='genome_a genome_b groups_file',
+    help='Genomes compared and output of parse_inparanoid.py for each comparison')
+  parser.add_argument('--merge', dest='merge', action='store_true',
+    help='Merge groups across comparisons as group_store.py does')
+  parser.add_argument('--summary', dest='summary', action='store_true',
+    help='Write cardinality of groups from each source in an existing table')
+  args = parser.parse_args()
+
+  start_time = time.time()
+  if args.summary:
+    table = load(args.table_dir)
+    for source, genomes in enumerate(table.sources):
+      sys.stdout.write('# %s\n' % ' '.join(genomes))
+      summarize_groups.write_summary(summarize_source(table, source), sys.stdout)
+    return
+
+  if len(args.sources) == 0 or len(args.sources) % 3 != 0:
+    parser.error('Sources must be given as genome A, genome B and groups file')
+  builder = TableBuilder()
+  if args.merge:
+    genomes, groups = group_store.merge_pairwise(group_store.iter_sources(args.sources))
+    builder.add_source(genomes, groups)
+  else:
+    for genome_a, genome_b, groups in group_store.iter_sources(args.sources):
+      builder.add_source((genome_a, genome_b), groups, ('a', 'b'))
+  table = builder.build()
+  table.save(args.table_dir)
+  sys.stderr.write('Stored %s members of %s groups from %s sources, with %s names, in %.1f MB of arrays in %.2f s\n' % (
+    len(table),
+    table.group_count(),
+    len(table.sources),
+    len(table.names),
+    table.nbytes() / 1e6,
+    time.time() - start_time,
+  ))
+
+if __name__ == '__main__':
+  main()
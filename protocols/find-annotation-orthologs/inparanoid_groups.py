@@ -0,0 +1,40 @@
+'''
+Read orthologous groups written by parse_inparanoid.py, in either its single
+JSON document format or its newline-delimited (--ndjson) format. The format is
+detected automatically. Newline-delimited input is decoded lazily, one group at
+a time, so consumers that need only a single pass over the groups never hold
+them all in memory.
+'''
+
+import json
+
+def iter_groups(in_file):
+  '''
+  Yield each group from open file object `in_file`.
+  '''
+  first_line = in_file.readline()
+  if first_line == '':
+    # Newline-delimited output for a run that produced no groups.
+    return
+  try:
+    first = json.loads(first_line)
+  except ValueError:
+    # A JSON document spanning several lines, which must be decoded whole.
+    first = json.loads(first_line + in_file.read())
+
+  if 'groups' in first:
+    for group in first['groups']:
+      yield group
+    return
+
+  yield first
+  for line in in_file:
+    if line.strip() == '':
+      continue
+    yield json.loads(line)
+
+def load_groups(in_file):
+  '''
+  Return list of all groups from open file object `in_file`.
+  '''
+  return list(iter_groups(in_file))
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
 import json
+import os
 import sys
-from dregs import binf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import fasta
 
 def main():
   seq_set_id = sys.argv[1]
@@ -13,11 +16,12 @@ def main():
   count = 1
 
   with open(munged_fasta_filename, 'w') as munged_fasta_file:
-    for seq_id, seq in binf.parse_fasta(sys.stdin):
-      new_name = '%s_prot%s' % (seq_set_id, count)
-      name_mapping[new_name] = seq_id
-      binf.write_fasta_seq(munged_fasta_file, new_name, seq)
-      count += 1
+    with fasta.FastaWriter(munged_fasta_file) as writer:
+      for seq_id, seq in fasta.parse_fasta(sys.stdin):
+        new_name = '%s_prot%s' % (seq_set_id, count)
+        name_mapping[new_name] = seq_id
+        writer.write(new_name, seq)
+        count += 1
 
   with open(mapping_filename, 'w') as mapping_file:
     json.dump(name_mapping, mapping_file)
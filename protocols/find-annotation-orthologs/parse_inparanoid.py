@@ -6,9 +6,19 @@ them to a JSON file Unfortunately, only the human-readable output (as well as
 the HTML file containing the same information) list all InParanoid results; the
 table and CSV file both lack data.
 
-Usage: parse_paranoid.py <InParanoid results file>
+Usage: parse_paranoid.py [--ndjson] [--genomes <A> <B>] <InParanoid results file>
+
+If --ndjson is specified, each group is written as a separate JSON document on
+its own line as soon as it is parsed, so that memory use does not grow with the
+number of groups. Otherwise, all groups are written in a single JSON document.
+Use inparanoid_groups.iter_groups() to read either format.
+
+Groups' members are keyed by "a" and "b", unless --genomes is given, in which
+case they are keyed by the two genome IDs, as in groups read from a store built
+by group_store.py.
 '''
 
+import argparse
 import sys
 import json
 
@@ -19,24 +29,38 @@ class NoTransitionError(Exception):
   pass
 
 class StateMachine(object):
-  def __init__(self, input_file):
+  def __init__(self, input_file, labels=('a', 'b')):
     '''
     Initialize. Argument `input_file` corresponds to open file object.
+    Argument `labels` gives the keys under which members from the first and
+    second genomes are stored in each group.
     '''
     self._input_file = input_file
+    self._labels = labels
     self._state = self._file_header
 
-  def run(self):
+  def iter_groups(self):
     '''
-    Run state machine against results file, populating self._results.
+    Run state machine against results file, yielding each group as soon as it
+    has been parsed. Groups are not retained once yielded.
     '''
+    self._completed_groups = []
+
     for line in self._input_file:
       # Strip trailing newline.
       self._current_line = line[:-1]
       self._state(self._current_line)
 
+      for group in self._completed_groups:
+        yield group
+      self._completed_groups = []
+
+  def run(self):
+    '''
+    Run state machine against results file, populating self._results.
+    '''
     self._results = {
-      'groups': self._groups,
+      'groups': list(self.iter_groups()),
     }
 
   def results(self):
@@ -79,7 +103,6 @@ class StateMachine(object):
   ########
   def _file_header(self, line):
     if self._is_separator(line):
-      self._groups = []
       self._switch(self._new_group, True)
     else:
       # Do nothing on file header lines.
@@ -91,7 +114,7 @@ class StateMachine(object):
       raise NoTransitionError()
 
     self._switch(self._group_header)
-    self._current_group = {'a': [], 'b': []}
+    self._current_group = dict([(label, []) for label in self._labels])
 
   def _group_header(self, line):
     if line.startswith('Group of') or line.startswith('Score difference'):
@@ -101,7 +124,7 @@ class StateMachine(object):
   def _group_seq(self, line):
     # Reached end of seqs within group. Now at list of bootstrap support values.
     if self._is_bootstrap_line(line):
-      self._groups.append(self._current_group)
+      self._completed_groups.append(self._current_group)
       self._switch(self._bootstrap_support, True)
       return
 
@@ -113,25 +136,39 @@ class StateMachine(object):
     seq_a = fields[0].strip()
     seq_b = fields[2].strip()
 
+    label_a, label_b = self._labels
     if seq_a != '':
       score_a = self._parse_percentage(fields[1])
-      self._current_group['a'].append((seq_a, score_a))
+      self._current_group[label_a].append((seq_a, score_a))
     if seq_b != '':
       score_b = self._parse_percentage(fields[3])
-      self._current_group['b'].append((seq_b, score_b))
+      self._current_group[label_b].append((seq_b, score_b))
 
   def _bootstrap_support(self, line):
     if self._is_bootstrap_line(line):
       return
     self._switch(self._new_group, True)
 
-def main():
-  inparanoid_results_filename = sys.argv[1]
+def write_ndjson(groups, out_file):
+  for group in groups:
+    out_file.write(json.dumps(group) + '\n')
 
-  with open(inparanoid_results_filename) as inparanoid_results_file:
-    sm = StateMachine(inparanoid_results_file)
-    sm.run()
-  json.dump(sm.results(), sys.stdout)
+def main():
+  parser = argparse.ArgumentParser(description='Parse InParanoid results.')
+  parser.add_argument('inparanoid_results_filename', help='InParanoid human-readable Output file')
+  parser.add_argument('--ndjson', dest='ndjson', action='store_true',
+    help='Write one group per line as each is parsed')
+  parser.add_argument('--genomes', dest='labels', nargs=2, default=('a', 'b'), metavar=('A', 'B'),
+    help='Key members by these genome IDs rather than by "a" and "b"')
+  args = parser.parse_args()
+
+  with open(args.inparanoid_results_filename) as inparanoid_results_file:
+    sm = StateMachine(inparanoid_results_file, tuple(args.labels))
+    if args.ndjson:
+      write_ndjson(sm.iter_groups(), sys.stdout)
+    else:
+      sm.run()
+      json.dump(sm.results(), sys.stdout)
 
 if __name__ == '__main__':
   main()
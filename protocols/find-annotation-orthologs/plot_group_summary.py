@@ -1,24 +1,46 @@
 #!/usr/bin/env python2
+'''
+Plot distribution of orthologous group sizes.
+
+Usage: cat inparanoid_results.json | plot_group_summary.py <label A> <label B> <linear plot> <log plot>
+       plot_group_summary.py --store <group store> <output> [<label> ...]
+
+With --store, groups spanning any number of genomes are read from a store
+built by group_store.py, and a grid of joint histograms is plotted, with one
+panel for each pair of genomes. Labels default to genome IDs.
+'''
 
-import json
 import math
 import sys
 
+import group_store
+import inparanoid_groups
+
 import matplotlib
 # Force matplotlib not to use X11 backend, which produces exception when run
 # over SSH.
 matplotlib.use('Agg')
+import matplotlib.colors
 import matplotlib.pyplot as plt
 
-def plot_groups(groups, filename, make_y_scale_log, group_a_label, group_b_label):
+def calc_log_ratios(groups, genome_a='a', genome_b='b'):
   vals = []
 
   for group in groups:
-    a_len = len(group['a'])
-    b_len = len(group['b'])
+    a_len = len(group.get(genome_a, []))
+    b_len = len(group.get(genome_b, []))
+    # Groups spanning several genomes may lack members from either.
+    if a_len == 0 or b_len == 0:
+      continue
     log = math.log(float(a_len) / float(b_len), 2)
     vals.append(log)
 
+  return vals
+
+def plot_groups(groups, filename, make_y_scale_log, group_a_label, group_b_label):
+  plot_log_ratios(calc_log_ratios(groups), filename, make_y_scale_log, group_a_label, group_b_label)
+
+def plot_log_ratios(vals, filename, make_y_scale_log, group_a_label, group_b_label):
   bins = list(range(int(math.floor(min(vals))), int(math.ceil(max(vals))) + 1))
   plt.figure()
   plt.xticks(bins)
@@ -29,15 +51,74 @@ def plot_groups(groups, filename, make_y_scale_log, group_a_label, group_b_label
   plt.ylabel('Occurrences')
   plt.savefig(filename)
 
+def calc_member_counts(groups, genomes):
+  '''
+  Return list with, for each group, a list of its member counts in each genome.
+  '''
+  return [[len(group.get(genome, [])) for genome in genomes] for group in groups]
+
+def plot_joint_histograms(counts, filename, labels):
+  '''
+  Plot grid of histograms from member counts returned by calc_member_counts().
+  The panel in row i and column j shows how many groups have each combination
+  of member counts in genomes i and j; panels on the diagonal show the
+  distribution of member counts in genome i alone. Groups lacking members in
+  a panel's genomes are omitted from it.
+  '''
+  k = len(labels)
+  max_count = max([max(c) for c in counts] + [1])
+  bins = [b + 0.5 for b in range(max_count + 1)]
+  fig, axes = plt.subplots(k, k, figsize=(3 * k, 3 * k), squeeze=False)
+
+  for i in range(k):
+    for j in range(k):
+      ax = axes[i][j]
+      if i == j:
+        vals = [c[i] for c in counts if c[i] > 0]
+        if vals:
+          ax.hist(vals, bins=bins, log=True, facecolor='green', alpha=0.5)
+      else:
+        pairs = [(c[j], c[i]) for c in counts if c[i] > 0 and c[j] > 0]
+        if pairs:
+          xs, ys = zip(*pairs)
+          ax.hist2d(xs, ys, bins=[bins, bins], cmin=1, norm=matplotlib.colors.LogNorm())
+      if i == k - 1:
+        ax.set_xlabel(labels[j])
+      if j == 0:
+        ax.set_ylabel(labels[i])
+
+  fig.suptitle('Joint distribution of orthologous group gene counts')
+  fig.savefig(filename)
+  plt.close(fig)
+
+def main_store():
+  store_fname = sys.argv[2]
+  output = sys.argv[3]
+
+  store = group_store.GroupStore(store_fname)
+  genomes = store.genomes()
+  labels = sys.argv[4:] or genomes
+  if len(labels) != len(genomes):
+    raise Exception('Expected %s labels, but got %s' % (len(genomes), len(labels)))
+  counts = calc_member_counts(store.iter_groups(), genomes)
+  store.close()
+  plot_joint_histograms(counts, output, labels)
+
 def main():
+  if sys.argv[1] == '--store':
+    main_store()
+    return
+
   group_a_label = sys.argv[1]
   group_b_label = sys.argv[2]
   output_linear = sys.argv[3]
   output_log    = sys.argv[4]
 
-  ortho_groups = json.load(sys.stdin)['groups']
-  plot_groups(ortho_groups, output_linear, False, group_a_label, group_b_label)
-  plot_groups(ortho_groups, output_log,    True,  group_a_label, group_b_label)
+  # Only group sizes are needed, so reduce groups to their size ratios as they
+  # are read, rather than holding all groups in memory.
+  vals = calc_log_ratios(inparanoid_groups.iter_groups(sys.stdin))
+  plot_log_ratios(vals, output_linear, False, group_a_label, group_b_label)
+  plot_log_ratios(vals, output_log,    True,  group_a_label, group_b_label)
 
 if __name__ == '__main__':
   main()
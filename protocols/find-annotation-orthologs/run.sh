@@ -3,38 +3,24 @@ OUTDIR=../../runs/inparanoid
 mkdir -p $OUTDIR
 #EXTRA_ARGS="--only-analyze"
 
+JOBS=$OUTDIR/jobs
+# Columns: genome A, genome B, outgroup ("-" for none), matrix.
+> $JOBS
 for matrix in BLOSUM{62,80}; do
-  # Haemonchus against Haemonchus.
-  ./run_inparanoid.py \
-    --matrix $matrix \
-    --outgroup PRJNA13758 \
-    $EXTRA_ARGS \
-    PRJEB506 PRJNA205202 \
-    $OUTDIR &
-  ./run_inparanoid.py \
-    --matrix $matrix \
-    $EXTRA_ARGS \
-    PRJEB506 PRJNA205202 \
-    $OUTDIR &
-
-  # C. elegans against C. briggsae.
-  ./run_inparanoid.py \
-    --matrix $matrix \
-    $EXTRA_ARGS \
-    PRJNA13758 PRJNA10731 \
-    $OUTDIR &
-
-  # Haemonchus against C. elegans.
-  ./run_inparanoid.py \
-    --matrix $matrix \
-    $EXTRA_ARGS \
-    PRJEB506 PRJNA13758 \
-    $OUTDIR &
-  ./run_inparanoid.py \
-    --matrix $matrix \
-    $EXTRA_ARGS \
-    PRJNA205202 PRJNA13758 \
-    $OUTDIR &
+  cat >> $JOBS <<EOF
+# Haemonchus against Haemonchus.
+PRJEB506    PRJNA205202 PRJNA13758 $matrix
+PRJEB506    PRJNA205202 -          $matrix
+# C. elegans against C. briggsae.
+PRJNA13758  PRJNA10731  -          $matrix
+# Haemonchus against C. elegans.
+PRJEB506    PRJNA13758  -          $matrix
+PRJNA205202 PRJNA13758  -          $matrix
+EOF
 done
 
-wait
+# All jobs share one pool of workers, with BLAST threads divided between them.
+./run_inparanoid.py \
+  $EXTRA_ARGS \
+  --jobs $JOBS \
+  $OUTDIR
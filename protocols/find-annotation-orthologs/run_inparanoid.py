@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
-import glob
+import fcntl
+import hashlib
+import json
+import multiprocessing
+import resource
 import sarge
 import os
+import shutil
+import time
 
 class CommandManager(object):
   def __init__(self):
@@ -14,20 +20,221 @@ class CommandManager(object):
     p = sarge.run(*args, **kwargs)
     if 'async' in kwargs and kwargs['async']:
       self._pipelines.append(p)
+    return p
+
+  def run_checked(self, *args, **kwargs):
+    '''
+    Run command, raising an exception if any command in its pipeline fails, so
+    that a failed step is never recorded as complete.
+    '''
+    p = self.run(*args, **kwargs)
+    if any(p.returncodes):
+      raise Exception('Command failed with exit statuses %s: %s' % (p.returncodes, args[0]))
+    return p
 
   def wait(self):
     for p in self._pipelines:
       p.close()
     self._pipelines = []
 
+# Maps (path, size, mtime) to the SHA-1 digest of the file's contents, so that
+# each file is read only once per process however many steps use it.
+DIGESTS = {}
+
+def file_digest(fname):
+  stat = os.stat(fname)
+  memo_key = (os.path.abspath(fname), stat.st_size, stat.st_mtime)
+  if memo_key not in DIGESTS:
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+      for block in iter(lambda: f.read(1024 * 1024), b''):
+        h.update(block)
+    DIGESTS[memo_key] = h.hexdigest()
+  return DIGESTS[memo_key]
+
+def list_files(dirname):
+  fnames = []
+  for dirpath, dirnames, filenames in os.walk(dirname):
+    dirnames.sort()
+    fnames += [os.path.join(dirpath, f) for f in sorted(filenames)]
+  return fnames
+
+class Step(object):
+  '''
+  A pipeline step that is skipped when its outputs already exist and were
+  produced from the same inputs, parameters and scripts, in the manner of make.
+  Inputs and scripts are compared by the digests of their contents rather than
+  by their modification times, so that regenerating an input identically does
+  not force downstream steps to rerun.
+
+  The stamp recording these is written only once the step has succeeded, and
+  is removed before it starts, so that an interrupted step is never mistaken
+  for a complete one.
+  '''
+  def __init__(self, name, stamp_fname, outputs, inputs=(), scripts=(), params=None):
+    self.name = name
+    self._stamp_fname = stamp_fname
+    self._outputs = outputs
+    self._inputs = inputs
+    self._scripts = scripts
+    self._params = params
+    self._record = None
+
+  def _make_record(self):
+    if self._record is None:
+      record = {
+        'inputs':  [file_digest(f) for f in self._inputs],
+        'scripts': [file_digest(f) for f in self._scripts],
+        'params':  self._params,
+      }
+      record['key'] = hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+      self._record = record
+    return self._record
+
+  def is_current(self):
+    if CONF['FORCE']:
+      return False
+    if not all([os.path.exists(f) for f in self._outputs + [self._stamp_fname]]):
+      return False
+    with open(self._stamp_fname) as stamp_file:
+      stamp = json.load(stamp_file)
+    return stamp['key'] == self._make_record()['key']
+
+  def start(self):
+    if os.path.exists(self._stamp_fname):
+      os.unlink(self._stamp_fname)
+
+  def finish(self):
+    with open(self._stamp_fname, 'w') as stamp_file:
+      json.dump(self._make_record(), stamp_file, sort_keys=True, indent=2)
+
+  def skip_if_current(self):
+    '''
+    Return True if the step may be skipped. Otherwise, prepare to run it.
+    '''
+    if self.is_current():
+      print('Skipping %s, as its outputs are up to date' % self.name)
+      return True
+    self.start()
+    return False
+
+class BlastStore(object):
+  '''
+  Store of the BLAST hit tables produced by InParanoid, shared between runs.
+  InParanoid writes the hits of each query FASTA against each database FASTA
+  to a file named "<query>-<db>", and does not rerun BLAST for any such file
+  that already exists. Placing stored tables in its working directory before
+  it runs thus confines BLAST to comparisons not yet performed by any run.
+
+  Tables are keyed by the digests of the query and database FASTAs, the
+  scoring matrix, and the digests of the InParanoid scripts, which set the
+  remaining BLAST parameters and parse BLAST's output.
+  '''
+  def __init__(self, store_dir, matrix):
+    self._store_dir = store_dir
+    self._matrix = matrix
+    if not os.path.exists(store_dir):
+      try:
+        os.makedirs(store_dir)
+      except OSError:
+        # Another worker may have created it concurrently.
+        if not os.path.isdir(store_dir):
+          raise
+    self._script_digests = [file_digest(os.path.join(CONF['INPARANOIDDIR'], s)) for s in ('inparanoid.pl', 'blast_parser.pl')]
+
+  def _key(self, query_fname, db_fname):
+    record = {
+      'query':   file_digest(query_fname),
+      'db':      file_digest(db_fname),
+      'matrix':  self._matrix,
+      'scripts': self._script_digests,
+    }
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+  def _pairs(self, fasta_fnames):
+    # InParanoid compares both ingroup genomes against themselves and each
+    # other, and each against the outgroup, if any.
+    ingroup, outgroup = fasta_fnames[:2], fasta_fnames[2:]
+    return [(q, d) for q in ingroup for d in ingroup + outgroup]
+
+  def _stored_fname(self, query_fname, db_fname):
+    return os.path.join(self._store_dir, '%s.blast' % self._key(query_fname, db_fname))
+
+  def _result_fname(self, work_dir, query_fname, db_fname):
+    return os.path.join(work_dir, '%s-%s' % (os.path.basename(query_fname), os.path.basename(db_fname)))
+
+  def lock(self, fasta_fnames):
+    '''
+    Lock every comparison between `fasta_fnames` whose results are not yet
+    stored, so that concurrent runs sharing a comparison perform it only once:
+    the second run waits for the first, then reuses its results. Locks are
+    acquired in sorted order to prevent deadlock. Return the held lock files,
+    to be passed to unlock().
+    '''
+    missing = set()
+    for query_fname, db_fname in self._pairs(fasta_fnames):
+      stored_fname = self._stored_fname(query_fname, db_fname)
+      if not os.path.exists(stored_fname):
+        missing.add(stored_fname)
+
+    locks = []
+    for stored_fname in sorted(missing):
+      lock_file = open(stored_fname + '.lock', 'w')
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      locks.append(lock_file)
+    return locks
+
+  def unlock(self, locks):
+    for lock_file in locks:
+      fcntl.flock(lock_file, fcntl.LOCK_UN)
+      lock_file.close()
+
+  def populate(self, fasta_fnames, work_dir):
+    '''
+    Copy stored results for comparisons between `fasta_fnames` into
+    `work_dir`, returning the number copied.
+    '''
+    populated = 0
+    for query_fname, db_fname in self._pairs(fasta_fnames):
+      stored_fname = self._stored_fname(query_fname, db_fname)
+      if os.path.exists(stored_fname):
+        shutil.copyfile(stored_fname, self._result_fname(work_dir, query_fname, db_fname))
+        populated += 1
+    return populated
+
+  def harvest(self, fasta_fnames, work_dir):
+    '''
+    Store results for comparisons between `fasta_fnames` found in `work_dir`
+    that are not already stored.
+    '''
+    for query_fname, db_fname in self._pairs(fasta_fnames):
+      stored_fname = self._stored_fname(query_fname, db_fname)
+      result_fname = self._result_fname(work_dir, query_fname, db_fname)
+      if os.path.exists(stored_fname) or not os.path.exists(result_fname):
+        continue
+      # Write under a temporary name, then rename, so that a partially copied
+      # table is never visible to other runs.
+      temp_fname = '%s.%s.tmp' % (stored_fname, os.getpid())
+      shutil.copyfile(result_fname, temp_fname)
+      os.rename(temp_fname, stored_fname)
+
 CONF = {}
 cm = CommandManager()
 
-def set_config(parent_dir, run_name):
+def set_config(parent_dir):
   global CONF
   CONF['BASEDIR'] = os.path.abspath(os.path.expanduser('~/work/jubilant-peanut'))
   CONF['PROTDIR'] = CONF['BASEDIR'] + '/protocols/find-annotation-orthologs'
-  CONF['RUNDIR']  = os.path.abspath(os.path.join(parent_dir, run_name))
+  CONF['COMMONDIR'] = CONF['BASEDIR'] + '/protocols/common'
+  CONF['INPARANOIDDIR'] = os.path.expanduser('~/.apps/inparanoid')
+  CONF['OUTDIR']  = os.path.abspath(parent_dir)
+  # Shared between all runs, so that each genome is munged only once.
+  CONF['PROTEINDIR'] = os.path.join(CONF['OUTDIR'], 'proteins')
+  # Shared between all runs, so that each BLAST comparison is performed only
+  # once.
+  CONF['BLASTDIR'] = os.path.join(CONF['OUTDIR'], 'blast-cache')
+  # Shared between all runs, so that annotations are parsed only once.
+  CONF['CACHEDIR'] = os.path.join(CONF['OUTDIR'], 'transcript-cache')
 
   CONF['DATASETS'] = {
     'PRJEB506': {
@@ -58,64 +265,108 @@ def set_config(parent_dir, run_name):
     },
   }
 
+def set_run_dir(run_name):
+  CONF['RUNDIR'] = os.path.join(CONF['OUTDIR'], run_name)
+
 def create_dirs():
-  cm.run('rm -rf ' +  CONF['RUNDIR'])
-  cm.run('mkdir -p ' + CONF['RUNDIR'])
-  os.chdir(CONF['RUNDIR'])
-  cm.run('mkdir proteins')
-  cm.run('mkdir results')
+  cm.run('mkdir -p ' + os.path.join(CONF['RUNDIR'], 'results'))
 
-def filter_isoforms(genome_id, protein_path, delimiter, regenerate_data):
-  filtered_file = '{rundir}/proteins/{genome_id}.filtered_isoforms.fa'.format(
-    rundir = CONF['RUNDIR'],
-    genome_id = genome_id,
+def filter_isoforms(protein_path, delimiter):
+  '''
+  Return command writing the longest isoform of each gene to stdout. As
+  filter_isoforms.py reads its input only once, its output can be piped
+  directly into munge_fasta.py without an intermediate file.
+  '''
+  return '{protdir}/filter_isoforms.py {protein_path} {delimiter}'.format(
+    protdir = CONF['PROTDIR'],
+    protein_path = protein_path,
+    delimiter = delimiter,
   )
-  if regenerate_data:
-    cm.run('{protdir}/filter_isoforms.py {protein_path} {delimiter} > {filtered_file}'.format(
-      protdir = CONF['PROTDIR'],
-      genome_id = genome_id,
-      protein_path = protein_path,
-      delimiter = delimiter,
-      filtered_file = filtered_file,
-    ))
-  return filtered_file
 
-def alter_fasta_ids(genome_id, protein_path, regenerate_data):
-  munged_file = '{rundir}/proteins/{genome_id}.munged.fa'.format(
-    rundir = CONF['RUNDIR'],
+def alter_fasta_ids(genome_id, protein_source, regenerate_data):
+  munged_file = '{proteindir}/{genome_id}.munged.fa'.format(
+    proteindir = CONF['PROTEINDIR'],
     genome_id = genome_id,
   )
-  name_map = '{rundir}/proteins/{genome_id}.name_map.json'.format(
-    rundir = CONF['RUNDIR'],
+  name_map = '{proteindir}/{genome_id}.name_map.json'.format(
+    proteindir = CONF['PROTEINDIR'],
     genome_id = genome_id,
   )
 
   if regenerate_data:
-    cm.run('cat {protein_path} | {protdir}/munge_fasta.py {genome_id} {munged_file} {name_map}'.format(
-      protein_path = protein_path,
-      protdir = CONF['PROTDIR'],
-      genome_id = genome_id,
-      munged_file = munged_file,
-      name_map = name_map,
-    ))
+    step = munge_step(genome_id, munged_file, name_map)
+    if not step.skip_if_current():
+      cm.run_checked('{protein_source} | {protdir}/munge_fasta.py {genome_id} {munged_file} {name_map}'.format(
+        protein_source = protein_source,
+        protdir = CONF['PROTDIR'],
+        genome_id = genome_id,
+        munged_file = munged_file,
+        name_map = name_map,
+      ))
+      step.finish()
   return {
     'munged_fasta': munged_file,
     'name_map':     name_map
   }
 
-def prepare_inparanoid(outgroup, matrix):
+def munge_step(genome_id, munged_file, name_map):
+  params = CONF['DATASETS'][genome_id]
+  scripts = [CONF['PROTDIR'] + '/munge_fasta.py', CONF['COMMONDIR'] + '/fasta.py']
+  if params['filter_isoforms']:
+    scripts.append(CONF['PROTDIR'] + '/filter_isoforms.py')
+  return Step(
+    'munging of %s' % genome_id,
+    os.path.join(CONF['PROTEINDIR'], '%s.stamp' % genome_id),
+    outputs = [munged_file, name_map],
+    inputs  = [params['proteins']],
+    scripts = scripts,
+    params  = {
+      'genome_id':         genome_id,
+      'filter_isoforms':   params['filter_isoforms'],
+      'isoform_delimiter': params.get('isoform_delimiter'),
+    },
+  )
+
+def inparanoid_output_fname(genome_a, genome_b):
+  return os.path.join(CONF['RUNDIR'], 'inparanoid', 'Output.%s.munged.fa-%s.munged.fa' % (genome_a, genome_b))
+
+def inparanoid_step(genome_a, genome_b, outgroup, matrix, munged_fnames):
+  genomes = [genome_a, genome_b]
+  if outgroup:
+    genomes.append(outgroup)
+  # The number of BLAST processes is deliberately omitted from the parameters,
+  # as it does not affect the results.
+  return Step(
+    'InParanoid run %s' % os.path.basename(CONF['RUNDIR']),
+    os.path.join(CONF['RUNDIR'], 'inparanoid.stamp'),
+    outputs = [inparanoid_output_fname(genome_a, genome_b)],
+    inputs  = [munged_fnames[g]['munged_fasta'] for g in genomes],
+    scripts = list_files(CONF['INPARANOIDDIR']),
+    params  = {
+      'genomes': genomes,
+      'matrix':  matrix,
+    },
+  )
+
+def prepare_inparanoid(outgroup, matrix, threads):
   os.chdir(CONF['RUNDIR'])
-  cm.run('cp -a {inparanoid_path} inparanoid'.format(
-    inparanoid_path = os.path.expanduser('~/.apps/inparanoid/'),
+  # Discard any previous run, whose results may be stale.
+  cm.run('rm -rf inparanoid')
+  cm.run('cp -a {inparanoid_path}/ inparanoid'.format(
+    inparanoid_path = CONF['INPARANOIDDIR'],
   ))
 
-  # Use multiple CPUs.
-  cm.run('''sed -i 's/^$blastall = "blastall"/$blastall = "blastall -a28"/' inparanoid/inparanoid.pl''')
+  # Use multiple CPUs by searching shards of each query file in separate
+  # blastall processes, which scales better than blastall's own threading.
+  cm.run('''sed -i 's|^$blastall = "blastall"|$blastall = "{protdir}/sharded_blastall.py {threads} blastall"|' inparanoid/inparanoid.pl'''.format(
+    protdir = CONF['PROTDIR'],
+    threads = threads,
+  ))
   if outgroup:
     cm.run('''sed -i 's/^$use_outgroup = 0/$use_outgroup = 1/' inparanoid/inparanoid.pl''')
 
   # Set matrix.
-  if matrix == 'BLOSUM2':
+  if matrix == 'BLOSUM62':
     # Default, so do nothing.
     pass
   elif matrix == 'BLOSUM80':
@@ -123,8 +374,9 @@ def prepare_inparanoid(outgroup, matrix):
   else:
     raise Exception('Unknown matrix: %s' % matrix)
 
-def run_inparanoid(genome_a, genome_b, outgroup):
-  os.chdir(os.path.join(CONF['RUNDIR'], 'inparanoid'))
+def run_inparanoid(genome_a, genome_b, outgroup, matrix):
+  work_dir = os.path.join(CONF['RUNDIR'], 'inparanoid')
+  os.chdir(work_dir)
 
   genomes = [genome_a, genome_b]
   if outgroup:
@@ -132,72 +384,110 @@ def run_inparanoid(genome_a, genome_b, outgroup):
   fasta_files = ['%s.munged.fa' % g for g in genomes]
 
   for fasta_file in fasta_files:
-    cm.run('cp -a ../proteins/{fasta_file} .'.format(fasta_file = fasta_file))
-
-  cm.run(
-    './inparanoid.pl {fasta_files}'.format(fasta_files = ' '.join(fasta_files)),
-    env = {'PATH': '{blast_path}:{existing_path}'.format(
-      blast_path = os.path.expanduser('~/.apps/blast-2.2.26/bin'),
-      existing_path = os.environ['PATH'],
-    )}
+    cm.run('cp -a {proteindir}/{fasta_file} .'.format(
+      proteindir = CONF['PROTEINDIR'],
+      fasta_file = fasta_file,
+    ))
+
+  blast_store = BlastStore(CONF['BLASTDIR'], matrix)
+  fasta_fnames = [os.path.join(work_dir, f) for f in fasta_files]
+  locks = blast_store.lock(fasta_fnames)
+  try:
+    reused = blast_store.populate(fasta_fnames, work_dir)
+    print('Reusing %s stored BLAST results for %s' % (reused, os.path.basename(CONF['RUNDIR'])))
+    cm.run_checked(
+      './inparanoid.pl {fasta_files}'.format(fasta_files = ' '.join(fasta_files)),
+      env = {'PATH': '{blast_path}:{existing_path}'.format(
+        blast_path = os.path.expanduser('~/.apps/blast-2.2.26/bin'),
+        existing_path = os.environ['PATH'],
+      )}
+    )
+    blast_store.harvest(fasta_fnames, work_dir)
+  finally:
+    blast_store.unlock(locks)
+
+def analysis_step(genome_a, genome_b, munged_fnames):
+  results_dir = os.path.join(CONF['RUNDIR'], 'results')
+  output_names = (
+    'inparanoid_results.ndjson',
+    'orthologue-summary',
+    'ortho_groups_linear.png',
+    'ortho_groups_log.png',
+    'transcript-groups',
+    'tandem-clusters',
+    'tandem-groups',
+  )
+  script_names = (
+    'analyze_groups.py',
+    'parse_inparanoid.py',
+    'inparanoid_groups.py',
+    'summarize_groups.py',
+    'plot_group_summary.py',
+    'examine_transcript_groups.py',
+    'find_tandem_arrays.py',
+  )
+  return Step(
+    'analysis of %s' % os.path.basename(CONF['RUNDIR']),
+    os.path.join(CONF['RUNDIR'], 'results.stamp'),
+    outputs = [os.path.join(results_dir, n) for n in output_names],
+    inputs  = [
+      inparanoid_output_fname(genome_a, genome_b),
+      munged_fnames[genome_a]['name_map'],
+      munged_fnames[genome_b]['name_map'],
+      CONF['DATASETS'][genome_a]['annotation'],
+      CONF['DATASETS'][genome_b]['annotation'],
+    ],
+    scripts = [os.path.join(CONF['PROTDIR'], n) for n in script_names],
+    params  = {
+      'friendly_name_a': CONF['DATASETS'][genome_a]['friendly_name'],
+      'friendly_name_b': CONF['DATASETS'][genome_b]['friendly_name'],
+    },
   )
 
 def process_results(genome_a, genome_b, munged_fnames):
+  step = analysis_step(genome_a, genome_b, munged_fnames)
+  if step.skip_if_current():
+    return
   os.chdir(os.path.join(CONF['RUNDIR'], 'results'))
-  parsed = 'inparanoid_results.json'
 
-  cm.run('{protdir}/parse_inparanoid.py {inparanoid_output} > {parsed}'.format(
-    protdir = CONF['PROTDIR'],
-    inparanoid_output = glob.glob('../inparanoid/Output*')[0],
-    parsed = parsed
-  ))
-  cm.run('cat {parsed} | {protdir}/summarize_groups.py > orthologue-summary'.format(
-    parsed = parsed,
-    protdir = CONF['PROTDIR']
-  ))
-  cm.run(("cat {parsed} | {protdir}/plot_group_summary.py '{friendly_name_a}' '{friendly_name_b}' " + \
-    "ortho_groups_linear.png ortho_groups_log.png").format(
-    parsed = parsed,
+  # Parse InParanoid's output once, then run all analyses on the parsed groups
+  # in a single process.
+  cm.run_checked(("{protdir}/analyze_groups.py --parallel --cache-dir {cache_dir} " + \
+    "{inparanoid_output} " + \
+    "'{friendly_name_a}' " + \
+    "'{friendly_name_b}' " + \
+    "{name_map_a} " + \
+    "{name_map_b} " + \
+    "{annotation_a} " + \
+    "{annotation_b}").format(
     protdir = CONF['PROTDIR'],
+    cache_dir = CONF['CACHEDIR'],
+    inparanoid_output = inparanoid_output_fname(genome_a, genome_b),
     friendly_name_a = CONF['DATASETS'][genome_a]['friendly_name'],
     friendly_name_b = CONF['DATASETS'][genome_b]['friendly_name'],
-  ))
-  cm.run(('cat {parsed} | {protdir}/examine_transcript_groups.py ' + \
-    '{name_map_a} ' + \
-    '{name_map_b} ' + \
-    '{annotation_a} ' + \
-    '{annotation_b} ' + \
-    '> transcript-groups').format(
-    parsed = parsed,
-    protdir = CONF['PROTDIR'],
     name_map_a = munged_fnames[genome_a]['name_map'],
     name_map_b = munged_fnames[genome_b]['name_map'],
     annotation_a = CONF['DATASETS'][genome_a]['annotation'],
     annotation_b = CONF['DATASETS'][genome_b]['annotation'],
   ))
+  step.finish()
 
-def perform_run(genome_a, genome_b, outgroup, matrix, munged_fnames, regenerate_data):
+def perform_run(genome_a, genome_b, outgroup, matrix, munged_fnames, regenerate_data, threads):
   if regenerate_data:
-    prepare_inparanoid(outgroup, matrix)
-    run_inparanoid(genome_a, genome_b, outgroup)
+    create_dirs()
+    step = inparanoid_step(genome_a, genome_b, outgroup, matrix, munged_fnames)
+    if not step.skip_if_current():
+      prepare_inparanoid(outgroup, matrix, threads)
+      run_inparanoid(genome_a, genome_b, outgroup, matrix)
+      step.finish()
   process_results(genome_a, genome_b, munged_fnames)
 
-# This could be moved into a different function, as we only need to munge the
-# FASTA files for genomes used in our current run, rather than all specified
-# within CONFIG['DATASETS']. Doing so would only reduce the number of genomes
-# to munge from four to three (when an outgroup is used), however, which would
-# reduce the runtime by only a few minutes. Thus, I choose instead to save
-# myself the effort of restructuring this operation.
-def munge_all_fasta_files(datasets, regenerate_data):
-  munged = {}
-
-  for genome_id, params in datasets.items():
-    protein_path = params['proteins']
-    if params['filter_isoforms']:
-      protein_path = filter_isoforms(genome_id, protein_path, params['isoform_delimiter'], regenerate_data)
-    munged[genome_id] = alter_fasta_ids(genome_id, protein_path, regenerate_data)
-
-  return munged
+def munge_fasta_file(genome_id, regenerate_data):
+  params = CONF['DATASETS'][genome_id]
+  protein_source = 'cat %s' % params['proteins']
+  if params['filter_isoforms']:
+    protein_source = filter_isoforms(params['proteins'], params['isoform_delimiter'])
+  return alter_fasta_ids(genome_id, protein_source, regenerate_data)
 
 def generate_run_name(genome_a, genome_b, outgroup, matrix):
   run_name = '{a}-{b}.{outgroup}-outgroup.{matrix}'.format(
@@ -208,25 +498,105 @@ def generate_run_name(genome_a, genome_b, outgroup, matrix):
   )
   return run_name
 
+def parse_jobs(jobs_fname):
+  '''
+  Parse jobs file, each line of which lists a genome A, genome B, outgroup and
+  matrix, separated by whitespace. Use "-" as the outgroup to run without one.
+  Blank lines and those beginning with "#" are ignored.
+  '''
+  jobs = []
+  with open(jobs_fname) as jobs_file:
+    for line in jobs_file:
+      line = line.strip()
+      if line == '' or line.startswith('#'):
+        continue
+      genome_a, genome_b, outgroup, matrix = line.split()
+      if outgroup == '-':
+        outgroup = None
+      jobs.append((genome_a, genome_b, outgroup, matrix))
+  return jobs
+
+def cpu_time():
+  '''
+  Return CPU time consumed by this process and its waited-for children, which
+  include every command run through the CommandManager.
+  '''
+  total = 0
+  for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+    usage = resource.getrusage(who)
+    total += usage.ru_utime + usage.ru_stime
+  return total
+
+def run_job(job, munged_fnames, regenerate_data, threads):
+  genome_a, genome_b, outgroup, matrix = job
+  run_name = generate_run_name(genome_a, genome_b, outgroup, matrix)
+  set_run_dir(run_name)
+
+  start_wall, start_cpu = time.time(), cpu_time()
+  perform_run(genome_a, genome_b, outgroup, matrix, munged_fnames, regenerate_data, threads)
+  return (run_name, time.time() - start_wall, cpu_time() - start_cpu)
+
+def run_jobs(jobs, cpus, max_concurrent, regenerate_data):
+  '''
+  Run all jobs through a pool of `max_concurrent` worker processes. Genomes
+  used by any job are munged once beforehand and shared between all jobs. To
+  keep the total number of BLAST processes within `cpus`, each job receives an
+  equal share of them.
+  '''
+  concurrent = max(1, min(max_concurrent, len(jobs)))
+  threads = max(1, cpus // concurrent)
+  # Workers must inherit CONF, so force fork even where it isn't the default.
+  pool = multiprocessing.get_context('fork').Pool(concurrent)
+
+  genome_ids = sorted(set([g for job in jobs for g in job[:3] if g]))
+  if regenerate_data:
+    cm.run('mkdir -p ' + CONF['PROTEINDIR'])
+  munged = pool.starmap(munge_fasta_file, [(g, regenerate_data) for g in genome_ids])
+  munged_fnames = dict(zip(genome_ids, munged))
+
+  timings = pool.starmap(run_job, [(job, munged_fnames, regenerate_data, threads) for job in jobs])
+  pool.close()
+  pool.join()
+
+  print('Ran %s jobs, %s at a time with %s BLAST processes each' % (len(jobs), concurrent, threads))
+  for run_name, wall_time, cpu_time_used in timings:
+    print('%s\twall=%.1f s\tcpu=%.1f s' % (run_name, wall_time, cpu_time_used))
+
 def main():
-  parser = argparse.ArgumentParser(description='Run InParanoid and parse results.')
-  parser.add_argument('genome_a',   help='First genome')
-  parser.add_argument('genome_b',   help='Second genome')
-  parser.add_argument('output_dir', help='Output directory')
+  parser = argparse.ArgumentParser(
+    description='Run InParanoid and parse results.',
+    usage='%(prog)s [options] (genome_a genome_b | --jobs JOBS_FILE) output_dir',
+  )
+  parser.add_argument('positional', nargs='+', help='Genomes to compare (unless --jobs is given), then output directory')
   parser.add_argument('-o', '--outgroup', dest='outgroup', action='store', help='Outgroup used to break up large orthologous groups')
   parser.add_argument('-a', '--only-analyze', dest='regenerate_data',
     action='store_false', help='Do not recreate directories or run InParanoid. Only analyze existing results.')
+  parser.add_argument('-f', '--force', dest='force', action='store_true',
+    help='Rerun every step, even those whose outputs are up to date')
   parser.add_argument('-m', '--matrix', dest='matrix', action='store',
     choices=('BLOSUM62', 'BLOSUM80'), default='BLOSUM62', help='Scoring matrix')
+  parser.add_argument('-j', '--jobs', dest='jobs_fname', action='store',
+    help='File listing one "genome_a genome_b outgroup matrix" job per line, to be run instead of a single comparison')
+  parser.add_argument('-c', '--cpus', dest='cpus', type=int, default=multiprocessing.cpu_count(),
+    help='Total number of CPUs to use across all concurrent jobs')
+  parser.add_argument('-p', '--max-concurrent', dest='max_concurrent', type=int, default=multiprocessing.cpu_count(),
+    help='Maximum number of jobs to run at once')
   args = parser.parse_args()
 
-  run_name = generate_run_name(args.genome_a, args.genome_b, args.outgroup, args.matrix)
-  set_config(args.output_dir, run_name)
-  if args.regenerate_data:
-    create_dirs()
-  munged_fnames = munge_all_fasta_files(CONF['DATASETS'], args.regenerate_data)
+  if args.jobs_fname:
+    if len(args.positional) != 1:
+      parser.error('only output_dir may be given with --jobs')
+    output_dir = args.positional[0]
+    jobs = parse_jobs(args.jobs_fname)
+  else:
+    if len(args.positional) != 3:
+      parser.error('genome_a, genome_b and output_dir are required')
+    genome_a, genome_b, output_dir = args.positional
+    jobs = [(genome_a, genome_b, args.outgroup, args.matrix)]
 
-  perform_run(args.genome_a, args.genome_b, args.outgroup, args.matrix, munged_fnames, args.regenerate_data)
+  set_config(output_dir)
+  CONF['FORCE'] = args.force
+  run_jobs(jobs, args.cpus, args.max_concurrent, args.regenerate_data)
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python2
+'''
+Run blastall over shards of its query FASTA concurrently, then merge the
+shards' output into what a single blastall process would have written.
+
+Usage: sharded_blastall.py <workers> <blastall> <blastall args ...>
+
+blastall's own threading (-a) scales poorly beyond a few cores, as only parts
+of each search are parallelized. Instead, the query file given by -i is split
+into contiguous shards of roughly equal total length, and each shard is
+searched by a separate single-threaded blastall process, with at most
+<workers> running at once. As each query is searched independently against
+the unchanged database, results are unaffected by sharding.
+
+More shards than workers are created, so that workers finishing early can
+take up remaining shards rather than idling.
+
+XML output (-m7) is merged into a single document with its iterations
+renumbered. Should blastall instead write one document per query, as some
+versions do, the shards' output is concatenated, as it is for all other
+output formats. Output is written to the file given by -o, or else to stdout.
+'''
+
+import multiprocessing.pool
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import fasta
+
+SHARDS_PER_WORKER = 4
+
+def split_args(blastall_args):
+  '''
+  Return (options, other_args), where options maps each of the options that
+  this script handles itself to its value, and other_args holds all remaining
+  arguments in order. blastall accepts values both as a separate argument
+  ("-i foo") and joined to the option ("-ifoo").
+  '''
+  handled = ('-i', '-o', '-a', '-m')
+  options = {}
+  other_args = []
+  i = 0
+  while i < len(blastall_args):
+    arg = blastall_args[i]
+    if arg in handled:
+      options[arg] = blastall_args[i + 1]
+      i += 2
+      continue
+    if arg[:2] in handled:
+      options[arg[:2]] = arg[2:]
+    else:
+      other_args.append(arg)
+    i += 1
+  return (options, other_args)
+
+def write_shards(query_fname, shard_count, shard_dir):
+  '''
+  Split query FASTA into at most `shard_count` files of contiguous records,
+  each holding a roughly equal number of residues. Return their filenames, in
+  order.
+  '''
+  with open(query_fname) as query_file:
+    records = list(fasta.parse_fasta(query_file))
+  total_len = max(1, sum([len(seq) for header, seq in records]))
+  shard_count = max(1, min(shard_count, len(records)))
+
+  shards = []
+  cumulative_len = 0
+  for header, seq in records:
+    # Start a new shard once the preceding ones hold their share of residues.
+    shard_idx = min(shard_count - 1, cumulative_len * shard_count // total_len)
+    if shard_idx >= len(shards):
+      shards.append([])
+    shards[-1].append((header, seq))
+    cumulative_len += len(seq)
+  if not shards:
+    # blastall is still run, so that its output for no queries is produced.
+    shards.append([])
+
+  shard_fnames = []
+  for shard_idx, shard in enumerate(shards):
+    shard_fname = os.path.join(shard_dir, 'query.%s.fa' % shard_idx)
+    with open(shard_fname, 'w') as shard_file:
+      with fasta.FastaWriter(shard_file) as writer:
+        for header, seq in shard:
+          writer.write(header, seq)
+    shard_fnames.append(shard_fname)
+  return shard_fnames
+
+def run_shard(job):
+  blastall, other_args, shard_fname, output_fname = job
+  cmd = [blastall] + other_args + ['-i', shard_fname, '-o', output_fname, '-a', '1']
+  return subprocess.call(cmd)
+
+def is_concatenated_xml(xml_fname):
+  xml_decls = 0
+  with open(xml_fname) as xml_file:
+    for line in xml_file:
+      if line.startswith('<?xml'):
+        xml_decls += 1
+        if xml_decls > 1:
+          return True
+  return False
+
+def merge_xml(output_fnames, out_file):
+  '''
+  Merge XML documents, each containing the iterations for one shard's queries,
+  into one. The header preceding the first iteration is taken from the first
+  document, and the footer following the last iteration from the last.
+  '''
+  iter_num_re = re.compile(r'(<Iteration_iter-num>)(\d+)(<)')
+  query_id_re = re.compile(r'(<Iteration_query-ID>lcl\|)(\d+)(_)')
+  iterations_seen = 0
+
+  for doc_idx, output_fname in enumerate(output_fnames):
+    is_first = doc_idx == 0
+    is_last = doc_idx == len(output_fnames) - 1
+    in_header = True
+    in_footer = False
+    offset = iterations_seen
+
+    with open(output_fname) as output_file:
+      for line in output_file:
+        stripped = line.strip()
+        if stripped == '<Iteration>':
+          in_header = False
+          iterations_seen += 1
+        elif stripped == '</BlastOutput_iterations>':
+          in_footer = True
+
+        if in_header:
+          if is_first:
+            out_file.write(line)
+        elif in_footer:
+          if is_last:
+            out_file.write(line)
+        else:
+          if offset:
+            line = iter_num_re.sub(lambda m: '%s%s%s' % (m.group(1), int(m.group(2)) + offset, m.group(3)), line)
+            line = query_id_re.sub(lambda m: '%s%s%s' % (m.group(1), int(m.group(2)) + offset, m.group(3)), line)
+          out_file.write(line)
+
+def concatenate(output_fnames, out_file):
+  for output_fname in output_fnames:
+    with open(output_fname) as output_file:
+      shutil.copyfileobj(output_file, out_file)
+
+def run_sharded(workers, blastall, blastall_args):
+  options, other_args = split_args(blastall_args)
+  if '-i' not in options:
+    raise Exception('No query file specified with -i')
+
+  shard_dir = tempfile.mkdtemp(prefix='blastall-shards.', dir=os.getcwd())
+  try:
+    shard_fnames = write_shards(options['-i'], workers * SHARDS_PER_WORKER, shard_dir)
+    output_fnames = [f + '.out' for f in shard_fnames]
+    if '-m' in options:
+      other_args += ['-m', options['-m']]
+
+    # Each worker merely waits on a blastall process, so threads suffice.
+    pool = multiprocessing.pool.ThreadPool(workers)
+    statuses = pool.map(run_shard, [(blastall, other_args, s, o) for s, o in zip(shard_fnames, output_fnames)], 1)
+    pool.close()
+    pool.join()
+    failed = [s for s, status in zip(shard_fnames, statuses) if status != 0]
+    if failed:
+      raise Exception('blastall failed for shards: %s' % ', '.join([os.path.basename(f) for f in failed]))
+
+    if '-o' in options:
+      out_file = open(options['-o'], 'w')
+    else:
+      out_file = sys.stdout
+    try:
+      if options.get('-m') == '7' and not is_concatenated_xml(output_fnames[0]):
+        merge_xml(output_fnames, out_file)
+      else:
+        concatenate(output_fnames, out_file)
+    finally:
+      if out_file is not sys.stdout:
+        out_file.close()
+  finally:
+    shutil.rmtree(shard_dir)
+
+def main():
+  workers = int(sys.argv[1])
+  blastall = sys.argv[2]
+  run_sharded(workers, blastall, sys.argv[3:])
+
+if __name__ == '__main__':
+  main()
@@ -3,13 +3,33 @@
 Print summary of relationship cardinality in orhologous groups.
 
 Usage: cat inparanoid_results.json | summarize_groups.py
+       summarize_groups.py --store <group store>
+
+With --store, groups spanning any number of genomes are read from a store
+built by group_store.py, rather than pairwise groups from stdin.
 '''
 
-import json
+import argparse
 import sys
 from collections import defaultdict
 
-def summarize_groups(groups):
+import group_store
+import inparanoid_groups
+
+def cardinality_class(group, genomes):
+  '''
+  Return name of group's relationship class across `genomes`, formed from the
+  number of members from each genome, written as 0, 1 or n, joined by "_to_".
+  A group with one sequence from genome A and several from genome B is thus of
+  class 1_to_n, and one with several from A, none from B and one from C is of
+  class n_to_0_to_1.
+  '''
+  counts = [len(group.get(genome, [])) for genome in genomes]
+  if sum(counts) == 0:
+    raise Exception('Unexpectedly empty group')
+  return '_to_'.join([str(c) if c < 2 else 'n' for c in counts])
+
+def summarize_groups(groups, genomes=('a', 'b')):
   '''
   Suppose InParanoid was run on sequence sets A and B. This function returns a
   dictionary counting occurrences of the following orthologue groupp
@@ -23,32 +43,34 @@ def summarize_groups(groups):
       sequence in B
     * n_to_n: Instances where multiple sequences in A correspond to multiple
       sequences in B
+
+  For groups spanning more genomes, pass their keys as `genomes`; classes are
+  then named as by cardinality_class().
   '''
   summary = defaultdict(int)
 
   for group in groups:
-    a_len = len(group['a'])
-    b_len = len(group['b'])
-
-    if a_len == b_len == 1:
-      summary['1_to_1'] += 1
-    elif a_len > 1 and b_len > 1:
-      summary['n_to_n'] += 1
-    elif a_len > 1:
-      summary['n_to_1'] += 1
-    elif b_len > 1:
-      summary['1_to_n'] += 1
-    else:
-      raise Exception('Unexpectedly empty group')
+    summary[cardinality_class(group, genomes)] += 1
 
   return dict(summary)
 
+def write_summary(summary, out_file):
+  for key in sorted(summary.keys()):
+    out_file.write('%s=%s\n' % (key, summary[key]))
+
 def main():
-  ortho_groups = json.load(sys.stdin)['groups']
-  summary = summarize_groups(ortho_groups)
+  parser = argparse.ArgumentParser(description='Summarize relationship cardinality in orthologous groups.')
+  parser.add_argument('--store', dest='store_fname', action='store',
+    help='Group store from which to read groups, rather than stdin')
+  args = parser.parse_args()
 
-  for key in sorted(summary.keys()):
-    print('%s=%s' % (key, summary[key]))
+  if args.store_fname:
+    store = group_store.GroupStore(args.store_fname)
+    summary = summarize_groups(store.iter_groups(), store.genomes())
+    store.close()
+  else:
+    summary = summarize_groups(inparanoid_groups.iter_groups(sys.stdin))
+  write_summary(summary, sys.stdout)
 
 if __name__ == '__main__':
   main()
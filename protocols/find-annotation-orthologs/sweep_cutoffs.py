@@ -0,0 +1,95 @@
+#!/usr/bin/env python2
+'''
+Cluster orthologous groups under every combination of a grid of cutoffs,
+reporting the relationship cardinalities counted by summarize_groups.py for
+each.
+
+Usage: sweep_cutoffs.py [options] <genome A FASTA> <genome B FASTA>
+
+Hit tables are read as by cluster_orthologs.py, but only once for the whole
+sweep. Each cutoff option accepts a comma-separated list of values, such as
+"--score-cutoff 40,50,60"; options not given keep cluster_orthologs.py's
+defaults. Combinations are evaluated with the hit filtering cutoffs varying
+slowest, so that hits are filtered and seeds found anew only when those
+cutoffs change, rather than for every combination.
+
+A table with one row per combination is written to stdout. If --output-dir is
+given, each combination's counts are also written there to a file in the
+format of summarize_groups.py.
+'''
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import cluster_orthologs
+import summarize_groups
+
+# Parameters in the order in which they vary, from slowest to fastest.
+SWEPT_PARAMS = cluster_orthologs.FILTER_PARAMS + ('grey_zone', 'conf_cutoff')
+CARDINALITIES = ('1_to_1', '1_to_n', 'n_to_1', 'n_to_n')
+
+def parse_values(arg):
+  return [float(v) for v in arg.split(',')]
+
+def iter_grid(values):
+  '''
+  Yield parameters dictionary for each combination of `values`, which maps each
+  parameter to its list of values.
+  '''
+  for combination in itertools.product(*[values[p] for p in SWEPT_PARAMS]):
+    yield dict(zip(SWEPT_PARAMS, combination))
+
+def summary_fname(params):
+  return 'orthologue-summary.' + '.'.join(['%s=%g' % (p, params[p]) for p in SWEPT_PARAMS])
+
+def sweep(hit_tables, values, out_file, output_dir=None):
+  out_file.write('\t'.join(SWEPT_PARAMS + CARDINALITIES + ('groups',)) + '\n')
+  for params in iter_grid(values):
+    summary = summarize_groups.summarize_groups(cluster_orthologs.cluster(hit_tables, params))
+    out_file.write('\t'.join(
+      ['%g' % params[p] for p in SWEPT_PARAMS] +
+      [str(summary.get(c, 0)) for c in CARDINALITIES] +
+      [str(sum(summary.values()))]
+    ) + '\n')
+
+    if output_dir:
+      with open(os.path.join(output_dir, summary_fname(params)), 'w') as summary_file:
+        summarize_groups.write_summary(summary, summary_file)
+
+def main():
+  parser = argparse.ArgumentParser(description='Cluster orthologous groups across a grid of cutoffs.')
+  parser.add_argument('fasta_a', help='Name of FASTA file for genome A, as used in hit table filenames')
+  parser.add_argument('fasta_b', help='Name of FASTA file for genome B, as used in hit table filenames')
+  parser.add_argument('-o', '--outgroup', dest='fasta_outgroup', action='store',
+    help='Name of FASTA file for outgroup, as used in hit table filenames')
+  parser.add_argument('-d', '--hits-dir', dest='hits_dir', action='store', default='.',
+    help='Directory containing hit tables')
+  parser.add_argument('--output-dir', dest='output_dir', action='store',
+    help='Directory in which to write summary for each combination of cutoffs')
+  for param in SWEPT_PARAMS:
+    parser.add_argument('--' + param.replace('_', '-'), dest=param, type=parse_values,
+      default=[cluster_orthologs.DEFAULT_PARAMS[param]],
+      help='Comma-separated values for %s (default: %s)' % (param, cluster_orthologs.DEFAULT_PARAMS[param]))
+  args = parser.parse_args()
+
+  start_time = time.time()
+  hit_tables = cluster_orthologs.HitTables(args.hits_dir, args.fasta_a, args.fasta_b, args.fasta_outgroup)
+  parsed_time = time.time()
+
+  values = dict([(p, getattr(args, p)) for p in SWEPT_PARAMS])
+  sweep(hit_tables, values, sys.stdout, args.output_dir)
+
+  combinations = 1
+  for param in SWEPT_PARAMS:
+    combinations *= len(values[param])
+  sys.stderr.write('Parsed hit tables in %.2f s, then evaluated %s combinations of cutoffs in %.2f s\n' % (
+    parsed_time - start_time,
+    combinations,
+    time.time() - parsed_time,
+  ))
+
+if __name__ == '__main__':
+  main()
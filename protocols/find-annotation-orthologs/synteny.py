@@ -0,0 +1,394 @@
+#!/usr/bin/env python2
+'''
+Find blocks of collinear orthologs between two genomes, and classify them by
+the rearrangements drawn by create-example-syntenic-plots.py.
+
+Usage: synteny.py [options] <name map A> <name map B> \
+         <annotation A> <annotation B> < <groups file>
+
+Groups are read from stdin, in either format written by parse_inparanoid.py.
+Each pairing of a member from A with a member from the same group in B forms
+an anchor, placed at the rank of each member's transcript among all
+transcripts on its scaffold, in order of start coordinate. Groups with more
+than --max-members members in either genome are skipped, as the many anchors
+pairing their members form spurious chains among themselves.
+
+Anchors on each pair of scaffolds are chained by dynamic programming, with
+each anchor extending the longest chain ending at an anchor no more than
+--max-gap ranks before it in both genomes. Chains ascending in B give forward
+blocks, and chains descending in B reverse blocks. Chains of at least
+--min-anchors anchors are kept, longest first, such that no anchor lies in two
+blocks.
+
+Each block is then classified relative to its A scaffold's primary partner,
+the B scaffold sharing most anchors in blocks with it:
+
+  * collinear: on the primary partner, in the orientation holding most of the
+    pair's anchors, and in order, meaning that it is among the heaviest
+    increasing subsequence (by anchor count) of such blocks ordered by
+    position in A and B
+  * inversion: on the primary partner, in the opposite orientation
+  * translocation: on another B scaffold, or out of order on the primary one
+
+Where consecutive collinear blocks are separated by more than --max-gap ranks
+more in one genome than in the other, an insertion in that genome is reported.
+
+Writes the following files to the output directory:
+
+  * synteny-blocks: one row per block
+  * synteny-insertions: one row per insertion
+  * synteny-anchors: one row per anchor, giving the block holding it, if any,
+    for drawing with create-syntenic-maps/dot_plot.py
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import examine_transcript_groups
+import inparanoid_groups
+
+def rank_transcripts(transcript_manager, genome):
+  '''
+  Return dictionary mapping each transcript name to (seqid, rank, tstart,
+  tend), where rank is the transcript's index among all transcripts on its
+  scaffold, on either strand, sorted by start.
+  '''
+  by_seqid = {}
+  for seqid, strand, transcripts in transcript_manager.iter_strands(genome):
+    by_seqid.setdefault(seqid, []).extend(transcripts)
+
+  positions = {}
+  for seqid, transcripts in by_seqid.items():
+    transcripts.sort()
+    for rank, (tstart, tend, name) in enumerate(transcripts):
+      positions[name] = (seqid, rank, tstart, tend)
+  return positions
+
+def find_anchors(ortho_groups, mappings, positions, max_members):
+  '''
+  Return dictionary mapping each (A seqid, B seqid) pair to a list of anchors,
+  each of which is an (A rank, B rank, A name, B name) tuple, sorted by rank.
+  '''
+  anchors = {}
+  for ogroup in ortho_groups:
+    if not (0 < len(ogroup.get('a', [])) <= max_members and 0 < len(ogroup.get('b', [])) <= max_members):
+      continue
+    names_a = examine_transcript_groups.map_transcript_names(ogroup, 'a', mappings)
+    names_b = examine_transcript_groups.map_transcript_names(ogroup, 'b', mappings)
+    for name_a in names_a:
+      seqid_a, rank_a = positions['a'][name_a][:2]
+      for name_b in names_b:
+        seqid_b, rank_b = positions['b'][name_b][:2]
+        anchors.setdefault((seqid_a, seqid_b), []).append((rank_a, rank_b, name_a, name_b))
+
+  for pair_anchors in anchors.values():
+    pair_anchors.sort()
+  return anchors
+
+def chain_anchors(anchors, max_gap, reverse):
+  '''
+  Return chains through `anchors`, which are sorted by A rank then B rank, as
+  lists of indices into `anchors`. Each anchor's predecessor lies 1 to
+  `max_gap` ranks before it in A, and likewise in B, or after it in B if
+  `reverse` is True. Chains are found greedily from the highest-scoring
+  endpoint, with no anchor in more than one chain.
+  '''
+  count = len(anchors)
+  scores = [1] * count
+  predecessors = [-1] * count
+  # Anchors are sorted by A rank, so those within max_gap ranks before the
+  # current anchor in A lie in a window starting at window_start.
+  window_start = 0
+
+  for i in range(count):
+    rank_a, rank_b = anchors[i][0], anchors[i][1]
+    while anchors[window_start][0] < rank_a - max_gap:
+      window_start += 1
+
+    best_score, best_j, best_gap = 0, -1, None
+    for j in range(window_start, i):
+      prev_a, prev_b = anchors[j][0], anchors[j][1]
+      if prev_a >= rank_a:
+        break
+      gap_b = prev_b - rank_b if reverse else rank_b - prev_b
+      if not 0 < gap_b <= max_gap:
+        continue
+      gap = (rank_a - prev_a) + gap_b
+      if scores[j] > best_score or (scores[j] == best_score and gap < best_gap):
+        best_score, best_j, best_gap = scores[j], j, gap
+    scores[i] = best_score + 1
+    predecessors[i] = best_j
+
+  used = [False] * count
+  chains = []
+  for i in sorted(range(count), key = lambda i: -scores[i]):
+    chain = []
+    j = i
+    while j != -1 and not used[j]:
+      used[j] = True
+      chain.append(j)
+      j = predecessors[j]
+    chains.append(chain[::-1])
+  return chains
+
+def split_chain(anchors, chain, max_gap):
+  '''
+  Split `chain`, a list of indices into `anchors` some of which may have been
+  removed, wherever consecutive anchors lie more than `max_gap` ranks apart in
+  either genome.
+  '''
+  pieces = []
+  for i in chain:
+    if pieces and abs(anchors[i][0] - anchors[pieces[-1][-1]][0]) <= max_gap \
+        and abs(anchors[i][1] - anchors[pieces[-1][-1]][1]) <= max_gap:
+      pieces[-1].append(i)
+    else:
+      pieces.append([i])
+  return pieces
+
+def find_blocks(anchors, max_gap, min_anchors):
+  '''
+  Return list of blocks on each scaffold pair in `anchors`, as returned by
+  find_anchors(). Each block is a dictionary.
+  '''
+  blocks = []
+  for (seqid_a, seqid_b), pair_anchors in sorted(anchors.items()):
+    candidates = []
+    for orientation, reverse in (('+', False), ('-', True)):
+      for chain in chain_anchors(pair_anchors, max_gap, reverse):
+        if len(chain) >= min_anchors:
+          candidates.append((len(chain), orientation, chain))
+
+    # Forward and reverse chains may share anchors, as a forward chain may step
+    # diagonally across a short inversion and take one of its anchors. Shared
+    # anchors are left to the longest chain, and the rest of each shorter chain
+    # kept where still long enough.
+    candidates.sort(key = lambda c: (-c[0], c[1], c[2]))
+    used = set()
+    for length, orientation, chain in candidates:
+      remaining = [i for i in chain if i not in used]
+      for piece in split_chain(pair_anchors, remaining, max_gap):
+        if len(piece) < min_anchors:
+          continue
+        used.update(piece)
+        members = [pair_anchors[i] for i in piece]
+        ranks_a = [a[0] for a in members]
+        ranks_b = [a[1] for a in members]
+        blocks.append({
+          'seqid_a':     seqid_a,
+          'seqid_b':     seqid_b,
+          'orientation': orientation,
+          'anchors':     members,
+          'first_a':     min(ranks_a),
+          'last_a':      max(ranks_a),
+          'first_b':     min(ranks_b),
+          'last_b':      max(ranks_b),
+        })
+  return blocks
+
+def heaviest_increasing_subsequence(keys, weights):
+  '''
+  Return indices of the strictly increasing subsequence of `keys` with the
+  greatest total weight, in O(n log n) time, using a Fenwick tree holding the
+  best subsequence ending at each key.
+  '''
+  key_ranks = dict([(k, r) for r, k in enumerate(sorted(set(keys)), 1)])
+  tree = [(0, -1)] * (len(key_ranks) + 1)
+  predecessors = [-1] * len(keys)
+  totals = [0] * len(keys)
+
+  for i, key in enumerate(keys):
+    # Find best subsequence ending at a smaller key.
+    best = (0, -1)
+    r = key_ranks[key] - 1
+    while r > 0:
+      best = max(best, tree[r])
+      r -= r & -r
+    totals[i] = best[0] + weights[i]
+    predecessors[i] = best[1]
+
+    r = key_ranks[key]
+    while r < len(tree):
+      tree[r] = max(tree[r], (totals[i], i))
+      r += r & -r
+
+  if not keys:
+    return []
+  i = max(range(len(keys)), key = lambda i: totals[i])
+  indices = []
+  while i != -1:
+    indices.append(i)
+    i = predecessors[i]
+  return indices[::-1]
+
+def classify_blocks(blocks, max_gap):
+  '''
+  Set class of each block, and return list of insertions between collinear
+  blocks.
+  '''
+  insertions = []
+  by_seqid_a = {}
+  for block in blocks:
+    by_seqid_a.setdefault(block['seqid_a'], []).append(block)
+
+  for seqid_a in sorted(by_seqid_a.keys()):
+    seqid_blocks = by_seqid_a[seqid_a]
+    partner_anchors = {}
+    for block in seqid_blocks:
+      partner_anchors[block['seqid_b']] = partner_anchors.get(block['seqid_b'], 0) + len(block['anchors'])
+    primary = min(partner_anchors.keys(), key = lambda s: (-partner_anchors[s], s))
+
+    orientation_anchors = {'+': 0, '-': 0}
+    for block in seqid_blocks:
+      if block['seqid_b'] == primary:
+        orientation_anchors[block['orientation']] += len(block['anchors'])
+    predominant = orientation_anchors['-'] > orientation_anchors['+'] and '-' or '+'
+
+    candidates = []
+    for block in seqid_blocks:
+      if block['seqid_b'] != primary:
+        block['class'] = 'translocation'
+      elif block['orientation'] != predominant:
+        block['class'] = 'inversion'
+      else:
+        candidates.append(block)
+
+    candidates.sort(key = lambda b: (b['first_a'], b['first_b']))
+    sign = predominant == '+' and 1 or -1
+    in_order = set(heaviest_increasing_subsequence(
+      [sign * b['first_b'] for b in candidates],
+      [len(b['anchors']) for b in candidates],
+    ))
+    collinear = []
+    for i, block in enumerate(candidates):
+      block['class'] = i in in_order and 'collinear' or 'translocation'
+      if i in in_order:
+        collinear.append(block)
+
+    for prev, next_ in zip(collinear, collinear[1:]):
+      gap_a = next_['first_a'] - prev['last_a'] - 1
+      if predominant == '+':
+        gap_b = next_['first_b'] - prev['last_b'] - 1
+      else:
+        gap_b = prev['first_b'] - next_['last_b'] - 1
+      for genome, extra in (('a', gap_a - gap_b), ('b', gap_b - gap_a)):
+        if extra > max_gap:
+          insertions.append({
+            'genome':  genome,
+            'seqid_a': seqid_a,
+            'seqid_b': primary,
+            'after_a': prev['last_a'],
+            'after_b': prev['last_b'] if predominant == '+' else prev['first_b'],
+            'extra':   extra,
+          })
+
+  return insertions
+
+def write_blocks(blocks, positions, out_file):
+  out_file.write('\t'.join((
+    'block', 'class', 'orientation', 'anchors',
+    'seqid_a', 'start_a', 'end_a', 'first_rank_a', 'last_rank_a',
+    'seqid_b', 'start_b', 'end_b', 'first_rank_b', 'last_rank_b',
+  )) + '\n')
+  for block_id, block in enumerate(blocks, 1):
+    coords = {}
+    for genome, name_idx in (('a', 2), ('b', 3)):
+      transcripts = [positions[genome][a[name_idx]] for a in block['anchors']]
+      coords[genome] = (min([t[2] for t in transcripts]), max([t[3] for t in transcripts]))
+    out_file.write('\t'.join([str(v) for v in (
+      block_id, block['class'], block['orientation'], len(block['anchors']),
+      block['seqid_a'], coords['a'][0], coords['a'][1], block['first_a'], block['last_a'],
+      block['seqid_b'], coords['b'][0], coords['b'][1], block['first_b'], block['last_b'],
+    )]) + '\n')
+
+def write_insertions(insertions, out_file):
+  columns = ('genome', 'seqid_a', 'seqid_b', 'after_a', 'after_b', 'extra')
+  out_file.write('\t'.join(columns) + '\n')
+  for insertion in insertions:
+    out_file.write('\t'.join([str(insertion[c]) for c in columns]) + '\n')
+
+def write_anchors(anchors, blocks, positions, out_file):
+  out_file.write('\t'.join((
+    'seqid_a', 'start_a', 'end_a', 'name_a',
+    'seqid_b', 'start_b', 'end_b', 'name_b',
+    'block', 'orientation',
+  )) + '\n')
+  in_block = {}
+  for block_id, block in enumerate(blocks, 1):
+    for anchor in block['anchors']:
+      in_block[anchor[2:]] = (block_id, block['orientation'])
+
+  for seqid_a, seqid_b in sorted(anchors.keys()):
+    for rank_a, rank_b, name_a, name_b in anchors[(seqid_a, seqid_b)]:
+      block_id, orientation = in_block.get((name_a, name_b), ('', ''))
+      out_file.write('\t'.join([str(v) for v in (
+        seqid_a, positions['a'][name_a][2], positions['a'][name_a][3], name_a,
+        seqid_b, positions['b'][name_b][2], positions['b'][name_b][3], name_b,
+        block_id, orientation,
+      )]) + '\n')
+
+def find_synteny(ortho_groups, positions, mappings, max_gap, min_anchors, max_members):
+  '''
+  Return (anchors, blocks, insertions), with blocks sorted by position in A.
+  '''
+  anchors = find_anchors(ortho_groups, mappings, positions, max_members)
+  blocks = find_blocks(anchors, max_gap, min_anchors)
+  insertions = classify_blocks(blocks, max_gap)
+  blocks.sort(key = lambda b: (b['seqid_a'], b['first_a'], b['seqid_b'], b['first_b']))
+  return (anchors, blocks, insertions)
+
+def main():
+  parser = argparse.ArgumentParser(description='Find and classify blocks of collinear orthologs.')
+  parser.add_argument('name_map_a',   help='Name mapping JSON file for first genome')
+  parser.add_argument('name_map_b',   help='Name mapping JSON file for second genome')
+  parser.add_argument('annotation_a', help='Annotation GFF3 file for first genome')
+  parser.add_argument('annotation_b', help='Annotation GFF3 file for second genome')
+  parser.add_argument('-d', '--output-dir', dest='output_dir', action='store', default='.',
+    help='Directory in which to write results')
+  parser.add_argument('--max-gap', dest='max_gap', type=int, default=20,
+    help='Greatest distance in genes between consecutive anchors in a block')
+  parser.add_argument('--min-anchors', dest='min_anchors', type=int, default=3,
+    help='Fewest anchors in a block')
+  parser.add_argument('--max-members', dest='max_members', type=int, default=5,
+    help='Most members in either genome of a group used for anchors')
+  parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+    help='Directory in which to cache transcripts parsed from annotation files')
+  args = parser.parse_args()
+
+  tm = examine_transcript_groups.TranscriptManager(cache_dir=args.cache_dir)
+  mappings = {}
+  positions = {}
+  for gname, name_map, annotation in (('a', args.name_map_a, args.annotation_a), ('b', args.name_map_b, args.annotation_b)):
+    with open(name_map) as f:
+      mappings[gname] = json.load(f)
+    tm.parse(annotation, mappings[gname], gname)
+    positions[gname] = rank_transcripts(tm, gname)
+  tm.close()
+
+  start_time = time.time()
+  ortho_groups = list(inparanoid_groups.iter_groups(sys.stdin))
+  anchors, blocks, insertions = find_synteny(ortho_groups, positions, mappings, args.max_gap, args.min_anchors, args.max_members)
+
+  class_counts = {}
+  for block in blocks:
+    class_counts[block['class']] = class_counts.get(block['class'], 0) + 1
+  sys.stderr.write('Chained %s anchors into %s blocks (%s) with %s insertions in %.2f s\n' % (
+    sum([len(b['anchors']) for b in blocks]),
+    len(blocks),
+    ', '.join(['%s %s' % (class_counts[c], c) for c in sorted(class_counts.keys())]),
+    len(insertions),
+    time.time() - start_time,
+  ))
+
+  with open(os.path.join(args.output_dir, 'synteny-blocks'), 'w') as out_file:
+    write_blocks(blocks, positions, out_file)
+  with open(os.path.join(args.output_dir, 'synteny-insertions'), 'w') as out_file:
+    write_insertions(insertions, out_file)
+  with open(os.path.join(args.output_dir, 'synteny-anchors'), 'w') as out_file:
+    write_anchors(anchors, blocks, positions, out_file)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,117 @@
+'''
+Check cluster_orthologs.py against small hit tables written in the format of
+blast_parser.pl.
+
+Usage: python -m unittest test_cluster_orthologs
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cluster_orthologs
+
+FASTAS = {'a': 'a.fa', 'b': 'b.fa', 'c': 'c.fa'}
+
+def hit(query, db, score, query_len=100, hit_len=100, area=None, segments=None):
+  '''
+  Return hit table row, with the alignment covering all of both sequences
+  unless `area` or `segments` give (query, hit) lengths.
+  '''
+  area = area or (query_len, hit_len)
+  segments = segments or area
+  return (query, db, score, query_len, hit_len, area[0], area[1], segments[0], segments[1])
+
+class ClusterTest(unittest.TestCase):
+  def setUp(self):
+    self.hits_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.hits_dir)
+
+  def hit_tables(self, hits, outgroup=False):
+    '''
+    Return HitTables for `hits`, which maps pairs of genomes such as "ab" to
+    rows from hit(). Pairs absent from `hits` have no hits.
+    '''
+    pairs = ['aa', 'ab', 'ba', 'bb'] + (outgroup and ['ac', 'bc'] or [])
+    for pair in pairs:
+      fname = os.path.join(self.hits_dir, '%s-%s' % (FASTAS[pair[0]], FASTAS[pair[1]]))
+      with open(fname, 'w') as hits_file:
+        for row in hits.get(pair, []):
+          hits_file.write('\t'.join([str(f) for f in row]) + '\n')
+    return cluster_orthologs.HitTables(self.hits_dir, FASTAS['a'], FASTAS['b'], outgroup and FASTAS['c'] or None)
+
+  def seed_hits(self):
+    # a1 and b1 are each other's best hits, scoring 500 in both directions,
+    # and their hits against themselves 1000.
+    return {
+      'aa': [hit('a1', 'a1', 1000)],
+      'ab': [hit('a1', 'b1', 500)],
+      'ba': [hit('b1', 'a1', 500)],
+      'bb': [hit('b1', 'b1', 1000)],
+    }
+
+  def test_filter(self):
+    tables = self.hit_tables({'ab': [
+      # Match area 60% and segments 30% of the longer query: retained.
+      hit('q1', 'h1', 100, 100, 80, area=(60, 60), segments=(30, 30)),
+      # Match area below the 50% coverage cutoff.
+      hit('q2', 'h1', 100, 100, 80, area=(45, 45), segments=(45, 45)),
+      # Segments below the 25% segment coverage.
+      hit('q3', 'h1', 100, 100, 80, area=(90, 80), segments=(20, 20)),
+      # Below the score cutoff.
+      hit('q4', 'h1', 30),
+      # Covers all of the query, but too little of the longer hit.
+      hit('q5', 'h2', 100, 50, 200, area=(50, 60), segments=(50, 60)),
+    ]})
+    params = cluster_orthologs.DEFAULT_PARAMS
+    filtered = tables.filtered(params)['ab']
+    self.assertEqual([tables.names['a'].name(q) for q in filtered.query.tolist()], ['q1'])
+
+    loose = dict(params, coverage_cutoff=0.4, segment_coverage=0.1, score_cutoff=0)
+    filtered = tables.filtered(loose)['ab']
+    self.assertEqual(sorted([tables.names['a'].name(q) for q in filtered.query.tolist()]), ['q1', 'q2', 'q3', 'q4'])
+
+  def test_seeds(self):
+    hits = self.seed_hits()
+    hits['ab'] = [hit('a1', 'b1', 300), hit('a2', 'b1', 150), hit('a2', 'b2', 200), hit('a3', 'b3', 100)]
+    # b1's best hit is a1, so a2 and b1 are not reciprocal best hits, and
+    # b3's best hit is not a3.
+    hits['ba'] = [hit('b1', 'a1', 310), hit('b1', 'a2', 140), hit('b2', 'a2', 190), hit('b3', 'a1', 120), hit('b3', 'a3', 100)]
+    tables = self.hit_tables(hits)
+    names = tables.names
+    seeds = [(score, names['a'].name(a), names['b'].name(b)) for score, a, b in tables.seeds(cluster_orthologs.DEFAULT_PARAMS)]
+    self.assertEqual(seeds, [(305.0, 'a1', 'b1'), (195.0, 'a2', 'b2')])
+
+  def test_inparalogs(self):
+    hits = self.seed_hits()
+    # a2 scores 600 against a1, giving confidence (600 - 500) / (1000 - 500).
+    # a3 scores 510, giving confidence 0.02, below the cutoff of 0.05, and a4
+    # scores below the seeds' 500.
+    hits['aa'] += [hit('a1', 'a2', 600), hit('a1', 'a3', 510), hit('a1', 'a4', 400)]
+    groups = cluster_orthologs.cluster(self.hit_tables(hits))
+    self.assertEqual(len(groups), 1)
+    self.assertEqual([n for n, c in groups[0]['a']], ['a1', 'a2'])
+    self.assertAlmostEqual(groups[0]['a'][1][1], 0.2)
+    self.assertEqual(groups[0]['b'], [['b1', 1.0]])
+
+    groups = cluster_orthologs.cluster(self.hit_tables(hits), {'conf_cutoff': 0.01})
+    self.assertEqual([n for n, c in groups[0]['a']], ['a1', 'a2', 'a3'])
+
+  def test_outgroup(self):
+    hits = self.seed_hits()
+    hits['aa'] += [hit('a1', 'a2', 600), hit('a1', 'a3', 700)]
+    hits['ab'] += [hit('a2', 'b1', 300), hit('a3', 'b1', 300)]
+    # a2 is closer to the outgroup than to b1, and so is discarded.
+    hits['ac'] = [hit('a2', 'c1', 400), hit('a3', 'c1', 200)]
+    hits['bc'] = [hit('b1', 'c1', 200)]
+    groups = cluster_orthologs.cluster(self.hit_tables(hits, outgroup=True))
+    self.assertEqual([n for n, c in groups[0]['a']], ['a1', 'a3'])
+
+    groups = cluster_orthologs.cluster(self.hit_tables(hits))
+    self.assertEqual([n for n, c in groups[0]['a']], ['a1', 'a3', 'a2'])
+
+if __name__ == '__main__':
+  unittest.main()
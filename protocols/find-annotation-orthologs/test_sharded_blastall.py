@@ -0,0 +1,84 @@
+'''
+Check that sharded_blastall.py reproduces the output of a single blastall
+run, using the stand-in blastall in testdata.
+
+Usage: python -m unittest test_sharded_blastall
+'''
+
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import sharded_blastall
+
+STUB_BLASTALL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata', 'stub_blastall')
+RESIDUES = 'ACDEFGHIKLMNPQRSTVWY'
+
+def write_fasta(fname, records):
+  with open(fname, 'w') as f:
+    for header, seq in records:
+      f.write('>%s\n%s\n' % (header, seq))
+
+class ShardedBlastallTest(unittest.TestCase):
+  def setUp(self):
+    self.tmp_dir = tempfile.mkdtemp()
+    rng = random.Random(1)
+    def random_seqs(prefix, count):
+      return [('%s%s' % (prefix, i), ''.join([rng.choice(RESIDUES[:4]) for j in range(rng.randint(20, 300))]))
+        for i in range(count)]
+    self.db_fname = os.path.join(self.tmp_dir, 'db.fa')
+    write_fasta(self.db_fname, random_seqs('db', 30))
+    self.query_fname = os.path.join(self.tmp_dir, 'query.fa')
+    write_fasta(self.query_fname, random_seqs('query', 40))
+    self.orig_dir = os.getcwd()
+    # Shard directories are created in the working directory.
+    os.chdir(self.tmp_dir)
+
+  def tearDown(self):
+    os.chdir(self.orig_dir)
+    shutil.rmtree(self.tmp_dir)
+
+  def run_both(self, query_fname, fmt):
+    '''
+    Return (unsharded output, {workers: sharded output}).
+    '''
+    args = ['-p', 'blastp', '-d', self.db_fname, '-m', fmt]
+    expected_fname = os.path.join(self.tmp_dir, 'expected')
+    subprocess.check_call([STUB_BLASTALL, '-i', query_fname, '-o', expected_fname] + args)
+    with open(expected_fname) as f:
+      expected = f.read()
+
+    sharded = {}
+    for workers in (1, 3, 7):
+      out_fname = os.path.join(self.tmp_dir, 'sharded.%s' % workers)
+      sharded_blastall.run_sharded(workers, STUB_BLASTALL, ['-i', query_fname, '-o', out_fname, '-a', '8'] + args)
+      with open(out_fname) as f:
+        sharded[workers] = f.read()
+    return (expected, sharded)
+
+  def test_xml(self):
+    expected, sharded = self.run_both(self.query_fname, '7')
+    # Shards are only renumbered if they begin past the first iteration.
+    self.assertIn('<Iteration_iter-num>40</Iteration_iter-num>', expected)
+    self.assertIn('<Iteration_query-ID>lcl|40_0</Iteration_query-ID>', expected)
+    for workers, output in sharded.items():
+      self.assertEqual(output, expected, 'Output differs with %s workers' % workers)
+
+  def test_table(self):
+    expected, sharded = self.run_both(self.query_fname, '8')
+    for workers, output in sharded.items():
+      self.assertEqual(output, expected, 'Output differs with %s workers' % workers)
+
+  def test_no_queries(self):
+    empty_fname = os.path.join(self.tmp_dir, 'empty.fa')
+    write_fasta(empty_fname, [])
+    expected, sharded = self.run_both(empty_fname, '7')
+    self.assertNotIn('<Iteration>', expected)
+    for workers, output in sharded.items():
+      self.assertEqual(output, expected, 'Output differs with %s workers' % workers)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,89 @@
+'''
+Check synteny.py against the rearrangements drawn by
+create-example-syntenic-plots.py.
+
+Usage: python -m unittest test_synteny
+'''
+
+import unittest
+
+import synteny
+
+# Rank in B of the ortholog of each gene in A, as plotted by
+# create-example-syntenic-plots.py. Its translocation is plotted with axes
+# swapped, and so is given here as the rank in A of each gene in B.
+NORMAL = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+INVERSION = [1, 2, 3, 8, 7, 6, 5, 4, 9, 10]
+INSERTION = [(b < 5 and b) or (b + 5) for b in range(1, 11)]
+TRANSLOCATION = [1, 2, 3, 5, 6, 7, 8, 9, 4, 10]
+
+def scale(ranks, factor):
+  '''
+  Replace each gene by `factor` consecutive genes, reversed where ranks
+  descend, so that each rearrangement spans several anchors.
+  '''
+  scaled = []
+  for i, rank in enumerate(ranks):
+    descending = (i > 0 and ranks[i - 1] == rank + 1) or (i + 1 < len(ranks) and ranks[i + 1] == rank - 1)
+    offsets = range(factor)
+    if descending:
+      offsets = reversed(offsets)
+    scaled.extend([(rank - 1) * factor + o + 1 for o in offsets])
+  return scaled
+
+def run_synteny(ranks_b, max_gap, min_anchors=3, ranks_a=None):
+  '''
+  Return (blocks, insertions) for orthologs at `ranks_a` in A, defaulting to
+  consecutive ranks, and `ranks_b` in B, all on a single scaffold.
+  '''
+  ranks_a = ranks_a or list(range(1, len(ranks_b) + 1))
+  positions = {'a': {}, 'b': {}}
+  groups = []
+  for i, (rank_a, rank_b) in enumerate(zip(ranks_a, ranks_b)):
+    name_a, name_b = 'a%s' % i, 'b%s' % i
+    positions['a'][name_a] = ('scaf_a', rank_a, rank_a * 1000, rank_a * 1000 + 500)
+    positions['b'][name_b] = ('scaf_b', rank_b, rank_b * 1000, rank_b * 1000 + 500)
+    groups.append({'a': [[name_a, 1.0]], 'b': [[name_b, 1.0]]})
+  mappings = dict([(g, dict([(n, n) for n in positions[g]])) for g in ('a', 'b')])
+  anchors, blocks, insertions = synteny.find_synteny(groups, positions, mappings, max_gap, min_anchors, 5)
+  return (blocks, insertions)
+
+def classes(blocks):
+  return sorted([(b['class'], b['orientation'], len(b['anchors'])) for b in blocks])
+
+class ExamplePatternsTest(unittest.TestCase):
+  def test_normal(self):
+    for max_gap in (3, 20):
+      blocks, insertions = run_synteny(NORMAL, max_gap)
+      self.assertEqual(classes(blocks), [('collinear', '+', 10)])
+      self.assertEqual(insertions, [])
+
+  def test_inversion(self):
+    # A forward chain may step diagonally across the inverted genes and take
+    # one of them, which must not cost the inversion its block.
+    for max_gap in (3, 20):
+      blocks, insertions = run_synteny(INVERSION, max_gap)
+      self.assertEqual(classes(blocks), [('collinear', '+', 6), ('inversion', '-', 4)])
+
+  def test_scaled_inversion(self):
+    blocks, insertions = run_synteny(scale(INVERSION, 4), 20)
+    self.assertEqual([(c, o) for c, o, n in classes(blocks)], [('collinear', '+'), ('inversion', '-')])
+    self.assertEqual(insertions, [])
+
+  def test_insertion(self):
+    blocks, insertions = run_synteny(INSERTION, 3)
+    self.assertEqual(classes(blocks), [('collinear', '+', 4), ('collinear', '+', 6)])
+    self.assertEqual([(i['genome'], i['after_a'], i['extra']) for i in insertions], [('b', 4, 5)])
+
+  def test_translocation(self):
+    ranks_a = scale(TRANSLOCATION, 3)
+    blocks, insertions = run_synteny(list(range(1, len(ranks_a) + 1)), 2, ranks_a=ranks_a)
+    self.assertEqual(classes(blocks), [
+      ('collinear', '+', 3),
+      ('collinear', '+', 9),
+      ('collinear', '+', 15),
+      ('translocation', '+', 3),
+    ])
+
+if __name__ == '__main__':
+  unittest.main()